@@ -15,7 +15,8 @@ from django.contrib import admin
 import datetime
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
-from .models import Service, Client, DayOff, Appointment, StaffMember, Config, User, MedicalRecord
+from .models import Service, Client, DayOff, Appointment, StaffMember, Config, User, MedicalRecord, EndpointMetric, \
+    AppointmentSeries, OutgoingEmail, Task
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
@@ -111,6 +112,12 @@ class AppointmentAdmin(admin.ModelAdmin):
     get_service_duration.short_description = 'Service Duration'
 
 
+@admin.register(AppointmentSeries)
+class AppointmentSeriesAdmin(admin.ModelAdmin):
+    list_display = ('id', 'client', 'staff_member', 'service', 'rule', 'start_date', 'start_time')
+    list_filter = ('staff_member', 'service')
+
+
 
 @admin.register(Config)
 class ConfigAdmin(admin.ModelAdmin):
@@ -191,7 +198,32 @@ class WorkingHoursAdmin(admin.ModelAdmin):
     search_fields = ('staff_member__user__first_name', 'staff_member__user__last_name')
 
 
+@admin.register(EndpointMetric)
+class EndpointMetricAdmin(admin.ModelAdmin):
+    list_display = ('url_name', 'requests', 'mean_ms', 'max_ms', 'mean_queries', 'max_queries', 'updated_at')
+    search_fields = ('url_name',)
+    readonly_fields = [f.name for f in EndpointMetric._meta.fields]
+
+    @admin.display(description='mean ms')
+    def mean_ms(self, obj):
+        return round(obj.get_mean_ms(), 2)
+
+    @admin.display(description='mean queries')
+    def mean_queries(self, obj):
+        return round(obj.get_mean_queries(), 1)
 
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'run_at', 'attempts', 'max_attempts', 'duration_ms', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('locked_by', 'started_at', 'finished_at', 'duration_ms', 'created_at')
 
 
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'subject', 'status', 'send_after', 'attempts', 'sent_at')
+    list_filter = ('status', 'template_name')
+    search_fields = ('recipient', 'subject', 'dedup_key')
+    readonly_fields = ('attempts', 'last_error', 'sent_at', 'created_at')
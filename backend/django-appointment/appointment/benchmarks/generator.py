@@ -0,0 +1,139 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import List
+
+from django.contrib.auth.models import Group
+from django.db import transaction
+
+from appointment.core.occupancy import occupy_slots
+from appointment.core.schedule_index import invalidate_schedule_index
+from appointment.models import Appointment, Client, DayOff, Service, StaffMember, User, WorkingHours
+
+
+@dataclass
+class ClinicSpec:
+    """Scale of a synthetic clinic."""
+    staff_count: int = 20
+    service_count: int = 5
+    services_per_staff: int = 3
+    slot_duration: int = 15
+    days: int = 7
+    booking_density: float = 0.5
+    days_off_ratio: float = 0.1
+    client_count: int = 200
+    start_date: date = field(default_factory=lambda: date.today() + timedelta(days=1))
+    seed: int = 42
+
+
+@dataclass
+class Clinic:
+    """Objects created by :func:`generate_clinic`."""
+    spec: ClinicSpec
+    staffs: List[StaffMember]
+    services: List[Service]
+    clients: List[Client]
+    admin: User
+    appointment_count: int = 0
+
+    @property
+    def days(self) -> List[date]:
+        return [self.spec.start_date + timedelta(days=i) for i in range(self.spec.days)]
+
+
+def generate_clinic(spec: ClinicSpec) -> Clinic:
+    """Create a synthetic clinic in the current database.
+
+    Staff members work Monday to Friday (some also on Saturday) with shifted hours. Each working day is walked slot
+    by slot and booked with probability ``booking_density``, with a service the staff member offers. A fraction
+    ``days_off_ratio`` of the staff members gets a day off inside the window. Rows are written with ``bulk_create``.
+
+    :param spec: The clinic scale.
+    :return: The created clinic.
+    """
+    rng = random.Random(spec.seed)
+    with transaction.atomic():
+        admins, _ = Group.objects.get_or_create(name='Admins')
+        admin = User.objects.create_superuser(username='bench_admin', email='admin@bench.local', password='bench')
+        admin.groups.add(admins)
+
+        services = Service.objects.bulk_create([
+            Service(name=f"Bench service {i}", duration=timedelta(minutes=rng.choice([15, 30, 45, 60, 90])),
+                    price=20 + 5 * i)
+            for i in range(spec.service_count)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f"bench_staff_{i}", first_name="Staff", last_name=str(i), email=f"staff{i}@bench.local")
+            for i in range(spec.staff_count)
+        ])
+        staffs = StaffMember.objects.bulk_create([
+            StaffMember(user=user, slot_duration=spec.slot_duration, set_timetable=True) for user in users
+        ])
+        through = StaffMember.services_offered.through
+        through.objects.bulk_create([
+            through(staffmember_id=staff.id, service_id=service.id)
+            for staff in staffs
+            for service in rng.sample(services, k=min(spec.services_per_staff, len(services)))
+        ])
+        offered = {staff.id: [] for staff in staffs}
+        for staff_id, service_id in through.objects.filter(
+                staffmember_id__in=offered).values_list('staffmember_id', 'service_id'):
+            offered[staff_id].append(next(s for s in services if s.id == service_id))
+
+        hours = {}
+        working_hours = []
+        for staff in staffs:
+            start = time(rng.choice([8, 9, 10]), rng.choice([0, 30]))
+            end = time(rng.choice([16, 17, 18, 19]), rng.choice([0, 30]))
+            weekdays = [0, 1, 2, 3, 4] + ([5] if rng.random() < 0.2 else [])
+            hours[staff.id] = {weekday: (start, end) for weekday in weekdays}
+            working_hours.extend(WorkingHours(staff_member=staff, day_of_week=weekday, start_time=start, end_time=end)
+                                 for weekday in weekdays)
+        WorkingHours.objects.bulk_create(working_hours)
+
+        clients = Client.objects.bulk_create([
+            Client(first_name="Client", last_name=str(i), phone_number=f"+3460{i:07d}", email=f"c{i}@bench.local")
+            for i in range(spec.client_count)
+        ])
+
+        window = [spec.start_date + timedelta(days=i) for i in range(spec.days)]
+        days_off = []
+        off_days = {}
+        for staff in rng.sample(staffs, k=int(len(staffs) * spec.days_off_ratio)):
+            day = rng.choice(window)
+            off_days[staff.id] = day
+            days_off.append(DayOff(staff_member=staff, start_date=day, end_date=day, description="Benchmark"))
+        DayOff.objects.bulk_create(days_off)
+        # bulk_create sends no signals
+        invalidate_schedule_index()
+
+        slot_td = timedelta(minutes=spec.slot_duration)
+        appointments = []
+        for staff in staffs:
+            if not offered[staff.id]:
+                continue
+            for day in window:
+                if day.weekday() not in hours[staff.id] or off_days.get(staff.id) == day:
+                    continue
+                start, end = hours[staff.id][day.weekday()]
+                cur = datetime.combine(day, start)
+                end_dt = datetime.combine(day, end)
+                while cur < end_dt:
+                    service = rng.choice(offered[staff.id])
+                    if rng.random() < spec.booking_density and cur + service.duration <= end_dt:
+                        appointments.append(Appointment(
+                            client=rng.choice(clients), service=service, staff_member=staff, date=day,
+                            start_time=cur.time(), end_time=(cur + service.duration).time()))
+                        cur += service.duration
+                    else:
+                        cur += slot_td
+        Appointment.objects.bulk_create(appointments, batch_size=500)
+        occupy_slots(appointments)
+
+    return Clinic(spec=spec, staffs=staffs, services=services, clients=clients, admin=admin,
+                  appointment_count=len(appointments))
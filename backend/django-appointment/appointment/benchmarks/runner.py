@@ -0,0 +1,166 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+import json
+import platform
+import statistics
+import time
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import django
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from appointment.benchmarks.generator import Clinic
+from appointment.core.config_cache import invalidate_cached_config
+from appointment.logger_config import get_logger
+
+_logger = get_logger(__name__)
+
+
+def measure(name: str, fn: Callable[[int], object], repeat: int = 5, setup: Optional[Callable[[], None]] = None) -> dict:
+    """Run ``fn`` ``repeat`` times and record its wall time and SQL queries.
+
+    :param name: Name of the scenario.
+    :param fn: The function to measure, called with the run index.
+    :param repeat: Number of runs.
+    :param setup: Optional function called before each run, outside the measurement (e.g. to clear caches).
+    :return: A dict with the timings in milliseconds and the query counts.
+    """
+    times, queries, sql_times = [], [], []
+    for run in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            fn(run)
+            times.append((time.perf_counter() - start) * 1000)
+        queries.append(len(ctx.captured_queries))
+        sql_times.append(sum(float(q['time']) for q in ctx.captured_queries) * 1000)
+    return {
+        "name": name,
+        "runs": repeat,
+        "min_ms": round(min(times), 3),
+        "mean_ms": round(statistics.mean(times), 3),
+        "max_ms": round(max(times), 3),
+        "queries": max(queries),
+        "sql_ms": round(statistics.mean(sql_times), 3),
+    }
+
+
+def _clear_caches():
+    cache.clear()
+    invalidate_cached_config()
+
+
+def run_benchmarks(clinic: Clinic, repeat: int = 5) -> List[dict]:
+    """Run every scenario against a generated clinic.
+
+    A scenario that raises is reported with an ``error`` entry instead of stopping the run.
+
+    :param clinic: The clinic created by :func:`appointment.benchmarks.generator.generate_clinic`.
+    :param repeat: Number of runs per scenario.
+    :return: One result dict per scenario.
+    """
+    from appointment.core.api_helpers import (create_appointment_safe, get_availability_for_service_across_staffs,
+                                              get_available_slots_for_service)
+
+    day = next(d for d in clinic.days if d.weekday() < 5)
+    service = clinic.services[0]
+    staff = clinic.staffs[0]
+    factory = RequestFactory()
+
+    def availability_across_staffs(run):
+        get_availability_for_service_across_staffs(service.name, day)
+
+    def available_slots_for_service(run):
+        get_available_slots_for_service(staff, day, service)
+
+    bookings = []
+
+    def prepare_booking():
+        _clear_caches()
+        availability = get_availability_for_service_across_staffs(service.name, day)
+        by_username = {s.user.username: s for s in service.staff_members.select_related('user')}
+        for username, slots in availability.items():
+            if slots:
+                bookings.append((by_username[username], datetime.fromisoformat(slots[0])))
+                return
+        bookings.append(None)
+
+    def book(run):
+        booking = bookings[-1]
+        if booking is None:
+            return
+        booking_staff, start = booking
+        create_appointment_safe(clinic.clients[run % len(clinic.clients)], service, booking_staff, start.date(),
+                                start.time(), (start + service.duration).time())
+
+    def list_appointments(run):
+        from appointment.web_api.views.views import list_appointments as view
+        request = factory.get("/v1/api/appointments/")
+        request.user = clinic.admin
+        view(request)
+
+    def list_staff(run):
+        from appointment.web_api.views.views import new_staff as view
+        request = factory.get("/v1/api/staffs/")
+        request.user = clinic.admin
+        view(request)
+
+    scenarios = [
+        ("availability_across_staffs.cold", availability_across_staffs, _clear_caches),
+        ("availability_across_staffs.warm", availability_across_staffs, None),
+        ("available_slots_for_service.cold", available_slots_for_service, _clear_caches),
+        ("create_appointment_safe", book, prepare_booking),
+        ("list_appointments", list_appointments, None),
+        ("list_staff", list_staff, None),
+    ]
+
+    results = []
+    for name, fn, setup in scenarios:
+        _logger.info(f"Running benchmark {name}")
+        try:
+            results.append(measure(name, fn, repeat, setup))
+        except Exception as e:
+            _logger.error(f"Benchmark {name} failed: {e}")
+            results.append({"name": name, "error": str(e)})
+    return results
+
+
+def build_report(clinic: Clinic, results: List[dict]) -> dict:
+    spec = asdict(clinic.spec)
+    spec['start_date'] = str(spec['start_date'])
+    return {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "clinic": {**spec, "appointments": clinic.appointment_count},
+        "results": results,
+    }
+
+
+def write_report(report: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2)
+
+
+def compare_reports(baseline: dict, current: dict) -> List[str]:
+    """Return one line per scenario comparing ``current`` against ``baseline``."""
+    previous: Dict[str, dict] = {r['name']: r for r in baseline.get('results', []) if 'error' not in r}
+    lines = []
+    for result in current['results']:
+        before = previous.get(result['name'])
+        if 'error' in result or not before:
+            continue
+        ratio = result['mean_ms'] / before['mean_ms'] if before['mean_ms'] else float('inf')
+        lines.append(f"{result['name']:<36} {before['mean_ms']:>10.2f}ms -> {result['mean_ms']:>10.2f}ms "
+                     f"({ratio:5.2f}x)  queries {before['queries']} -> {result['queries']}")
+    return lines
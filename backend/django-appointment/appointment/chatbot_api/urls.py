@@ -1,5 +1,6 @@
 from django.urls import path
-from .views.availability import api_get_availability
+from .views.availability import api_get_availability, api_get_availability_range, \
+    api_get_availability_services
 from .views.appointments import appointment, delete_appointment
 from .views.clients import get_clients, register_new_client, client_detail, get_client_appointments
 from .views.services import list_services, get_services_names, list_some_services_info
@@ -11,6 +12,8 @@ urlpatterns = [
     path('services/names/', get_services_names, name='get_services_name'),
     path('services/info/', list_some_services_info, name='list_some_services_info'),
 
+    path('availability/range/', api_get_availability_range, name='api_get_availability_range'),
+    path('availability/services/', api_get_availability_services, name='api_get_availability_services'),
     path('availability/<str:date_str>/<str:service_name>/', api_get_availability, name='api_get_free_slots'),
 
     path('appointments/', appointment, name='create_modify_appointment'),
@@ -24,8 +24,7 @@ from django.views.decorators.csrf import csrf_exempt
 
 from appointment.core.date_time import combine_date_and_time, convert_str_to_date, convert_str_to_time
 from appointment.models import Client, Service, Appointment
-from appointment.core.db_helpers import get_staffs_assigned_to_service
-from appointment.core.api_helpers import get_available_slots_for_service, create_appointment_safe, validate_appointment_wont_overlap
+from appointment.core.api_helpers import find_available_staff, create_appointment_safe, validate_appointment_wont_overlap
 from appointment.core.decorators import require_api_key
 from appointment.logger_config import get_logger
 from django.shortcuts import get_object_or_404
@@ -35,29 +34,30 @@ _logger = get_logger(__name__)
 # -------------------------------------------------------------------
 # AUXILIARIES
 # -------------------------------------------------------------------
-def _find_available_staff(service_name, date, service):
-    staffs = get_staffs_assigned_to_service(service_name)
-    for s in staffs:
-        slots = get_available_slots_for_service(s, date, service)
-        # combinamos date + start_time
-        for dt in slots:
-            if dt.date() == date:
-                return s
-    return None
-
-def _create_appointment(client, service, staff, date, start_time):
+def _find_available_staff(service, date, start_time, exclude_appointment_id=None, prefer_staff_id=None):
+    staffs = service.assigned_staff.select_related('user')
+    return find_available_staff(staffs, date, start_time, service, exclude_appointment_id=exclude_appointment_id,
+                                prefer_staff_id=prefer_staff_id)
+
+def _parse_flag(value) -> bool:
+    # JSON booleans as well as the strings a chatbot may send: "false" or "0" must not read as True.
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _create_appointment(client, service, staff, date, start_time, want_reminder=False):
     start_dt = combine_date_and_time(date, start_time)
     end_dt = start_dt + service.duration
     end_time = end_dt.time()
-    return create_appointment_safe(client, service, staff, date, start_time, end_time)
+    return create_appointment_safe(client, service, staff, date, start_time, end_time, want_reminder=want_reminder)
 
 def _update_appointment(old_appt, new_date, new_start_time, service):
     new_start_dt = combine_date_and_time(new_date, new_start_time)
     new_end_dt = new_start_dt + service.duration
     new_end_time = new_end_dt.time()
 
-    # Buscar staff disponible
-    chosen_staff = _find_available_staff(service.name, new_date, service)
+    # Buscar staff disponible (se mantiene el actual si puede)
+    chosen_staff = _find_available_staff(service, new_date, new_start_time,
+                                         exclude_appointment_id=old_appt.id,
+                                         prefer_staff_id=old_appt.staff_member_id)
     if not chosen_staff:
         raise ValueError("No staff available for the new date/time")
 
@@ -106,11 +106,12 @@ def appointment(request):
 
     if request.method == 'POST':
         # CREATION
-        staff = _find_available_staff(service_name, date, service)
+        staff = _find_available_staff(service, date, start_time)
         if not staff:
             return JsonResponse({"error": "No staff available for this date/time"}, status=404)
         try:
-            appt = _create_appointment(client, service, staff, date, start_time)
+            appt = _create_appointment(client, service, staff, date, start_time,
+                                       want_reminder=_parse_flag(data.get('want_reminder', False)))
         except ValueError as e:
             return JsonResponse({"error booking appointment" : str(e)}, status=400)
 
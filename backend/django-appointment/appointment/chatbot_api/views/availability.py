@@ -6,7 +6,12 @@ from django.views.decorators.csrf import csrf_exempt
 
 from appointment.logger_config import get_logger
 from appointment.core.date_time import convert_str_to_date
-from appointment.core.api_helpers import get_availability_for_service_across_staffs
+from appointment.core.api_helpers import get_availability_for_service_across_staffs, \
+    get_available_slots_for_staffs_in_range, get_available_slots_for_services_in_range
+from appointment.models import Service, StaffMember
+from django.db.models import Q
+from appointment.settings import APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS
+from datetime import timedelta
 
 """
 Author: Miquel Barón Marco
@@ -47,3 +52,153 @@ def api_get_availability(request, date_str, service_name):
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+
+
+@csrf_exempt
+@require_api_key
+def api_get_availability_range(request):
+    """
+    GET /availability/range/?service=<name>&start_date=<YYYY-MM-DD>&end_date=<YYYY-MM-DD>
+    GET /availability/range/?service=<name>&start_date=<YYYY-MM-DD>&days=<n>&staff=<username>&first=<n>
+
+    Returns the free slots per day and per staff member over a window of days. With ``first`` only the earliest
+    ``n`` slots of the window are returned, as a chronological list.
+
+    :param request:
+    :return:
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    service_name = request.GET.get('service')
+    start_str = request.GET.get('start_date')
+    if not service_name:
+        return JsonResponse({"error": "Missing service name"}, status=400)
+    if not start_str:
+        return JsonResponse({"error": "Missing start_date"}, status=400)
+
+    try:
+        start_date = convert_str_to_date(start_str)
+        if request.GET.get('end_date'):
+            end_date = convert_str_to_date(request.GET['end_date'])
+        else:
+            end_date = start_date + timedelta(days=int(request.GET.get('days', 7)) - 1)
+        first = int(request.GET['first']) if request.GET.get('first') else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if end_date < start_date:
+        return JsonResponse({"error": "end_date must not be before start_date"}, status=400)
+    if (end_date - start_date).days >= APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS:
+        return JsonResponse({"error": f"Range cannot exceed {APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS} days"},
+                            status=400)
+    if first is not None and first <= 0:
+        return JsonResponse({"error": "first must be a positive number"}, status=400)
+
+    service = Service.get_service_by_name(service_name)
+    if not service:
+        return JsonResponse({"error": "Service not found"}, status=404)
+
+    staffs = service.staff_members.select_related('user')
+    staff_username = request.GET.get('staff')
+    if staff_username:
+        staffs = staffs.filter(user__username=staff_username)
+    staffs = list(staffs)
+    usernames = {staff.id: staff.user.username for staff in staffs}
+
+    try:
+        slots = get_available_slots_for_staffs_in_range(staffs, start_date, end_date, service, limit=first)
+    except Exception as e:
+        _logger.error(f"Error computing availability range: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if first is not None:
+        earliest = sorted((slot, usernames[staff_id]) for day_slots in slots.values()
+                          for staff_id, staff_slots in day_slots.items() for slot in staff_slots)
+        return JsonResponse({'slots': [{"staff": username, "slot": slot.isoformat(sep=' ')}
+                                       for slot, username in earliest]})
+
+    availability = {
+        str(day): {usernames[staff_id]: [s.isoformat(sep=' ') for s in staff_slots]
+                   for staff_id, staff_slots in day_slots.items()}
+        for day, day_slots in slots.items()
+    }
+    return JsonResponse({'availability': availability})
+
+
+
+@csrf_exempt
+@require_api_key
+def api_get_availability_services(request):
+    """
+    GET /availability/services/?services=<name>,<name>&date=<YYYY-MM-DD>
+    GET /availability/services/?services=<name>,<name>&start_date=<YYYY-MM-DD>&end_date=<YYYY-MM-DD>&staff=<username>
+
+    Returns the free slots of several services at once, per service, day and staff member. ``services`` may also be
+    repeated instead of comma separated, and ``days`` may replace ``end_date`` as in ``/availability/range/``. The
+    staff members of all the services are loaded once, so asking for two treatments costs about as much as one.
+
+    :param request:
+    :return:
+    """
+    if request.method != 'GET':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    names = list(dict.fromkeys(name.strip() for value in request.GET.getlist('services')
+                               for name in value.split(',') if name.strip()))
+    start_str = request.GET.get('start_date') or request.GET.get('date')
+    if not names:
+        return JsonResponse({"error": "Missing service names"}, status=400)
+    if not start_str:
+        return JsonResponse({"error": "Missing date"}, status=400)
+
+    try:
+        start_date = convert_str_to_date(start_str)
+        if request.GET.get('end_date'):
+            end_date = convert_str_to_date(request.GET['end_date'])
+        else:
+            end_date = start_date + timedelta(days=int(request.GET.get('days', 1)) - 1)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if end_date < start_date:
+        return JsonResponse({"error": "end_date must not be before start_date"}, status=400)
+    if (end_date - start_date).days >= APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS:
+        return JsonResponse({"error": f"Range cannot exceed {APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS} days"},
+                            status=400)
+
+    query = Q()
+    for name in names:
+        query |= Q(name__iexact=name)
+    services = {service.name.lower(): service for service in Service.objects.filter(query)}
+    unknown = [name for name in names if name.lower() not in services]
+    if unknown:
+        return JsonResponse({"error": f"Service not found: {', '.join(unknown)}"}, status=404)
+    services = [services[name.lower()] for name in names]
+
+    staff = None
+    staff_username = request.GET.get('staff')
+    if staff_username:
+        staff = StaffMember.objects.filter(user__username=staff_username).first()
+        if staff is None:
+            return JsonResponse({"error": "Staff member not found"}, status=404)
+
+    try:
+        slots = get_available_slots_for_services_in_range(services, start_date, end_date, staff=staff)
+    except Exception as e:
+        _logger.error(f"Error computing availability for services: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+    staff_ids = {staff_id for service in services for day_slots in slots[service.id].values()
+                 for staff_id in day_slots}
+    usernames = dict(StaffMember.objects.filter(id__in=staff_ids).values_list('id', 'user__username'))
+
+    availability = {
+        service.name: {
+            str(day): {usernames[staff_id]: [s.isoformat(sep=' ') for s in staff_slots]
+                       for staff_id, staff_slots in day_slots.items()}
+            for day, day_slots in slots[service.id].items()
+        }
+        for service in services
+    }
+    return JsonResponse({'availability': availability})
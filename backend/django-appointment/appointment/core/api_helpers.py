@@ -6,12 +6,19 @@ Since: 1.0.0
 
 from django.http import JsonResponse
 
+from collections import defaultdict
+
 # Importa tus modelos reales
-from appointment.models import Appointment, WorkingHours, StaffMember, Service, Client
-from django.db import transaction
+from appointment.models import Appointment, WorkingHours, StaffMember, Service, Client, DayOff
+from django.db import IntegrityError, connection, transaction
 from django.core.exceptions import ValidationError
 
 from .availability import *
+from .availability_bitmap import NUMPY_AVAILABLE, compute_valid_starts_bitmap
+from .availability_sql import SUPPORTED_VENDORS, compute_valid_starts_sql
+from .availability_cache import get_cached_availability, set_cached_availability
+from .occupancy import SlotUnavailableError
+from appointment.settings import APPOINTMENT_AVAILABILITY_ENGINE
 from appointment.core.date_time import combine_date_and_time
 from appointment.logger_config import get_logger
 
@@ -21,44 +28,275 @@ _logger = get_logger(__name__)
 
 def get_available_slots_for_service(staff: StaffMember, day: datetime.date, service,
                                     appointments_of_day: Optional[Iterable[Appointment]] = None) -> List[datetime]:
-    base_slots = generate_base_slots_for_day(staff, day)
-    if not base_slots:
-        return []
-
-    slot_td = timedelta(minutes=staff.get_slot_duration())
     if appointments_of_day is None:
-        appointments_of_day = Appointment.objects.filter(staff_member=staff, date=day)
+        return get_available_slots_for_staffs([staff], day, service)[staff.id]
+
+    schedule = StaffSchedule.build(staff, day, day)
+    booked = [(a.start_time, a.end_time) for a in appointments_of_day]
+    valid_slots = compute_valid_starts_for_schedule(schedule, day, service.duration, booked)
+    return apply_same_day_rules(day, valid_slots, schedule.buffer_minutes)
+
+
+def get_available_slots_for_staffs(staffs: Iterable[StaffMember], day: datetime.date,
+                                   service) -> dict[int, List[datetime]]:
+    """Batched version of :func:`get_available_slots_for_service` for many staff members.
+
+    Staff schedules (see :class:`StaffSchedule`) and appointments are loaded for every staff member at once, so the
+    number of queries does not depend on the number of staff members.
+
+    :param staffs: The staff members to compute.
+    :param day: The day to compute.
+    :param service: The service to book.
+    :return: Dict mapping each staff member's id to its available slots.
+    """
+    return get_available_slots_for_staffs_in_range(staffs, day, day, service)[day]
+
+
+class _StaffWindow:
+    """Schedules and appointments of some staff members over a window of days, each loaded at most once.
+
+    Shared by the services of :func:`get_available_slots_for_services_in_range`, so that a staff member offering
+    several of them is only loaded once.
+    """
+
+    def __init__(self, staffs: Iterable[StaffMember], start_date: date, end_date: date):
+        self.staffs = {staff.id: staff for staff in staffs}
+        self.start_date = start_date
+        self.end_date = end_date
+        self._schedules: dict[int, StaffSchedule] = {}
+        self._booked: Optional[dict[Tuple[int, date], List[Tuple[time, time]]]] = None
+
+    def schedules(self, staff_ids: Iterable[int]) -> dict[int, StaffSchedule]:
+        """Return the schedules of ``staff_ids``, building the ones not built yet."""
+        staff_ids = list(staff_ids)
+        new = [self.staffs[staff_id] for staff_id in staff_ids if staff_id not in self._schedules]
+        if new:
+            self._schedules.update(StaffSchedule.build_many(new, self.start_date, self.end_date))
+        return {staff_id: self._schedules[staff_id] for staff_id in staff_ids}
+
+    def booked(self) -> dict[Tuple[int, date], List[Tuple[time, time]]]:
+        """Return the appointments of the window by (staff id, day), with one query for every staff member."""
+        if self._booked is None:
+            self._booked = defaultdict(list)
+            working_ids = [staff_id for staff_id, schedule in self.schedules(self.staffs).items()
+                           if schedule.working_hours]
+            if working_ids:
+                for staff_id, appt_date, start_time, end_time in Appointment.objects.filter(
+                        staff_member_id__in=working_ids, date__range=(self.start_date, self.end_date)
+                ).values_list('staff_member_id', 'date', 'start_time', 'end_time'):
+                    self._booked[(staff_id, appt_date)].append((start_time, end_time))
+        return self._booked
+
+
+def get_available_slots_for_staffs_in_range(staffs: Iterable[StaffMember], start_date: date, end_date: date, service,
+                                            limit: Optional[int] = None,
+                                            window: Optional[_StaffWindow] = None
+                                            ) -> dict[date, dict[int, List[datetime]]]:
+    """Compute the available slots of many staff members over a window of days.
+
+    Working hours, days off and appointments of the whole window are loaded with one query each, whatever the
+    number of staff members and days, and turned into :class:`StaffSchedule` snapshots. Results are cached per
+    (staff, day, service duration), see :mod:`appointment.core.availability_cache`; the database is only queried for
+    the staff members with a miss.
+
+    :param staffs: The staff members to compute.
+    :param start_date: First day of the window.
+    :param end_date: Last day of the window (inclusive).
+    :param service: The service to book.
+    :param limit: If given, stop as soon as this many slots have been found. Days after the one where the limit is
+                  reached are left out and that day only keeps its earliest slots.
+    :param window: Schedules and appointments shared with other services over the same days; must cover ``staffs``.
+    :return: Dict mapping each day to a dict of staff member id -> available slots.
+    """
+    staffs = list(staffs)
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    results: dict[date, dict[int, List[datetime]]] = {}
+    staff_ids = [staff.id for staff in staffs]
+    if not staff_ids or not days:
+        return {day: {staff_id: [] for staff_id in staff_ids} for day in days}
+
+    cached, cache_keys = get_cached_availability(((staff_id, day) for day in days for staff_id in staff_ids),
+                                                 service.duration)
+    missing_ids = {staff_id for staff_id, day in cache_keys if (staff_id, day) not in cached}
+
+    if window is None:
+        window = _StaffWindow([staff for staff in staffs if staff.id in missing_ids], start_date, end_date)
+    schedules = window.schedules(staff_id for staff_id in staff_ids if staff_id in missing_ids)
+    use_sql = bool(missing_ids) and _use_sql_engine(service)
+    booked: dict[Tuple[int, date], List[Tuple[time, time]]] = defaultdict(list)
+    if missing_ids and not use_sql:
+        booked = window.booked()
+
+    # The bitmap and SQL engines compute every miss of the window at once; the interval engine computes them lazily.
+    # The SQL engine reads the appointments in the database, so they are not loaded above.
+    precomputed = {}
+    if use_sql:
+        precomputed = compute_valid_starts_sql(
+            schedules, [pair for pair in cache_keys if pair not in cached], service.duration)
+    elif missing_ids and _use_bitmap_engine(service):
+        precomputed = compute_valid_starts_bitmap(
+            schedules, [pair for pair in cache_keys if pair not in cached], service.duration, booked)
+
+    now = datetime.now()
+    found = 0
+    computed = {}
+    for day in days:
+        day_results = {staff_id: [] for staff_id in staff_ids}
+        results[day] = day_results
+        for staff_id in staff_ids:
+            entry = cached.get((staff_id, day))
+            if entry is None:
+                schedule = schedules[staff_id]
+                slots = precomputed.get((staff_id, day))
+                if slots is None:
+                    slots = compute_valid_starts_for_schedule(schedule, day, service.duration,
+                                                              booked[(staff_id, day)])
+                entry = (slots, schedule.buffer_minutes)
+                computed[cache_keys[(staff_id, day)]] = entry
+            day_results[staff_id] = apply_same_day_rules(day, entry[0], entry[1], now)
+
+        if limit is not None:
+            day_count = sum(len(slots) for slots in day_results.values())
+            if found + day_count >= limit:
+                _keep_earliest_slots(day_results, limit - found)
+                break
+            found += day_count
+
+    set_cached_availability(computed)
+    return results
 
-    occupied_slots = compute_occupied_slots_from_appointments(staff, day, base_slots, appointments_of_day)
-    blocked_slots = compute_blocked_slots(staff, day, base_slots, slot_td)
 
-    wh = WorkingHours.objects.filter(staff_member=staff, day_of_week=day.weekday()).first()
-    working_end = to_dt(day, wh.end_time)
+def get_available_slots_for_services_in_range(services: Iterable[Service], start_date: date, end_date: date,
+                                              staff: Optional[StaffMember] = None
+                                              ) -> dict[int, dict[date, dict[int, List[datetime]]]]:
+    """Compute the available slots of several services over a window of days at once.
 
-    valid_slots = filter_slots_for_service(base_slots, slot_td, service.duration, working_end, occupied_slots, blocked_slots)
+    The staff members of every service are loaded with one query for the assignments and one for the staff
+    members. Their schedules and the appointments of the window are then loaded once for the union of them, and
+    shared by all services, see :func:`get_available_slots_for_staffs_in_range`.
+
+    :param services: The services to compute.
+    :param start_date: First day of the window.
+    :param end_date: Last day of the window (inclusive).
+    :param staff: Restrict to one staff member.
+    :return: Dict mapping each service's id to its result of :func:`get_available_slots_for_staffs_in_range`.
+    """
+    services = list(services)
+    assignments = StaffMember.services_offered.through.objects.filter(service_id__in=[s.id for s in services])
+    if staff is not None:
+        assignments = assignments.filter(staffmember_id=staff.id)
+    staff_ids_by_service: dict[int, List[int]] = defaultdict(list)
+    for service_id, staff_id in assignments.order_by('staffmember_id').values_list('service_id', 'staffmember_id'):
+        staff_ids_by_service[service_id].append(staff_id)
+
+    staff_ids = {staff_id for ids in staff_ids_by_service.values() for staff_id in ids}
+    staffs = StaffMember.objects.in_bulk(staff_ids) if staff_ids else {}
+    window = _StaffWindow(staffs.values(), start_date, end_date)
+    return {
+        service.id: get_available_slots_for_staffs_in_range(
+            [staffs[staff_id] for staff_id in staff_ids_by_service[service.id]], start_date, end_date, service,
+            window=window)
+        for service in services
+    }
+
+
+_warned_numpy_missing = False
+_warned_sql_unsupported = False
+
+
+def _use_bitmap_engine(service) -> bool:
+    """Whether ``APPOINTMENT_AVAILABILITY_ENGINE`` selects the NumPy bitmap engine and it can serve ``service``."""
+    global _warned_numpy_missing
+    if APPOINTMENT_AVAILABILITY_ENGINE != 'bitmap' or service.duration.total_seconds() <= 0:
+        return False
+    if not NUMPY_AVAILABLE:
+        if not _warned_numpy_missing:
+            _logger.warning("APPOINTMENT_AVAILABILITY_ENGINE is 'bitmap' but numpy is not installed, "
+                            "falling back to the interval engine")
+            _warned_numpy_missing = True
+        return False
+    return True
+
+
+def _use_sql_engine(service) -> bool:
+    """Whether ``APPOINTMENT_AVAILABILITY_ENGINE`` selects the SQL engine and the database supports it."""
+    global _warned_sql_unsupported
+    if APPOINTMENT_AVAILABILITY_ENGINE != 'sql' or service.duration.total_seconds() <= 0:
+        return False
+    if connection.vendor not in SUPPORTED_VENDORS:
+        if not _warned_sql_unsupported:
+            _logger.warning(f"APPOINTMENT_AVAILABILITY_ENGINE is 'sql' but {connection.vendor} is not supported, "
+                            "falling back to the interval engine")
+            _warned_sql_unsupported = True
+        return False
+    return True
+
+
+def find_available_staff(staffs: Iterable[StaffMember], day: date, start_time: time, service,
+                         exclude_appointment_id: Optional[int] = None,
+                         prefer_staff_id: Optional[int] = None) -> Optional[StaffMember]:
+    """Return a staff member who can take ``service`` at ``start_time`` on ``day``, or None.
+
+    Only the requested start is checked (see :func:`is_start_bookable`), with one query for the working hours of
+    that weekday, one for the days off and one for the appointments of the day, whatever the slot granularity and
+    the number of staff members. Among the staff members who can take it, ``prefer_staff_id`` wins, then the one
+    with the fewest appointments that day, then the lowest id.
+
+    :param staffs: Candidate staff members.
+    :param day: The day to book.
+    :param start_time: Requested start time.
+    :param service: The service to book.
+    :param exclude_appointment_id: Appointment being rescheduled, ignored in the overlap check.
+    :param prefer_staff_id: Staff member to keep when available (rescheduling).
+    :return: The chosen staff member.
+    """
+    staffs = list(staffs)
+    schedules = StaffSchedule.build_many(staffs, day, day)
+    working = [staff for staff in staffs
+               if schedules[staff.id].hours_for(day) and not schedules[staff.id].is_day_off(day)]
+    if not working:
+        return None
+
+    booked: dict[int, List[Tuple[time, time]]] = defaultdict(list)
+    appointments = Appointment.objects.filter(staff_member_id__in=[staff.id for staff in working], date=day)
+    if exclude_appointment_id:
+        appointments = appointments.exclude(pk=exclude_appointment_id)
+    for staff_id, appt_start, appt_end in appointments.values_list('staff_member_id', 'start_time', 'end_time'):
+        booked[staff_id].append((appt_start, appt_end))
+
+    start = to_dt(day, start_time)
     now = datetime.now()
-    if day == now.date():
-        valid_slots = [s for s in valid_slots if s > now]
-    return valid_slots
+    candidates = [staff for staff in working
+                  if is_start_bookable(schedules[staff.id], day, start, service.duration, booked[staff.id], now)]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda staff: (staff.id != prefer_staff_id, len(booked[staff.id]), staff.id))
+
+
+def _keep_earliest_slots(slots_by_staff: dict[int, List[datetime]], keep: int):
+    """Truncate ``slots_by_staff`` in place to its ``keep`` earliest slots across all staff members."""
+    earliest = sorted((slot, staff_id) for staff_id, slots in slots_by_staff.items() for slot in slots)[:keep]
+    for staff_id in slots_by_staff:
+        slots_by_staff[staff_id] = []
+    for slot, staff_id in earliest:
+        slots_by_staff[staff_id].append(slot)
+
+
 from appointment.core.db_helpers import get_staffs_assigned_to_service
 
 
 
 def get_availability_for_service_across_staffs(service_name: str, day: datetime.date) -> dict[str, List[str]]:
-    from appointment.core.db_helpers import get_staffs_assigned_to_service
-    from appointment.models import Service
-
     service = Service.get_service_by_name(service_name)
     if not service:
         return {}
 
-    results: dict[str, List[str]] = {}
-    for staff in get_staffs_assigned_to_service(service_name):
-        appts = Appointment.objects.filter(staff_member=staff, date=day)
-        slots = get_available_slots_for_service(staff, day, service, appointments_of_day=appts)
-        results[staff.user.username] = [s.isoformat(sep=' ') for s in slots]
-
-    return results
+    staffs = list(service.staff_members.select_related('user'))
+    slots_by_staff = get_available_slots_for_staffs(staffs, day, service)
+    return {
+        staff.user.username: [s.isoformat(sep=' ') for s in slots_by_staff[staff.id]]
+        for staff in staffs
+    }
 
 
 def validate_appointment_wont_overlap(staff:StaffMember, appt_date:date, appt_start:datetime, appt_end:datetime, exclude_appointment_id:Optional[int]=None):
@@ -80,7 +318,7 @@ def validate_appointment_wont_overlap(staff:StaffMember, appt_date:date, appt_st
     overlaps = qs.filter(start_time__lt=appt_end.time(), end_time__gt=appt_start.time())
     if overlaps.exists():
 
-        raise ValidationError("Requested appointment overlaps with an existing appointment for that staff.")
+        raise SlotUnavailableError("Requested appointment overlaps with an existing appointment for that staff.")
 
 
 def create_appointment_safe(
@@ -92,31 +330,31 @@ def create_appointment_safe(
     appt_end_time: time,
     **extra_fields
 ):
-    if Appointment.objects.filter(
-            staff_member=staff,
-            date=appt_date,
-            start_time=appt_start_time
-    ).exists():
-        raise ValueError("Slot already taken")
-
-    # TODO Test transaction
-    with transaction.atomic():
-        appt_start_dt = combine_date_and_time(appt_date, appt_start_time)
-        appt_end_dt = combine_date_and_time(appt_date, appt_end_time)
+    """
+    Create an appointment unless it overlaps another appointment of the same staff member.
 
-        # Block staff rows during the transaction
-        Appointment.objects.filter(
-            staff_member=staff, date=appt_date
-        ).select_for_update()
+    Concurrent bookings are arbitrated by the unique index of the slot ledger (see
+    :mod:`appointment.core.occupancy`): exactly one of them commits, the others get a ``SlotUnavailableError``
+    without any table lock or retry.
 
+    :raises SlotUnavailableError: If the slot is taken.
+    """
+    appt_start_dt = combine_date_and_time(appt_date, appt_start_time)
+    appt_end_dt = combine_date_and_time(appt_date, appt_end_time)
+    with transaction.atomic():
+        # Also catches overlaps with appointments that predate the ledger.
         validate_appointment_wont_overlap(staff, appt_date, appt_start_dt, appt_end_dt)
-        appt = Appointment.objects.create(
-            client=client,
-            service=service,
-            staff_member=staff,
-            date=appt_date,
-            start_time=appt_start_time,
-            end_time=appt_end_time,
-            **extra_fields
-        )
-    return appt
\ No newline at end of file
+        try:
+            appt = Appointment.objects.create(
+                client=client,
+                service=service,
+                staff_member=staff,
+                date=appt_date,
+                start_time=appt_start_time,
+                end_time=appt_end_time,
+                **extra_fields
+            )
+        except IntegrityError as e:
+            # unique_appointment_per_staff: same start time
+            raise SlotUnavailableError("Slot already taken") from e
+    return appt
@@ -0,0 +1,90 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+import base64
+from datetime import date, time
+from typing import List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+from appointment.settings import APPOINTMENT_LIST_MAX_PAGE_SIZE, APPOINTMENT_LIST_PAGE_SIZE
+
+LISTING_FIELDS = (
+    'id', 'date', 'start_time', 'end_time',
+    'client__first_name', 'client__last_name',
+    'service__name',
+    'staff_member__user__first_name', 'staff_member__user__last_name',
+)
+
+Cursor = Tuple[date, time, int]
+
+
+def encode_cursor(row: dict) -> str:
+    """Encode the (date, start_time, id) key of a listed row into an opaque cursor."""
+    raw = f"{row['date'].isoformat()},{row['start_time'].isoformat()},{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Decode a cursor produced by ``encode_cursor``.
+
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        day, start, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split(',')
+        return date.fromisoformat(day), time.fromisoformat(start), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def _full_name(first: Optional[str], last: Optional[str]) -> str:
+    return f"{first or ''} {last or ''}".strip()
+
+
+def serialize_listing_row(row: dict) -> dict:
+    """Turn a ``LISTING_FIELDS`` projection into the appointment payload of the web API."""
+    return {
+        "id": row['id'],
+        "client": _full_name(row['client__first_name'], row['client__last_name']),
+        "service": row['service__name'],
+        "date": str(row['date']),
+        "start_time": str(row['start_time']),
+        "end_time": str(row['end_time']),
+        "staff": _full_name(row['staff_member__user__first_name'], row['staff_member__user__last_name']),
+    }
+
+
+def get_appointments_page(queryset: QuerySet, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                          cursor: Optional[str] = None,
+                          limit: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of appointments ordered by (date, start_time, id) in a single joined query.
+
+    The page is selected with a keyset condition on the ordering key, so the cost of a page does not depend on
+    how deep into the history it is.
+
+    :param queryset: Appointments visible to the caller.
+    :param start_date: First date included, if any.
+    :param end_date: Last date included, if any.
+    :param cursor: ``next_cursor`` of the previous page.
+    :param limit: Page size, capped at ``APPOINTMENT_LIST_MAX_PAGE_SIZE``.
+    :return: The serialized appointments and the cursor of the next page, or None on the last page.
+    """
+    limit = min(APPOINTMENT_LIST_PAGE_SIZE if limit is None else limit, APPOINTMENT_LIST_MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+    if cursor:
+        day, start, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(date__gt=day) | Q(date=day, start_time__gt=start) | Q(date=day, start_time=start, id__gt=pk)
+        )
+
+    rows = list(queryset.order_by('date', 'start_time', 'id').values(*LISTING_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [serialize_listing_row(row) for row in rows[:limit]], next_cursor
@@ -4,12 +4,15 @@ Since: 1.0.0
 """
 
 
+from bisect import bisect_right
 from datetime import datetime, date, time, timedelta
 
-from typing import List, Set, Iterable, Optional
+from typing import List, Set, Iterable, Optional, Tuple
 
+from appointment.core.config_cache import get_cached_config
+from appointment.core.schedule_index import get_schedule_index
 from appointment.core.db_helpers import get_weekday_num_from_date
-from appointment.models import Appointment, WorkingHours, DayOff, StaffMember
+from appointment.models import Appointment, StaffMember
 from appointment.logger_config import get_logger
 _logger = get_logger(__name__)
 
@@ -19,21 +22,88 @@ def ceil_div(a: int, b: int) -> int:
 def to_dt(d: datetime.date, t: datetime.time) -> datetime:
     return datetime.combine(d, t)
 
-def generate_base_slots_for_day(staff: StaffMember, day: datetime.date) -> List[datetime]:
-    print(day.weekday())
+class StaffSchedule:
+    """Read-only snapshot of everything availability needs to know about a staff member.
 
-    working_hours = WorkingHours.objects.filter(staff_member=staff, day_of_week=day.weekday()).first()
-    if not working_hours:
-        _logger.warning(f"No working hours for staff {staff.user.username} on day {day}")
+    Built in bulk with :meth:`build_many`, it replaces the lazy ORM lookups (working hours, days off, config
+    fallbacks) done from the slot functions, so the inner loops only touch plain attributes.
+    """
+    __slots__ = ('staff_id', 'slot_minutes', 'buffer_minutes', 'working_hours', 'days_off', '_day_off_starts')
+
+    def __init__(self, staff_id: int, slot_minutes: int, buffer_minutes: Optional[float],
+                 working_hours: dict[int, Tuple[time, time]], days_off: Iterable[Tuple[date, date]] = ()):
+        self.staff_id = staff_id
+        self.slot_minutes = slot_minutes
+        self.buffer_minutes = buffer_minutes
+        self.working_hours = working_hours
+        self.days_off = _merge_date_ranges(days_off)
+        self._day_off_starts = [start for start, _ in self.days_off]
+
+    def __repr__(self):
+        return f"StaffSchedule(staff_id={self.staff_id}, slot_minutes={self.slot_minutes})"
+
+    def hours_for(self, day: date) -> Optional[Tuple[time, time]]:
+        """Return the (start, end) working hours of ``day``, or None if the staff member does not work that day."""
+        return self.working_hours.get(day.weekday())
+
+    def is_day_off(self, day: date) -> bool:
+        index = bisect_right(self._day_off_starts, day) - 1
+        return index >= 0 and self.days_off[index][1] >= day
+
+    @classmethod
+    def build_many(cls, staffs: Iterable[StaffMember], start_date: Optional[date] = None,
+                   end_date: Optional[date] = None) -> dict[int, 'StaffSchedule']:
+        """Build the schedules of many staff members from the in-memory schedule index, without querying.
+
+        :param staffs: The staff members.
+        :param start_date: If given with ``end_date``, only the days off overlapping this window are kept.
+        :param end_date: See ``start_date``.
+        :return: Dict mapping each staff member's id to its schedule.
+        """
+        staffs = list(staffs)
+        if not staffs:
+            return {}
+        index = get_schedule_index()
+        config = get_cached_config()
+        return {
+            staff.id: cls(
+                staff_id=staff.id,
+                slot_minutes=staff.slot_duration or (config.slot_duration if config else 0),
+                buffer_minutes=staff.appointment_buffer_time or (config.appointment_buffer_time if config else 0),
+                working_hours=index.working_hours(staff.id),
+                days_off=index.days_off(staff.id, start_date, end_date),
+            )
+            for staff in staffs
+        }
+
+    @classmethod
+    def build(cls, staff: StaffMember, start_date: Optional[date] = None,
+              end_date: Optional[date] = None) -> 'StaffSchedule':
+        return cls.build_many([staff], start_date, end_date)[staff.id]
+
+
+def _merge_date_ranges(ranges: Iterable[Tuple[date, date]]) -> List[Tuple[date, date]]:
+    merged: List[Tuple[date, date]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def generate_base_slots_for_day(schedule: StaffSchedule, day: datetime.date) -> List[datetime]:
+    hours = schedule.hours_for(day)
+    if not hours:
+        _logger.warning(f"No working hours for staff {schedule.staff_id} on day {day}")
         return []
-    print("days off")
-    print(staff.get_days_off())
-    if day in staff.get_days_off():
+    if schedule.is_day_off(day):
         return []
 
-    slot_td = timedelta(minutes=staff.get_slot_duration())
-    start_dt = to_dt(day, working_hours.start_time)
-    end_dt = to_dt(day, working_hours.end_time)
+    slot_td = timedelta(minutes=schedule.slot_minutes)
+    start_dt = to_dt(day, hours[0])
+    end_dt = to_dt(day, hours[1])
 
     slots: List[datetime] = []
     cur = start_dt
@@ -51,12 +121,12 @@ def _slot_intersects_interval(slot_start:datetime, slot_td:timedelta, interval_s
 
 from appointment.core.date_time import combine_date_and_time
 
-def compute_occupied_slots_from_appointments(staff: StaffMember, day: datetime.date, all_slots: Iterable[datetime],
+def compute_occupied_slots_from_appointments(schedule: StaffSchedule, day: datetime.date, all_slots: Iterable[datetime],
                                              appointments_qs: Optional[Iterable[Appointment]] = None) -> Set[datetime]:
-    slot_td = timedelta(minutes=staff.get_slot_duration())
+    slot_td = timedelta(minutes=schedule.slot_minutes)
     slots_set = set(all_slots)
     if appointments_qs is None:
-        appointments_qs = Appointment.objects.filter(staff_member=staff, date=day)
+        appointments_qs = Appointment.objects.filter(staff_member_id=schedule.staff_id, date=day)
 
     occupied: Set[datetime] = set()
     for appt in appointments_qs:
@@ -67,15 +137,15 @@ def compute_occupied_slots_from_appointments(staff: StaffMember, day: datetime.d
                 occupied.add(s)
     return occupied
 
-def compute_blocked_slots(staff: StaffMember, day: datetime.date, all_slots: Iterable[datetime], slot_td: timedelta) -> Set[datetime]:
+def compute_blocked_slots(schedule: StaffSchedule, day: datetime.date, all_slots: Iterable[datetime], slot_td: timedelta) -> Set[datetime]:
     blocked: Set[datetime] = set()
 
     # Bloqueo por día libre
-    if DayOff.objects.filter(staff_member=staff, start_date__lte=day, end_date__gte=day).exists():
+    if schedule.is_day_off(day):
         return set(all_slots)
 
     # Bloqueo por buffer (solo hoy)
-    buffer_min = staff.get_appointment_buffer_time()
+    buffer_min = schedule.buffer_minutes
     if buffer_min and buffer_min > 0 and day == datetime.today().date():
         cutoff = datetime.now() + timedelta(minutes=buffer_min)
         for s in all_slots:
@@ -99,5 +169,192 @@ def filter_slots_for_service(free_slots: List[datetime], slot_td: timedelta, ser
     return valid
 
 
+# -------------------------------------------------------------------
+# INTERVAL ENGINE
+# -------------------------------------------------------------------
+Interval = Tuple[datetime, datetime]
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and merge overlapping or touching intervals.
+
+    :param intervals: Iterable of ``(start, end)`` tuples. Empty intervals are discarded.
+    :return: Sorted list of disjoint intervals.
+    """
+    merged: List[Interval] = []
+    for start, end in sorted(i for i in intervals if i[0] < i[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(window: Interval, busy: Iterable[Interval]) -> List[Interval]:
+    """Return the parts of ``window`` not covered by any ``busy`` interval.
+
+    :param window: The ``(start, end)`` interval to carve.
+    :param busy: Intervals to remove from the window, in any order.
+    :return: Sorted list of free intervals inside the window.
+    """
+    window_start, window_end = window
+    free: List[Interval] = []
+    cursor = window_start
+    for start, end in merge_intervals(busy):
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < window_end:
+        free.append((cursor, window_end))
+    return free
+
+
+def valid_start_times(free_intervals: Iterable[Interval], grid_origin: datetime, slot_td: timedelta,
+                      service_duration: timedelta, earliest: Optional[datetime] = None) -> List[datetime]:
+    """Sweep the free intervals once and return every grid-aligned start that fits the service.
+
+    The service occupies ``ceil(service_duration / slot_td)`` whole slots, so a start ``s`` is valid when
+    ``[s, s + n_slots * slot_td)`` lies inside a single free interval.
+
+    :param free_intervals: Sorted, disjoint free intervals.
+    :param grid_origin: First slot of the day; candidate starts are ``grid_origin + k * slot_td``.
+    :param slot_td: Slot granularity.
+    :param service_duration: Duration of the service to book.
+    :param earliest: Optional lower bound for the returned starts (buffer time).
+    :return: Sorted list of valid start datetimes.
+    """
+    slot_seconds = int(slot_td.total_seconds())
+    if slot_seconds <= 0:
+        return []
+    needed = slot_td * ceil_div(int(service_duration.total_seconds()), slot_seconds)
+
+    valid: List[datetime] = []
+    for free_start, free_end in free_intervals:
+        if earliest is not None and earliest > free_start:
+            free_start = earliest
+        offset = (free_start - grid_origin).total_seconds()
+        cur = grid_origin + slot_td * ceil_div(int(offset), slot_seconds)
+        if cur < free_start:  # sub-second remainder
+            cur += slot_td
+        while cur + needed <= free_end:
+            valid.append(cur)
+            cur += slot_td
+    return valid
+
+
+def compute_valid_starts(day: date, working_start: time, working_end: time, slot_minutes: int,
+                         service_duration: timedelta, booked: Iterable[Tuple[time, time]],
+                         earliest: Optional[datetime] = None) -> List[datetime]:
+    """Compute the bookable start times of one staff member on one day.
+
+    The working window is extended to the end of its last slot, the booked intervals are subtracted from it and
+    the remaining gaps are swept once, so the cost is ``O(n log n)`` in the number of booked intervals.
+
+    :param day: The day to compute.
+    :param working_start: Start of the working hours.
+    :param working_end: End of the working hours.
+    :param slot_minutes: Slot granularity in minutes.
+    :param service_duration: Duration of the service to book.
+    :param booked: ``(start_time, end_time)`` tuples of the appointments of the day.
+    :param earliest: Optional lower bound for the returned starts (buffer time).
+    :return: Sorted list of valid start datetimes.
+    """
+    if not slot_minutes or slot_minutes <= 0:
+        return []
+    slot_td = timedelta(minutes=slot_minutes)
+    start_dt = to_dt(day, working_start)
+    end_dt = to_dt(day, working_end)
+    if end_dt <= start_dt:
+        return []
+    # Slots start strictly before the working end, so the last one may run past it.
+    n_slots = ceil_div(int((end_dt - start_dt).total_seconds()), int(slot_td.total_seconds()))
+    window = (start_dt, start_dt + n_slots * slot_td)
+
+    busy = [(to_dt(day, s), to_dt(day, e)) for s, e in booked]
+    free = subtract_intervals(window, busy)
+    return valid_start_times(free, start_dt, slot_td, service_duration, earliest)
+
+
+def compute_valid_starts_for_schedule(schedule: StaffSchedule, day: date, service_duration: timedelta,
+                                      booked: Iterable[Tuple[time, time]]) -> List[datetime]:
+    """:func:`compute_valid_starts` for a staff schedule, empty on days without working hours or days off."""
+    hours = schedule.hours_for(day)
+    if not hours or schedule.is_day_off(day):
+        return []
+    return compute_valid_starts(day, hours[0], hours[1], schedule.slot_minutes, service_duration, booked)
+
+
+def apply_same_day_rules(day: date, slots: List[datetime], buffer_minutes: Optional[float],
+                         now: Optional[datetime] = None) -> List[datetime]:
+    """Drop the slots that are already past, or within the buffer time, when ``day`` is today.
+
+    :param day: The day the slots belong to.
+    :param slots: Sorted valid starts, as returned by :func:`compute_valid_starts`.
+    :param buffer_minutes: Minimum time between now and the first bookable slot of the current day.
+    :param now: Reference time, defaults to ``datetime.now()``.
+    :return: The remaining slots.
+    """
+    now = now or datetime.now()
+    if day != now.date():
+        return slots
+    cutoff = now + timedelta(minutes=buffer_minutes) if buffer_minutes and buffer_minutes > 0 else now
+    return [s for s in slots if s > now and s >= cutoff]
+
+
+NO_WORKING_HOURS = "no working hours"
+DAY_OFF = "day off"
+OUTSIDE_WORKING_HOURS = "outside working hours"
+OVERLAPS_APPOINTMENT = "overlaps an existing appointment"
+TOO_SOON = "too soon"
+
+
+def start_conflict(schedule: StaffSchedule, day: date, start: datetime, service_duration: timedelta,
+                   booked: Iterable[Tuple[time, time]], now: Optional[datetime] = None) -> Optional[str]:
+    """Tell why ``start`` is not one of the valid starts of a staff member, without computing the whole day.
+
+    Mirrors ``start in apply_same_day_rules(day, compute_valid_starts_for_schedule(...), buffer)``: the start
+    must be on the slot grid of the working hours, the service's whole slots must fit in the working window and
+    overlap no appointment, and the same-day rules apply.
+
+    :param schedule: Schedule of the staff member.
+    :param day: The day to book.
+    :param start: Requested start.
+    :param service_duration: Duration of the service to book.
+    :param booked: ``(start_time, end_time)`` tuples of the appointments of the day.
+    :param now: Reference time for the same-day rules, defaults to ``datetime.now()``.
+    :return: None if the start can be booked, otherwise one of the reason constants of this module.
+    """
+    hours = schedule.hours_for(day)
+    if not hours or not schedule.slot_minutes or schedule.slot_minutes <= 0:
+        return NO_WORKING_HOURS
+    if schedule.is_day_off(day):
+        return DAY_OFF
+    slot_seconds = schedule.slot_minutes * 60
+    start_dt = to_dt(day, hours[0])
+    end_dt = to_dt(day, hours[1])
+    if end_dt <= start_dt:
+        return NO_WORKING_HOURS
+    if start < start_dt or (start - start_dt).total_seconds() % slot_seconds:
+        return OUTSIDE_WORKING_HOURS
+    window_end = start_dt + timedelta(seconds=slot_seconds * ceil_div(int((end_dt - start_dt).total_seconds()),
+                                                                      slot_seconds))
+    end = start + timedelta(seconds=slot_seconds * ceil_div(int(service_duration.total_seconds()), slot_seconds))
+    if end > window_end:
+        return OUTSIDE_WORKING_HOURS
+    for booked_start, booked_end in booked:
+        if booked_start < booked_end and to_dt(day, booked_start) < end and to_dt(day, booked_end) > start:
+            return OVERLAPS_APPOINTMENT
+    if not apply_same_day_rules(day, [start], schedule.buffer_minutes, now):
+        return TOO_SOON
+    return None
 
 
+def is_start_bookable(schedule: StaffSchedule, day: date, start: datetime, service_duration: timedelta,
+                      booked: Iterable[Tuple[time, time]], now: Optional[datetime] = None) -> bool:
+    """Whether ``start`` can be booked, see :func:`start_conflict`."""
+    return start_conflict(schedule, day, start, service_duration, booked, now) is None
@@ -0,0 +1,117 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+from datetime import date, datetime, time, timedelta
+from functools import reduce
+from math import ceil, gcd
+from typing import Dict, Iterable, List, Tuple
+
+from appointment.core.availability import StaffSchedule
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # pragma: no cover - exercised only without numpy
+    np = None
+    NUMPY_AVAILABLE = False
+
+Pair = Tuple[int, date]
+
+
+def _seconds(t: time) -> float:
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1_000_000
+
+
+def compute_valid_starts_bitmap(schedules: Dict[int, StaffSchedule], pairs: Iterable[Pair],
+                                service_duration: timedelta,
+                                booked: Dict[Pair, List[Tuple[time, time]]]) -> Dict[Pair, List[datetime]]:
+    """Vectorized equivalent of :func:`compute_valid_starts_for_schedule` for many (staff, day) pairs at once.
+
+    Every pair becomes a row of a boolean occupancy matrix whose columns are bins of the coarsest resolution that
+    still aligns with every slot grid (the gcd of the slot durations and working start times). Working windows and
+    appointments are painted with cumulative sums of +1/-1 markers, appointments being widened to whole bins,
+    which does not change which grid-aligned starts overlap them. A start is valid when the prefix sum of free
+    bins grows by the service length from it. Datetimes are only built for the valid starts.
+
+    :param schedules: Staff schedules by staff member id, covering every day of ``pairs``.
+    :param pairs: The (staff member id, day) pairs to compute.
+    :param service_duration: Duration of the service to book.
+    :param booked: ``(start_time, end_time)`` tuples of the appointments of each pair.
+    :return: Dict mapping each pair to its sorted valid starts.
+    :raises ImportError: If NumPy is not installed.
+    """
+    if not NUMPY_AVAILABLE:
+        raise ImportError("The bitmap availability engine requires numpy")
+
+    pairs = list(pairs)
+    results: Dict[Pair, List[datetime]] = {pair: [] for pair in pairs}
+    duration_seconds = int(service_duration.total_seconds())
+
+    # (pair, window start, window end, slot) in seconds of the day, for the pairs that have a working window.
+    rows = []
+    for staff_id, day in pairs:
+        schedule = schedules[staff_id]
+        hours = schedule.hours_for(day)
+        if not hours or schedule.is_day_off(day) or not schedule.slot_minutes or schedule.slot_minutes <= 0:
+            continue
+        slot = schedule.slot_minutes * 60
+        start, end = int(_seconds(hours[0])), _seconds(hours[1])
+        if end <= start:
+            continue
+        n_slots = ceil((end - start) / slot)
+        rows.append(((staff_id, day), start, start + n_slots * slot, slot))
+    if not rows:
+        return results
+
+    resolution = reduce(gcd, (value for _, start, _, slot in rows for value in (start, slot)))
+    origin = min(start for _, start, _, _ in rows)
+    n_cols = (max(end for _, _, end, _ in rows) - origin) // resolution
+    n_rows = len(rows)
+    row_index = {pair: i for i, (pair, _, _, _) in enumerate(rows)}
+
+    starts = np.array([(start - origin) // resolution for _, start, _, _ in rows], dtype=np.int64)
+    ends = np.array([(end - origin) // resolution for _, _, end, _ in rows], dtype=np.int64)
+    slot_bins = np.array([slot // resolution for _, _, _, slot in rows], dtype=np.int64)
+    needed_bins = slot_bins * np.array([ceil(duration_seconds / slot) for _, _, _, slot in rows], dtype=np.int64)
+
+    # Working windows.
+    markers = np.zeros((n_rows, n_cols + 1), dtype=np.int32)
+    np.add.at(markers, (np.arange(n_rows), starts), 1)
+    np.add.at(markers, (np.arange(n_rows), ends), -1)
+    free = np.cumsum(markers, axis=1)[:, :n_cols] > 0
+
+    # Appointments, widened to whole bins and clipped to the matrix.
+    busy = [(i, start_time, end_time) for pair, intervals in booked.items()
+            if (i := row_index.get(pair)) is not None for start_time, end_time in intervals]
+    if busy:
+        busy_rows = np.fromiter((i for i, _, _ in busy), dtype=np.int64, count=len(busy))
+        busy_starts = np.fromiter((_seconds(t) for _, t, _ in busy), dtype=np.float64, count=len(busy))
+        busy_ends = np.fromiter((_seconds(t) for _, _, t in busy), dtype=np.float64, count=len(busy))
+        keep = busy_ends > busy_starts
+        busy_rows = busy_rows[keep]
+        first_bins = np.clip(np.floor((busy_starts[keep] - origin) / resolution), 0, n_cols).astype(np.int64)
+        stop_bins = np.clip(np.ceil((busy_ends[keep] - origin) / resolution), 0, n_cols).astype(np.int64)
+        markers = np.zeros((n_rows, n_cols + 1), dtype=np.int32)
+        np.add.at(markers, (busy_rows, first_bins), 1)
+        np.add.at(markers, (busy_rows, stop_bins), -1)
+        free &= np.cumsum(markers, axis=1)[:, :n_cols] == 0
+
+    # A start at column j fits when the bins [j, j + needed) are all free.
+    prefix = np.zeros((n_rows, n_cols + 1), dtype=np.int32)
+    np.cumsum(free, axis=1, out=prefix[:, 1:])
+    cols = np.arange(n_cols)
+    stop = np.minimum(cols[None, :] + needed_bins[:, None], n_cols)
+    fits = np.take_along_axis(prefix, stop, axis=1) - prefix[:, :n_cols] == needed_bins[:, None]
+    on_grid = (cols[None, :] >= starts[:, None]) & ((cols[None, :] - starts[:, None]) % slot_bins[:, None] == 0)
+
+    # Rows come out in order, so each row's starts are a contiguous, sorted run of the flat result.
+    valid_rows, valid_cols = np.nonzero(fits & on_grid)
+    midnights = np.array([np.datetime64(pair[1], 's') for pair, _, _, _ in rows])
+    stamps = midnights[valid_rows] + (origin + valid_cols * resolution).astype('timedelta64[s]')
+    starts_list = stamps.astype(datetime).tolist()
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(valid_rows, minlength=n_rows)))).tolist()
+    for i, (pair, _, _, _) in enumerate(rows):
+        results[pair] = starts_list[offsets[i]:offsets[i + 1]]
+    return results
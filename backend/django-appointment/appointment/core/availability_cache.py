@@ -0,0 +1,131 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Versioned cache for the computed availability of a staff member on a day.
+
+Entries are keyed by (staff, date, service duration) and by three version counters: a global one (config), one per
+staff member (working hours, days off, slot settings) and one per staff member and day (appointments). Bumping a
+counter makes every entry built with the previous value unreachable, so invalidation never has to enumerate keys.
+"""
+
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from appointment.logger_config import get_logger
+from appointment.settings import APPOINTMENT_AVAILABILITY_CACHE, APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT
+
+_logger = get_logger(__name__)
+
+CachedSlots = Tuple[List[datetime], Optional[float]]
+StaffDay = Tuple[int, date]
+
+_GLOBAL_VERSION_KEY = 'availability:version'
+
+
+def _cache():
+    return caches[APPOINTMENT_AVAILABILITY_CACHE]
+
+
+def _staff_version_key(staff_id: int) -> str:
+    return f'availability:version:{staff_id}'
+
+
+def _day_version_key(staff_id: int, day: date) -> str:
+    return f'availability:version:{staff_id}:{day.isoformat()}'
+
+
+def _new_version() -> int:
+    # Time based so that a counter lost to eviction restarts above any value it had before.
+    return time.time_ns()
+
+
+def _get_versions(keys: Iterable[str]) -> Dict[str, int]:
+    cache = _cache()
+    keys = list(dict.fromkeys(keys))
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), timeout=None)
+        # Another process may have won the race on ``add``.
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def _incr(key: str):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), timeout=None)
+
+
+def _bump(key: str):
+    """Bump a version counter, and again on commit inside a transaction.
+
+    A reader running before the commit may already see the first bump and cache what it computed from the rows
+    as they were; the second bump makes that entry unreachable.
+    """
+    _incr(key)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _incr(key))
+
+
+def get_cached_availability(pairs: Iterable[StaffDay],
+                            service_duration: timedelta) -> Tuple[Dict[StaffDay, CachedSlots], Dict[StaffDay, str]]:
+    """Look up the cached availability of many (staff id, day) pairs at once.
+
+    :param pairs: The (staff id, day) pairs to look up.
+    :param service_duration: Duration of the service the slots were computed for.
+    :return: A tuple ``(hits, keys)``: the cached entries found, and the cache key of every pair, to be passed to
+             :func:`set_cached_availability` for the misses.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return {}, {}
+    version_keys = [_GLOBAL_VERSION_KEY]
+    for staff_id, day in pairs:
+        version_keys.append(_staff_version_key(staff_id))
+        version_keys.append(_day_version_key(staff_id, day))
+    versions = _get_versions(version_keys)
+
+    duration = int(service_duration.total_seconds())
+    global_version = versions.get(_GLOBAL_VERSION_KEY)
+    keys = {
+        (staff_id, day): f'availability:{global_version}:{staff_id}:{versions.get(_staff_version_key(staff_id))}:'
+                         f'{day.isoformat()}:{versions.get(_day_version_key(staff_id, day))}:{duration}'
+        for staff_id, day in pairs
+    }
+    found = _cache().get_many(list(keys.values()))
+    hits = {pair: found[key] for pair, key in keys.items() if key in found}
+    return hits, keys
+
+
+def set_cached_availability(entries: Dict[str, CachedSlots]):
+    """Store computed availability under the keys returned by :func:`get_cached_availability`."""
+    if entries:
+        _cache().set_many(entries, timeout=APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT)
+
+
+def invalidate_staff_day(staff_id: Optional[int], day: Optional[date]):
+    """Invalidate the availability of one staff member on one day (an appointment changed)."""
+    if staff_id is None or day is None:
+        return
+    _bump(_day_version_key(staff_id, day))
+
+
+def invalidate_staff(staff_id: Optional[int]):
+    """Invalidate every cached day of one staff member (working hours, days off or settings changed)."""
+    if staff_id is None:
+        return
+    _bump(_staff_version_key(staff_id))
+
+
+def invalidate_all():
+    """Invalidate the whole availability cache (the config changed)."""
+    _bump(_GLOBAL_VERSION_KEY)
@@ -0,0 +1,130 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+from datetime import date, datetime, time, timedelta
+from math import ceil
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import connection
+
+from appointment.core.availability import StaffSchedule
+from appointment.models import Appointment
+
+SUPPORTED_VENDORS = ('sqlite', 'postgresql')
+
+Pair = Tuple[int, date]
+
+# Seconds since midnight of a TIME column, exact for the text format SQLite stores times in.
+_SECONDS_OF_DAY = {
+    'sqlite': "(CAST(substr({0}, 1, 2) AS INTEGER) * 3600 + CAST(substr({0}, 4, 2) AS INTEGER) * 60"
+              " + CAST(substr({0}, 7) AS REAL))",
+    'postgresql': "EXTRACT(EPOCH FROM {0})",
+}
+_DATE_PARAM = {
+    'sqlite': "%s",
+    'postgresql': "CAST(%s AS date)",
+}
+
+_WINDOW_COLUMNS = 7
+
+_SQL = """
+WITH RECURSIVE windows(idx, staff_id, day, origin, slot, n_slots, needed) AS (
+    VALUES {values}
+),
+slots(idx, staff_id, day, origin, slot, n_slots, needed, k) AS (
+    SELECT idx, staff_id, day, origin, slot, n_slots, needed, 0 FROM windows
+    UNION ALL
+    SELECT idx, staff_id, day, origin, slot, n_slots, needed, k + 1 FROM slots WHERE k + 1 < n_slots
+),
+flagged AS (
+    SELECT s.idx, s.n_slots, s.needed, s.k,
+           CASE WHEN EXISTS (
+               SELECT 1 FROM {table} a
+               WHERE a.{staff_column} = s.staff_id AND a.{date_column} = s.day
+                 AND {start} < {end}
+                 AND {start} < s.origin + (s.k + 1) * s.slot
+                 AND {end} > s.origin + s.k * s.slot
+           ) THEN s.k END AS busy_k
+    FROM slots s
+),
+ranked AS (
+    SELECT idx, n_slots, needed, k,
+           MIN(busy_k) OVER (PARTITION BY idx ORDER BY k ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING) AS next_busy
+    FROM flagged
+)
+SELECT idx, k FROM ranked
+WHERE k + needed <= n_slots AND (next_busy IS NULL OR next_busy >= k + needed)
+ORDER BY idx, k
+"""
+
+
+def _seconds(t: time) -> float:
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1_000_000
+
+
+def _query(vendor: str, windows: List[tuple]) -> List[Tuple[int, int]]:
+    meta = Appointment._meta
+    seconds = _SECONDS_OF_DAY[vendor]
+    row = f"(%s, %s, {_DATE_PARAM[vendor]}, %s, %s, %s, %s)"
+    sql = _SQL.format(
+        values=", ".join([row] * len(windows)),
+        table=connection.ops.quote_name(meta.db_table),
+        staff_column=connection.ops.quote_name(meta.get_field('staff_member').column),
+        date_column=connection.ops.quote_name(meta.get_field('date').column),
+        start=seconds.format(f"a.{connection.ops.quote_name(meta.get_field('start_time').column)}"),
+        end=seconds.format(f"a.{connection.ops.quote_name(meta.get_field('end_time').column)}"),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for window in windows for value in window])
+        return cursor.fetchall()
+
+
+def compute_valid_starts_sql(schedules: Dict[int, StaffSchedule], pairs: Iterable[Pair],
+                             service_duration: timedelta) -> Dict[Pair, List[datetime]]:
+    """Equivalent of :func:`compute_valid_starts_for_schedule` for many (staff, day) pairs, computed by the database.
+
+    Working windows come from the schedules. The database generates the slot grid of every window with a recursive
+    CTE, flags the slots overlapped by an appointment, and keeps the starts whose next busy slot (a window ``MIN``
+    over the following slots) is at least the service's number of slots away. Only the valid starts are sent back,
+    never the appointment rows.
+
+    :param schedules: Staff schedules by staff member id, covering every day of ``pairs``.
+    :param pairs: The (staff member id, day) pairs to compute.
+    :param service_duration: Duration of the service to book.
+    :return: Dict mapping each pair to its sorted valid starts.
+    :raises NotImplementedError: If the database is neither SQLite nor PostgreSQL.
+    """
+    vendor = connection.vendor
+    if vendor not in SUPPORTED_VENDORS:
+        raise NotImplementedError(f"The SQL availability engine does not support {vendor}")
+
+    pairs = list(pairs)
+    results: Dict[Pair, List[datetime]] = {pair: [] for pair in pairs}
+    duration_seconds = service_duration.total_seconds()
+
+    windows = []
+    origins = []
+    for staff_id, day in pairs:
+        schedule = schedules[staff_id]
+        hours = schedule.hours_for(day)
+        if not hours or schedule.is_day_off(day) or not schedule.slot_minutes or schedule.slot_minutes <= 0:
+            continue
+        slot = schedule.slot_minutes * 60
+        start, end = _seconds(hours[0]), _seconds(hours[1])
+        if end <= start:
+            continue
+        n_slots = ceil((end - start) / slot)
+        needed = ceil(duration_seconds / slot)
+        windows.append((len(windows), staff_id, day.isoformat(), start, slot, n_slots, needed))
+        origins.append(((staff_id, day), datetime.combine(day, hours[0]), timedelta(seconds=slot)))
+    if not windows:
+        return results
+
+    batch_size = max(1, (connection.features.max_query_params or 999) // _WINDOW_COLUMNS)
+    for offset in range(0, len(windows), batch_size):
+        for idx, k in _query(vendor, windows[offset:offset + batch_size]):
+            pair, origin, slot_td = origins[idx]
+            results[pair].append(origin + k * slot_td)
+    return results
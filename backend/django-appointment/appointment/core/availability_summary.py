@@ -0,0 +1,195 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Per staff member and day summaries of free time, used for the month view.
+
+For every day that has been summarized, there is one ``DailyAvailability`` row per staff member, so a day either
+has complete rows or none. Days are summarized on demand, a month at a time. Appointment changes refresh the rows
+of their day in place; a change to the working hours, days off or slot settings of a staff member replaces the
+upcoming rows of that staff member, and config changes drop every upcoming row, which are rebuilt on the next
+request. The month view is advisory: the slots of a day are still computed exactly when the day
+is opened.
+"""
+
+from collections import defaultdict
+from datetime import date, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Max
+from django.utils import timezone
+
+from appointment.core.availability import StaffSchedule, ceil_div, to_dt
+from appointment.logger_config import get_logger
+from appointment.models import Appointment, DailyAvailability, Service, StaffMember
+
+_logger = get_logger(__name__)
+
+StaffDay = Tuple[int, date]
+
+
+def summarize_day(schedule: StaffSchedule, day: date, booked: Iterable[Tuple[time, time]]) -> Tuple[int, int]:
+    """Return the longest run of consecutive free slots and the total of free slots of a day, in minutes.
+
+    Slots follow :func:`appointment.core.availability.compute_valid_starts`: they start on the grid of the working
+    hours, the last one may run past the working end, and a slot is busy if any appointment overlaps it. A service
+    of duration ``D`` therefore has a valid start on the day if and only if the longest run is at least ``D``.
+
+    :param schedule: Schedule of the staff member.
+    :param day: The day.
+    :param booked: ``(start_time, end_time)`` tuples of the appointments of the day.
+    :return: ``(max_free_minutes, free_minutes)``.
+    """
+    hours = schedule.hours_for(day)
+    slot_minutes = schedule.slot_minutes
+    if not hours or not slot_minutes or slot_minutes <= 0 or schedule.is_day_off(day):
+        return 0, 0
+    slot_seconds = int(slot_minutes * 60)
+    start_dt, end_dt = to_dt(day, hours[0]), to_dt(day, hours[1])
+    if end_dt <= start_dt:
+        return 0, 0
+    n_slots = ceil_div(int((end_dt - start_dt).total_seconds()), slot_seconds)
+
+    free = [True] * n_slots
+    for booked_start, booked_end in booked:
+        if booked_start >= booked_end:
+            continue
+        first = max(int((to_dt(day, booked_start) - start_dt).total_seconds()) // slot_seconds, 0)
+        stop = min(ceil_div(int((to_dt(day, booked_end) - start_dt).total_seconds()), slot_seconds), n_slots)
+        for i in range(first, stop):
+            free[i] = False
+
+    longest = run = total = 0
+    for is_free in free:
+        if is_free:
+            run += 1
+            total += 1
+            longest = max(longest, run)
+        else:
+            run = 0
+    return int(longest * slot_minutes), int(total * slot_minutes)
+
+
+def _booked(staff_ids: Iterable[int], days: Iterable[date]) -> Dict[StaffDay, List[Tuple[time, time]]]:
+    booked: Dict[StaffDay, List[Tuple[time, time]]] = defaultdict(list)
+    for staff_id, day, start_time, end_time in Appointment.objects.filter(
+            staff_member_id__in=list(staff_ids), date__in=list(days)).values_list(
+            'staff_member_id', 'date', 'start_time', 'end_time'):
+        booked[(staff_id, day)].append((start_time, end_time))
+    return booked
+
+
+def _summarize(staffs: List[StaffMember], days: List[date]) -> List[DailyAvailability]:
+    if not staffs or not days:
+        return []
+    schedules = StaffSchedule.build_many(staffs, min(days), max(days))
+    booked = _booked([staff.id for staff in staffs], days)
+
+    rows = []
+    for staff in staffs:
+        for day in days:
+            longest, total = summarize_day(schedules[staff.id], day, booked.get((staff.id, day), ()))
+            rows.append(DailyAvailability(staff_member_id=staff.id, date=day, max_free_minutes=longest,
+                                          free_minutes=total))
+    return rows
+
+
+def fill_days(days: Iterable[date]) -> int:
+    """Summarize the given days for every staff member, skipping the days that already have rows.
+
+    :param days: The days to summarize.
+    :return: The number of days summarized.
+    """
+    days = sorted(set(days))
+    if not days:
+        return 0
+    existing = set(DailyAvailability.objects.filter(date__in=days).values_list('date', flat=True).distinct())
+    missing = [day for day in days if day not in existing]
+    if not missing:
+        return 0
+    # A concurrent request may fill the same days; its rows are equivalent.
+    DailyAvailability.objects.bulk_create(_summarize(list(StaffMember.objects.all()), missing),
+                                          batch_size=1000, ignore_conflicts=True)
+    _logger.info(f"Summarized the availability of {len(missing)} days")
+    return len(missing)
+
+
+def refresh_staff_days(pairs: Iterable[StaffDay]):
+    """Recompute the rows of some (staff id, day) pairs after their appointments changed.
+
+    Only existing rows are updated: a day that was never summarized stays without rows.
+
+    :param pairs: The (staff id, day) pairs.
+    """
+    pairs = {(staff_id, day) for staff_id, day in pairs if staff_id and day}
+    if not pairs:
+        return
+    rows = {(row.staff_member_id, row.date): row for row in DailyAvailability.objects.filter(
+        staff_member_id__in={staff_id for staff_id, _ in pairs}, date__in={day for _, day in pairs})
+        if (row.staff_member_id, row.date) in pairs}
+    if not rows:
+        return
+    staffs = StaffMember.objects.in_bulk({staff_id for staff_id, _ in rows})
+    days = sorted({day for _, day in rows})
+    schedules = StaffSchedule.build_many(staffs.values(), days[0], days[-1])
+    booked = _booked(staffs, days)
+
+    now = timezone.now()
+    for (staff_id, day), row in rows.items():
+        row.max_free_minutes, row.free_minutes = summarize_day(schedules[staff_id], day,
+                                                               booked.get((staff_id, day), ()))
+        row.updated_at = now
+    DailyAvailability.objects.bulk_update(list(rows.values()), ['max_free_minutes', 'free_minutes', 'updated_at'])
+
+
+def drop_upcoming_summaries(staff_id: Optional[int] = None):
+    """Forget the summaries from today on, after a change to working hours, days off, slot settings or config.
+
+    With ``staff_id``, only the rows of that staff member are replaced: they are summarized again right away for the
+    upcoming days that have rows, so that these days keep one row per staff member. Without it every upcoming row is
+    dropped.
+
+    :param staff_id: The staff member whose schedule changed, or None for a change that affects every staff member.
+    """
+    upcoming = DailyAvailability.objects.filter(date__gte=timezone.localdate())
+    if staff_id is None:
+        upcoming.delete()
+        return
+    days = sorted(set(upcoming.values_list('date', flat=True).distinct()))
+    upcoming.filter(staff_member_id=staff_id).delete()
+    staff = StaffMember.objects.filter(pk=staff_id).first()
+    if staff is None or not days:
+        return
+    DailyAvailability.objects.bulk_create(_summarize([staff], days), batch_size=1000, ignore_conflicts=True)
+
+
+def get_month_availability(service: Service, year: int, month: int,
+                           staff: Optional[StaffMember] = None) -> Dict[date, int]:
+    """Return, for each day of a month, the longest free run among the staff members offering a service.
+
+    Once the month has been summarized, this is one query on ``DailyAvailability``. Past days are reported as 0.
+
+    :param service: The service.
+    :param year: The year.
+    :param month: The month, 1 to 12.
+    :param staff: Restrict to one staff member.
+    :return: Dict mapping every day of the month to its longest free run in minutes; a service fits on a day if the
+             value is at least its duration.
+    """
+    first = date(year, month, 1)
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    today = timezone.localdate()
+    upcoming = [day for day in days if day >= today]
+
+    def query() -> Dict[date, int]:
+        queryset = DailyAvailability.objects.filter(date__range=(max(first, today), last),
+                                                    staff_member__services_offered=service)
+        if staff is not None:
+            queryset = queryset.filter(staff_member=staff)
+        return dict(queryset.values('date').annotate(best=Max('max_free_minutes')).values_list('date', 'best'))
+
+    result = query()
+    if fill_days(day for day in upcoming if day not in result):
+        result = query()
+    return {day: result.get(day, 0) for day in days}
@@ -0,0 +1,274 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from appointment.core.availability_cache import invalidate_staff_day
+from appointment.core.availability_summary import refresh_staff_days
+from appointment.core.date_time import convert_str_to_date, convert_str_to_time
+from appointment.core.occupancy import occupy_slots, slot_bins
+from appointment.logger_config import get_logger
+from appointment.models import Appointment, Client, Service, SlotOccupancy, StaffMember
+
+_logger = get_logger(__name__)
+
+CREATE, MOVE, CANCEL = 'create', 'move', 'cancel'
+StaffDay = Tuple[int, date]
+
+
+class _Item:
+    __slots__ = ('index', 'action', 'appointment', 'staff_id', 'date', 'start_time', 'end_time', 'error')
+
+    def __init__(self, index: int, action: str):
+        self.index = index
+        self.action = action
+        self.appointment: Optional[Appointment] = None
+        self.staff_id: Optional[int] = None
+        self.date: Optional[date] = None
+        self.start_time: Optional[time] = None
+        self.end_time: Optional[time] = None
+        self.error: Optional[str] = None
+
+    @property
+    def bins(self) -> range:
+        return slot_bins(self.start_time, self.end_time)
+
+
+def _parse_date(value) -> date:
+    return value if isinstance(value, date) else convert_str_to_date(value)
+
+
+def _parse_time(value) -> time:
+    return value if isinstance(value, time) else convert_str_to_time(value)
+
+
+def _end_time(day: date, start: time, duration) -> time:
+    end = datetime.combine(day, start) + duration
+    if end.date() != day:
+        raise ValueError("The appointment must end on the day it starts")
+    return end.time()
+
+
+def _prepare(operations: List[dict]) -> List[_Item]:
+    """Parse the operations and resolve every referenced row with one query per model."""
+    ids = defaultdict(set)
+    for op in operations:
+        for field, model in (('appointment_id', 'appointment'), ('client_id', 'client'),
+                             ('service_id', 'service'), ('staff_id', 'staff')):
+            if op.get(field) is not None:
+                ids[model].add(op[field])
+    appointments = Appointment.objects.select_related('service').in_bulk(ids['appointment'])
+    clients = Client.objects.in_bulk(ids['client'])
+    services = Service.objects.in_bulk(ids['service'])
+    # staff_id is a user id, as in the other appointment endpoints.
+    staffs = {staff.user_id: staff for staff in StaffMember.objects.filter(user__id__in=ids['staff'])}
+
+    items = []
+    for index, op in enumerate(operations):
+        item = _Item(index, op.get('action'))
+        items.append(item)
+        try:
+            if item.action == CREATE:
+                client, service = clients.get(op.get('client_id')), services.get(op.get('service_id'))
+                staff = staffs.get(op.get('staff_id'))
+                if client is None or service is None or staff is None:
+                    raise ValueError("Unknown or missing client_id, service_id or staff_id")
+                item.date, item.start_time = _parse_date(op['date']), _parse_time(op['start_time'])
+                item.end_time = (_parse_time(op['end_time']) if op.get('end_time')
+                                 else _end_time(item.date, item.start_time, service.duration))
+                item.staff_id = staff.id
+                item.appointment = Appointment(client=client, service=service, staff_member_id=staff.id,
+                                               additional_info=op.get('additional_info', ''))
+            elif item.action in (MOVE, CANCEL):
+                item.appointment = appointments.get(op.get('appointment_id'))
+                if item.appointment is None:
+                    raise ValueError("Unknown or missing appointment_id")
+                if item.action == MOVE:
+                    appt = item.appointment
+                    if op.get('staff_id') is not None:
+                        if op['staff_id'] not in staffs:
+                            raise ValueError("Unknown staff_id")
+                        item.staff_id = staffs[op['staff_id']].id
+                    else:
+                        item.staff_id = appt.staff_member_id
+                    item.date = _parse_date(op['date']) if op.get('date') else appt.date
+                    item.start_time = _parse_time(op['start_time']) if op.get('start_time') else appt.start_time
+                    if op.get('end_time'):
+                        item.end_time = _parse_time(op['end_time'])
+                    else:
+                        # Keep the current length of the appointment.
+                        length = datetime.combine(appt.date, appt.end_time) - datetime.combine(appt.date,
+                                                                                            appt.start_time)
+                        item.end_time = _end_time(item.date, item.start_time, length)
+                    if not item.staff_id:
+                        raise ValueError("The appointment has no staff member")
+            else:
+                raise ValueError(f"Unknown action '{item.action}', expected create, move or cancel")
+            if item.action != CANCEL and item.end_time <= item.start_time:
+                raise ValueError("end_time must be after start_time")
+        except (KeyError, ValueError, TypeError) as e:
+            item.error = str(e) if not isinstance(e, KeyError) else f"Missing field {e}"
+    return items
+
+
+def _check_conflicts(items: List[_Item]):
+    """Reject the items that overlap a kept appointment or an earlier accepted item, by staff and day.
+
+    Appointments are compared by the ledger bins they would hold (see :func:`appointment.core.occupancy.slot_bins`),
+    so the outcome is the one the ledger would enforce. Per (staff, day), the kept appointments are merged and the
+    proposed items are swept in start order: an item is accepted when it starts after the end of the previous
+    accepted item and does not hit a kept appointment. Moved and cancelled appointments release their place, unless
+    the move is rejected, in which case the sweep is repeated with the appointment kept where it is.
+    """
+    seen = set()
+    for item in items:
+        if item.error is None and item.action in (MOVE, CANCEL):
+            if item.appointment.pk in seen:
+                item.error = "The appointment appears in several operations"
+            seen.add(item.appointment.pk)
+
+    proposed: Dict[StaffDay, List[_Item]] = defaultdict(list)
+    for item in items:
+        if item.error is None and item.action != CANCEL:
+            proposed[(item.staff_id, item.date)].append(item)
+    if not proposed:
+        return
+
+    existing: Dict[StaffDay, List[Tuple[int, int, int]]] = defaultdict(list)
+    for pk, staff_id, day, start, end in Appointment.objects.filter(
+            staff_member_id__in={staff_id for staff_id, _ in proposed}, date__in={day for _, day in proposed}
+    ).values_list('pk', 'staff_member_id', 'date', 'start_time', 'end_time'):
+        bins = slot_bins(start, end)
+        if (staff_id, day) in proposed and bins:
+            existing[(staff_id, day)].append((bins.start, bins.stop, pk))
+
+    released = {item.appointment.pk for item in items if item.error is None and item.action in (MOVE, CANCEL)}
+    moves = [item for item in items if item.error is None and item.action == MOVE]
+    while True:
+        for day_items in proposed.values():
+            for item in day_items:
+                item.error = None
+        for key, day_items in proposed.items():
+            _sweep(day_items, [(start, stop) for start, stop, pk in existing.get(key, ()) if pk not in released])
+        rejected = {item.appointment.pk for item in moves if item.error} & released
+        if not rejected:
+            return
+        released -= rejected
+
+
+def _sweep(day_items: List[_Item], busy: List[Tuple[int, int]]):
+    merged: List[Tuple[int, int]] = []
+    for start, stop in sorted(busy):
+        if merged and start < merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+
+    k = 0
+    accepted_stop = None
+    for item in sorted(day_items, key=lambda i: (i.start_time, i.index)):
+        bins = item.bins
+        while k < len(merged) and merged[k][1] <= bins.start:
+            k += 1
+        if k < len(merged) and merged[k][0] < bins.stop:
+            item.error = "Overlaps an existing appointment"
+        elif accepted_stop is not None and bins.start < accepted_stop:
+            item.error = "Overlaps another appointment of the request"
+        else:
+            accepted_stop = bins.stop
+
+
+def apply_bulk_operations(operations: List[dict], all_or_nothing: bool = False) -> List[dict]:
+    """Create, move and cancel many appointments in one transaction.
+
+    Each operation is a dict with an ``action``:
+
+    - ``create``: ``client_id``, ``service_id``, ``staff_id`` (user id of the staff member), ``date``, ``start_time`` and
+      optionally ``end_time`` (defaults to the service duration) and ``additional_info``.
+    - ``move``: ``appointment_id`` and any of ``date``, ``start_time``, ``end_time``, ``staff_id``. Without
+      ``end_time`` the appointment keeps its length.
+    - ``cancel``: ``appointment_id``.
+
+    Referenced rows are loaded with one query per model and conflicts are validated in one sweep per staff member
+    and day (see :func:`_check_conflicts`). Rows are then written with ``bulk_create``/``bulk_update`` and the slot
+    ledger and availability cache are maintained explicitly, since bulk writes bypass ``save()`` and signals, so
+    creations and moves send no notification. Cancellations use the regular queryset delete and its signals.
+
+    :param operations: The operations, applied in one transaction.
+    :param all_or_nothing: If True, nothing is written when any operation is invalid.
+    :return: One result per operation, in order: ``{"index", "action", "status", "appointment_id"}`` with status
+             ``created``, ``moved``, ``cancelled``, ``error`` (with an ``error`` message) or ``skipped``.
+    :raises SlotUnavailableError: If a concurrent booking took one of the slots; nothing is written.
+    """
+    items = _prepare(operations)
+    _check_conflicts(items)
+    failed = any(item.error for item in items)
+    valid = [item for item in items if item.error is None and not (all_or_nothing and failed)]
+
+    creates = [item for item in valid if item.action == CREATE]
+    moves = [item for item in valid if item.action == MOVE]
+    cancels = [item for item in valid if item.action == CANCEL]
+    touched = set()
+
+    with transaction.atomic():
+        if cancels:
+            for item in cancels:
+                touched.add((item.appointment.staff_member_id, item.appointment.date))
+            Appointment.objects.filter(pk__in=[item.appointment.pk for item in cancels]).delete()
+
+        if moves:
+            now = timezone.now()
+            SlotOccupancy.objects.filter(appointment_id__in=[item.appointment.pk for item in moves]).delete()
+            for item in moves:
+                appt = item.appointment
+                touched.add((appt.staff_member_id, appt.date))
+                appt.staff_member_id, appt.date = item.staff_id, item.date
+                appt.start_time, appt.end_time = item.start_time, item.end_time
+                appt.reminder_at = appt.compute_reminder_at()
+                appt.updated_at = now
+            Appointment.objects.bulk_update([item.appointment for item in moves],
+                                            ['staff_member', 'date', 'start_time', 'end_time', 'reminder_at',
+                                             'updated_at'],
+                                            batch_size=500)
+
+        if creates:
+            for item in creates:
+                appt = item.appointment
+                appt.date, appt.start_time, appt.end_time = item.date, item.start_time, item.end_time
+                appt.reminder_at = appt.compute_reminder_at()
+            Appointment.objects.bulk_create([item.appointment for item in creates], batch_size=500)
+
+        occupy_slots([item.appointment for item in moves + creates])
+        for item in moves + creates:
+            touched.add((item.staff_id, item.date))
+
+        def invalidate():
+            for staff_id, day in touched:
+                if staff_id:
+                    invalidate_staff_day(staff_id, day)
+            refresh_staff_days(touched)
+        transaction.on_commit(invalidate)
+
+    statuses = {CREATE: 'created', MOVE: 'moved', CANCEL: 'cancelled'}
+    results = []
+    for item in items:
+        result = {"index": item.index, "action": item.action,
+                  "appointment_id": item.appointment.pk if item.appointment is not None else None}
+        if item.error:
+            result.update(status='error', error=item.error)
+        elif all_or_nothing and failed:
+            result['status'] = 'skipped'
+        else:
+            result['status'] = statuses[item.action]
+        results.append(result)
+    _logger.info(f"Bulk appointments: {len(creates)} created, {len(moves)} moved, {len(cancels)} cancelled, "
+                 f"{sum(1 for item in items if item.error)} rejected")
+    return results
+
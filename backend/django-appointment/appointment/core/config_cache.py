@@ -0,0 +1,74 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from appointment.settings import APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL
+
+_VERSION_KEY = 'config:version'
+
+# (config, version, checked_at) of this process, replaced as a whole so readers never see a half update.
+_state = None
+
+
+def _new_version() -> int:
+    return time.time_ns()
+
+
+def _get_shared_version() -> int:
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def get_cached_config():
+    """Return the Config object, cached in the current process.
+
+    The shared version key is checked at most every ``APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL`` seconds, and the
+    database is only hit when another process (or this one) saved the Config in the meantime.
+
+    :return: The Config object, or None if it does not exist.
+    """
+    global _state
+    from appointment.models import Config
+
+    now = time.monotonic()
+    state = _state
+    if state is not None and now - state[2] < APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL:
+        return state[0]
+
+    version = _get_shared_version()
+    if state is not None and state[1] == version:
+        _state = (state[0], version, now)
+        return state[0]
+
+    config = Config.objects.first()
+    _state = (config, version, now)
+    return config
+
+
+def _reset():
+    global _state
+    _state = None
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, _new_version(), timeout=None)
+
+
+def invalidate_cached_config():
+    """Drop the cached Config of this process and tell the other processes to reload theirs.
+
+    Inside a transaction this is done again on commit, so a process that reloaded the Config before the commit does
+    not keep the previous row under the new version.
+    """
+    _reset()
+    if connection.in_atomic_block:
+        transaction.on_commit(_reset)
@@ -12,7 +12,6 @@ from typing import Optional
 from urllib.parse import urlparse
 
 from django.apps import apps
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.exceptions import FieldDoesNotExist
@@ -26,13 +25,12 @@ from appointment.settings import (
     APPOINTMENT_BUFFER_TIME, APPOINTMENT_FINISH_TIME, APPOINTMENT_LEAD_TIME, APPOINTMENT_PAYMENT_URL,
     APPOINTMENT_SLOT_DURATION, APPOINTMENT_WEBSITE_NAME
 )
+from appointment.core.config_cache import get_cached_config
 from appointment.core.date_time import combine_date_and_time, get_weekday_num
+from appointment.core.schedule_index import get_schedule_index
 
 logger = get_logger(__name__)
 
-# Check if django-q is installed in settings
-DJANGO_Q_AVAILABLE = 'django_q' in settings.INSTALLED_APPS
-
 
 
 Appointment = apps.get_model('appointment', 'Appointment')
@@ -101,7 +99,7 @@ def check_day_off_for_staff(staff_member, date) -> bool:
     :param staff_member: The staff member to check.
     :param date: The date to check.
     """
-    return DayOff.objects.filter(staff_member=staff_member, start_date__lte=date, end_date__gte=date).exists()
+    return get_schedule_index().is_day_off(getattr(staff_member, 'pk', staff_member), date)
 
 
 
@@ -135,99 +133,48 @@ def create_and_save_appointment(appointment_data: dict):
         return JsonResponse({"Eror":"Error while creating the appointment."})
     logger.info(f"New appointment created: {appointment.to_dict()}")
     if appointment.want_reminder:
-        logger.info(f"User wants a reminder for appointment {appointment.id}, scheduling it...")
-        '''if DJANGO_Q_AVAILABLE:
-            schedule_email_reminder(appointment)
-        else:
-            logger.warning(f"Email reminder requested for appointment {appointment.id}, but django-q is not available.")'''
+        logger.info(f"Reminder of appointment {appointment.id} due at {appointment.reminder_at}")
     return appointment
 
 
-def schedule_email_reminder(appointment, request, appointment_datetime=None):
-    """Schedule an email reminder for the given appointment."""
-    if not DJANGO_Q_AVAILABLE:
-        logger.warning("Django-Q is not available. Email reminder will not be scheduled.")
-        return
-
-    # Calculate reminder datetime if not provided
-    if appointment_datetime is None:
-        appointment_datetime = combine_date_and_time(appointment.appointment_request.date,
-                                                     appointment.appointment_request.start_time)
-    if timezone.is_naive(appointment_datetime):
-        appointment_datetime = timezone.make_aware(appointment_datetime)
-
-    reminder_datetime = appointment_datetime - datetime.timedelta(days=1)
-
-    ar_id_request = appointment.appointment_request.get_id_request()
-    relative_reschedule_url = reverse('appointment:prepare_reschedule_appointment', args=[ar_id_request])
-    reschedule_link = get_absolute_url_(relative_reschedule_url, request)
+def schedule_email_reminder(appointment, request=None, appointment_datetime=None):
+    """Schedule an email reminder for the given appointment.
 
-    logger.info(f"Scheduling email reminder for appointment {appointment.id} at {reminder_datetime}")
-
-    # Schedule the email reminder task with Django-Q
-    schedule('appointment.tasks.send_email_reminder',
-             to_email=appointment.client.email,
-             name=f"reminder_{appointment.id_request}",
-             first_name=appointment.client.first_name,
-             reschedule_link=reschedule_link,
-             appointment_id=appointment.id,
-             schedule_type=Schedule.ONCE,
-             next_run=reminder_datetime)
+    The due time is kept in ``Appointment.reminder_at`` and sent by ``manage.py run_reminders``, see
+    :mod:`appointment.core.reminders`. ``request`` and ``appointment_datetime`` are accepted for compatibility; the
+    due time always follows the appointment's start.
+    """
+    appointment.want_reminder = True
+    appointment.save(update_fields=['want_reminder', 'updated_at'])
+    logger.info(f"Email reminder of appointment {appointment.id} due at {appointment.reminder_at}")
 
 
-def update_appointment_reminder(appointment, new_date, new_start_time, request, want_reminder=None):
+def update_appointment_reminder(appointment, new_date, new_start_time, request=None, want_reminder=None):
     """
-    Updates or cancels the appointment reminder based on changes to the start time or date,
-    and the user's preference for receiving a reminder.
+    Moves the appointment, and with it its reminder, to a new date or start time, or changes the user's preference
+    for receiving a reminder. The end time follows the service duration, or keeps the current length of the
+    appointment if it has no service. Saving the appointment updates its ``reminder_at`` column and its slots.
     """
-    if not DJANGO_Q_AVAILABLE:
-        logger.warning("Django-Q is not available. Appointment reminder cannot be updated.")
-        return
-    # Convert new date and time strings to datetime objects for comparison
-    new_datetime = combine_date_and_time(new_date, new_start_time)
-
-    existing_datetime = combine_date_and_time(appointment.appointment_request.date,
-                                              appointment.appointment_request.start_time)
-
-    # Ensure new_datetime is timezone-aware
-    if timezone.is_naive(new_datetime):
-        new_datetime = timezone.make_aware(new_datetime)
-
-    # Ensure existing_datetime is timezone-aware
-    if timezone.is_naive(existing_datetime):
-        existing_datetime = timezone.make_aware(existing_datetime)
-
-    # Determine if there's been a change in the datetime or the reminder preference
-    want_reminder = want_reminder if want_reminder is not None else appointment.want_reminder
-    datetime_changed = new_datetime != existing_datetime
-    reminder_preference_changed = appointment.want_reminder != want_reminder
-
-    if datetime_changed or reminder_preference_changed:
-        # Cancel any existing reminder
-        cancel_existing_reminder(appointment.id_request)
-
-        # If a reminder is still desired and the appointment is in the future, schedule a new one
-        if want_reminder and new_datetime > timezone.now():
-            schedule_email_reminder(appointment, request, new_datetime)
-        else:
-            logger.info(
-                    f"Reminder for appointment {appointment.id} is not scheduled per "
-                    f"user's preference or past datetime.")
-
-    # Update the appointment's reminder preference
-    appointment.want_reminder = want_reminder
+    if appointment.service is not None:
+        duration = appointment.service.duration
+    else:
+        duration = appointment.get_end_time() - appointment.get_start_time()
+    end = datetime.datetime.combine(new_date, new_start_time) + duration
+    if end.date() != new_date:
+        raise ValueError("The appointment must end on the day it starts")
+    appointment.date = new_date
+    appointment.start_time = new_start_time
+    appointment.end_time = end.time()
+    if want_reminder is not None:
+        appointment.want_reminder = want_reminder
     appointment.save()
 
 
-def cancel_existing_reminder(appointment_id_request):
+def cancel_existing_reminder(appointment_id):
     """
-    Cancels any existing reminder for the appointment.
+    Cancels any pending reminder for the appointment.
     """
-    if not DJANGO_Q_AVAILABLE:
-        logger.warning("Django-Q is not available. Appointment reminder cannot be updated.")
-        return
-    task_name = f"reminder_{appointment_id_request}"
-    Schedule.objects.filter(name=task_name).delete()
+    Appointment.objects.filter(pk=appointment_id).update(want_reminder=False, reminder_at=None)
 
 
 def can_appointment_be_rescheduled(appointment_request):
@@ -253,7 +200,7 @@ def can_appointment_be_rescheduled(appointment_request):
 
 
 def staff_change_allowed_on_reschedule():
-    return Config.objects.first().allow_staff_change_on_reschedule
+    return get_config().allow_staff_change_on_reschedule
 
 
 def generate_unique_username_from_email(email: str) -> str:
@@ -375,10 +322,8 @@ def day_off_exists_for_date_range(staff_member, start_date, end_date, days_off_i
     :param days_off_id: The ID of the day off to exclude from the check.
     :return: True if a day off exists for the given staff member and date range; otherwise, False.
     """
-    days_off = DayOff.objects.filter(staff_member=staff_member, start_date__lte=end_date, end_date__gte=start_date)
-    if days_off_id:
-        days_off = days_off.exclude(id=days_off_id)
-    return days_off.exists()
+    return get_schedule_index().has_day_off_between(getattr(staff_member, 'pk', staff_member), start_date, end_date,
+                                                    exclude_id=days_off_id or None)
 
 
 def get_all_appointments() -> list:
@@ -402,9 +347,7 @@ def get_appointment_buffer_time():
 
     :return: The appointment buffer time
     """
-    from .models import Config
-
-    config = Config.objects.first()
+    config = get_config()
 
     if config and config.appointment_buffer_time:
         return config.appointment_buffer_time
@@ -428,9 +371,7 @@ def get_appointment_finish_time():
 
     :return: The appointment's finish time
     """
-    from .models import Config
-
-    config = Config.objects.first()
+    config = get_config()
 
     if config and config.finish_time:
         return config.finish_time
@@ -442,9 +383,7 @@ def get_appointment_lead_time():
 
     :return: The appointment's lead time
     """
-    from .models import Config
-
-    config = Config.objects.first()
+    config = get_config()
 
     if config and config.lead_time:
         return config.lead_time
@@ -456,9 +395,7 @@ def get_appointment_slot_duration():
 
     :return: The appointment slot duration
     """
-    from .models import Config
-
-    config = Config.objects.first()
+    config = get_config()
 
     if config and config.slot_duration:
         return config.slot_duration
@@ -485,13 +422,8 @@ def get_appointments_for_date_and_time(date, start_time, end_time, staff_member)
 
 
 def get_config():
-    """Returns the configuration object from the database or the cache."""
-    config = cache.get('config')
-    if not config:
-        config = Config.objects.first()
-        # Cache the configuration for 1 hour (3600 seconds)
-        cache.set('config', config, 3600)
-    return config
+    """Returns the configuration object, cached per process and invalidated when the Config is saved."""
+    return get_cached_config()
 
 
 def get_day_off_by_id(day_off_id):
@@ -620,9 +552,7 @@ def get_website_name() -> str:
 
     :return: The website name
     """
-    from .models import Config
-
-    config = Config.objects.first()
+    config = get_config()
 
     if config and config.website_name != "":
         return config.website_name
@@ -648,7 +578,7 @@ def get_working_hours_for_staff_and_day(staff_member, day_of_week):
     :param day_of_week: The day of the week to get the working hours for.
     :return: The working hours for the given staff member and day of the week.
     """
-    working_hours = WorkingHours.objects.filter(staff_member=staff_member, day_of_week=day_of_week).first()
+    working_hours = get_schedule_index().hours_for(staff_member.pk, day_of_week)
     start_time = staff_member.get_lead_time()
     end_time = staff_member.get_finish_time()
     if not working_hours and not (start_time and end_time):
@@ -662,26 +592,25 @@ def get_working_hours_for_staff_and_day(staff_member, day_of_week):
             'end_time': staff_member.get_finish_time()
         }
 
-    # If a WorkingHours instance is found, convert it to a dictionary for consistent return type
+    # If working hours are found, convert them to a dictionary for consistent return type
     return {
-        'staff_member': working_hours.staff_member,
-        'day_of_week': working_hours.day_of_week,
-        'start_time': working_hours.start_time,
-        'end_time': working_hours.end_time
+        'staff_member': staff_member,
+        'day_of_week': day_of_week,
+        'start_time': working_hours[0],
+        'end_time': working_hours[1]
     }
 
 
 def is_working_day(staff_member: StaffMember, day: int) -> bool:
     """Check if the given day is a working day for the staff member."""
     _logger.debug("Checking working day method.")
-    working_days = list(WorkingHours.objects.filter(staff_member=staff_member).values_list('day_of_week', flat=True))
-    result = day in working_days
+    result = get_schedule_index().is_working_day(staff_member.pk, day)
     _logger.debug("Working day: %s", result)
     return result
 
 def working_hours_exist(day_of_week, staff_member):
     """Check if working hours exist for the given day of the week and staff member."""
-    return WorkingHours.objects.filter(day_of_week=day_of_week, staff_member=staff_member).exists()
+    return get_schedule_index().is_working_day(getattr(staff_member, 'pk', staff_member), day_of_week)
 
 
 def get_absolute_url_(relative_url, request):
@@ -0,0 +1,220 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Email outbox: emails are stored in ``OutgoingEmail`` and sent in batches by a background task.
+
+Queuing is one bulk insert, whatever the number of emails, and schedules the sender task once the transaction
+commits, unless one is already waiting. Emails with a ``dedup_key`` are queued once per recipient. The sender
+claims the due emails a batch at a time, renders them with templates compiled once per process and sends the batch
+over one connection of ``EMAIL_BACKEND``, so it can be tested with the locmem backend or a local debugging SMTP
+server. Rate control defers what exceeds ``APPOINTMENT_EMAIL_MAX_PER_MINUTE`` overall or
+``APPOINTMENT_EMAIL_MAX_PER_RECIPIENT`` per recipient and window.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from appointment.core.task_queue import enqueue, retry_delay
+from appointment.logger_config import get_logger
+from appointment.models import OutgoingEmail, Task
+from appointment.settings import (
+    APP_DEFAULT_FROM_EMAIL, APPOINTMENT_EMAIL_BATCH_SIZE, APPOINTMENT_EMAIL_MAX_ATTEMPTS,
+    APPOINTMENT_EMAIL_MAX_PER_MINUTE, APPOINTMENT_EMAIL_MAX_PER_RECIPIENT, APPOINTMENT_EMAIL_RECIPIENT_WINDOW
+)
+
+_logger = get_logger(__name__)
+
+SENDER_TASK = 'appointment.core.email_outbox.send_pending_emails'
+
+# An email still marked as sending after this long was claimed by a sender that died.
+_SENDING_TIMEOUT = timedelta(hours=1)
+
+
+@dataclass
+class Email:
+    """An email to queue. ``context`` must be JSON serializable; it is rendered when the email is sent."""
+    recipient: str
+    subject: str
+    template_name: str
+    context: dict = field(default_factory=dict)
+    dedup_key: str = ''
+    send_after: Optional[datetime] = None
+
+
+def queue_emails(emails: Iterable[Email]) -> int:
+    """Queue emails for the background sender, skipping those already queued with the same recipient and key.
+
+    :param emails: The emails to queue.
+    :return: The number of emails queued.
+    """
+    now = timezone.now()
+    emails = [email for email in emails if email.recipient]
+    keyed = {(email.recipient, email.dedup_key) for email in emails if email.dedup_key}
+    existing = set()
+    if keyed:
+        existing = set(OutgoingEmail.objects.filter(
+            recipient__in={recipient for recipient, _ in keyed}, dedup_key__in={key for _, key in keyed}
+        ).values_list('recipient', 'dedup_key'))
+
+    rows, seen = [], set()
+    for email in emails:
+        key = (email.recipient, email.dedup_key)
+        if email.dedup_key and (key in existing or key in seen):
+            continue
+        seen.add(key)
+        rows.append(OutgoingEmail(recipient=email.recipient, subject=email.subject[:255],
+                                  template_name=email.template_name, context=email.context,
+                                  dedup_key=email.dedup_key, send_after=email.send_after or now))
+    if not rows:
+        return 0
+    # A concurrent queue of the same key loses on the unique constraint.
+    OutgoingEmail.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+    first_due = min(row.send_after for row in rows)
+    transaction.on_commit(lambda: schedule_sender(first_due))
+    return len(rows)
+
+
+def queue_email(recipient: str, subject: str, template_name: str, context: Optional[dict] = None,
+                dedup_key: str = '', send_after: Optional[datetime] = None) -> bool:
+    """Queue one email, see :func:`queue_emails`.
+
+    :return: False if an email with the same recipient and ``dedup_key`` was already queued.
+    """
+    return bool(queue_emails([Email(recipient, subject, template_name, context or {}, dedup_key, send_after)]))
+
+
+def schedule_sender(run_at: Optional[datetime] = None):
+    """Queue the sender task for ``run_at``, unless one is already due by then."""
+    run_at = run_at or timezone.now()
+    if not Task.objects.filter(name=SENDER_TASK, status='pending', run_at__lte=run_at).exists():
+        enqueue(SENDER_TASK, run_at=run_at)
+
+
+@lru_cache(maxsize=None)
+def get_compiled_template(template_name: str):
+    """Return a template compiled once per process."""
+    return get_template(template_name)
+
+
+def render_email(email: OutgoingEmail) -> EmailMultiAlternatives:
+    html = get_compiled_template(email.template_name).render(email.context)
+    message = EmailMultiAlternatives(subject=email.subject, body=strip_tags(html), from_email=APP_DEFAULT_FROM_EMAIL,
+                                     to=[email.recipient])
+    message.attach_alternative(html, 'text/html')
+    return message
+
+
+def _claim(limit: int, now: datetime) -> List[OutgoingEmail]:
+    with transaction.atomic():
+        OutgoingEmail.objects.filter(status='sending', send_after__lt=now - _SENDING_TIMEOUT).update(status='pending')
+        due = OutgoingEmail.objects.filter(status='pending', send_after__lte=now).order_by('send_after', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status condition keeps a concurrent sender from claiming the same rows where nothing was locked.
+        OutgoingEmail.objects.filter(id__in=ids, status='pending').update(status='sending', send_after=now)
+    return list(OutgoingEmail.objects.filter(id__in=ids, status='sending', send_after=now).order_by('id'))
+
+
+def _defer_over_recipient_limit(emails: List[OutgoingEmail], now: datetime) -> List[OutgoingEmail]:
+    """Put back the emails that would exceed the per recipient limit and return the others."""
+    window_start = now - timedelta(seconds=APPOINTMENT_EMAIL_RECIPIENT_WINDOW)
+    counts = Counter(dict(OutgoingEmail.objects.filter(
+        recipient__in={email.recipient for email in emails}, status='sent', sent_at__gte=window_start
+    ).values('recipient').annotate(n=Count('id')).values_list('recipient', 'n')))
+    allowed, deferred = [], []
+    for email in emails:
+        if counts[email.recipient] >= APPOINTMENT_EMAIL_MAX_PER_RECIPIENT:
+            deferred.append(email.id)
+        else:
+            counts[email.recipient] += 1
+            allowed.append(email)
+    if deferred:
+        OutgoingEmail.objects.filter(id__in=deferred).update(
+            status='pending', send_after=now + timedelta(seconds=APPOINTMENT_EMAIL_RECIPIENT_WINDOW))
+        _logger.info(f"Deferred {len(deferred)} emails over the per recipient limit")
+    return allowed
+
+
+def _send_batch(emails: List[OutgoingEmail], now: datetime) -> int:
+    """Send a batch over one connection and record the outcome of every email."""
+    sent, failed = [], []
+    backend = get_connection()
+    try:
+        backend.open()
+        for email in emails:
+            try:
+                if backend.send_messages([render_email(email)]):
+                    sent.append(email.id)
+                else:
+                    failed.append((email, "Rejected by the email backend"))
+            except Exception as e:
+                failed.append((email, str(e)))
+    except Exception as e:
+        # The connection could not be opened: nothing of the batch was sent.
+        done = set(sent) | {email.id for email, _ in failed}
+        failed.extend((email, str(e)) for email in emails if email.id not in done)
+    finally:
+        try:
+            backend.close()
+        except Exception as e:
+            _logger.warning(f"Error closing the email connection: {e}")
+
+    if sent:
+        OutgoingEmail.objects.filter(id__in=sent).update(status='sent', sent_at=now, last_error='')
+    for email, error in failed:
+        attempts = email.attempts + 1
+        if attempts < APPOINTMENT_EMAIL_MAX_ATTEMPTS:
+            fields = {'status': 'pending', 'send_after': now + retry_delay(attempts)}
+        else:
+            fields = {'status': 'failed'}
+        OutgoingEmail.objects.filter(id=email.id).update(attempts=attempts, last_error=error, **fields)
+    if failed:
+        _logger.warning(f"{len(failed)} emails of a batch of {len(emails)} could not be sent: {failed[0][1]}")
+    return len(sent)
+
+
+def send_pending_emails(batch_size: int = APPOINTMENT_EMAIL_BATCH_SIZE, now: Optional[datetime] = None) -> int:
+    """Send the due emails of the outbox, one connection per batch, within the rate limits. Runs as a task.
+
+    When emails remain, the sender task is queued again for when the next one is due or the rate allows.
+
+    :param batch_size: Maximum number of emails per connection.
+    :param now: Current time.
+    :return: The number of emails sent.
+    """
+    now = now or timezone.now()
+    total = 0
+    resume_at = now
+    while True:
+        budget = APPOINTMENT_EMAIL_MAX_PER_MINUTE - OutgoingEmail.objects.filter(
+            status='sent', sent_at__gt=now - timedelta(minutes=1)).count()
+        if budget <= 0:
+            resume_at = now + timedelta(minutes=1)
+            break
+        claimed = _claim(min(batch_size, budget), now)
+        if not claimed:
+            break
+        allowed = _defer_over_recipient_limit(claimed, now)
+        if allowed:
+            total += _send_batch(allowed, now)
+
+    if total:
+        _logger.info(f"Sent {total} emails from the outbox")
+    next_due = OutgoingEmail.objects.filter(status='pending').aggregate(first=Min('send_after'))['first']
+    if next_due is not None:
+        schedule_sender(max(next_due, resume_at))
+    return total
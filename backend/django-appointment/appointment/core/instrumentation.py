@@ -0,0 +1,192 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from django.db import connections, transaction
+
+from appointment.logger_config import get_logger
+from appointment.settings import APPOINTMENT_INSTRUMENTATION_FLUSH_INTERVAL, APPOINTMENT_INSTRUMENTATION_TOP_DUPLICATES
+
+_logger = get_logger(__name__)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint_sql(sql: str) -> str:
+    """Normalize a SQL statement so that queries differing only in their parameters share a fingerprint."""
+    sql = _LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that counts, times and fingerprints the queries of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_ms = 0.0
+        self.fingerprints: Counter = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.fingerprints[fingerprint_sql(sql)] += 1
+
+    def duplicates(self) -> Dict[str, int]:
+        """Return the fingerprints executed more than once, with the number of extra executions."""
+        return {fp: n - 1 for fp, n in self.fingerprints.items() if n > 1}
+
+
+class _EndpointStats:
+    __slots__ = ('requests', 'total_ms', 'max_ms', 'queries', 'max_queries', 'sql_ms', 'duplicates')
+
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_ms = 0.0
+        self.duplicates: Counter = Counter()
+
+    def merge(self, other: '_EndpointStats'):
+        self.requests += other.requests
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.queries += other.queries
+        self.max_queries = max(self.max_queries, other.max_queries)
+        self.sql_ms += other.sql_ms
+        self.duplicates.update(other.duplicates)
+
+
+class StatsAggregator:
+    """Per-process aggregation of endpoint statistics, merged into ``EndpointMetric`` rows on flush."""
+
+    def __init__(self, flush_interval: float = APPOINTMENT_INSTRUMENTATION_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _EndpointStats] = {}
+        self._last_flush = time.monotonic()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._scheduled: Optional[Future] = None
+
+    def record(self, url_name: str, elapsed_ms: float, recorder: QueryRecorder):
+        with self._lock:
+            stats = self._stats.get(url_name)
+            if stats is None:
+                stats = self._stats[url_name] = _EndpointStats()
+            stats.requests += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.queries += recorder.count
+            stats.max_queries = max(stats.max_queries, recorder.count)
+            stats.sql_ms += recorder.sql_ms
+            stats.duplicates.update(recorder.duplicates())
+
+    def should_flush(self) -> bool:
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush_in_background(self) -> Future:
+        """Schedule :meth:`flush` on a background thread of this process, unless one is already scheduled, so that
+        no request waits on the database writes.
+
+        :return: The future of the scheduled flush.
+        """
+        with self._lock:
+            if self._scheduled is not None and not self._scheduled.done():
+                return self._scheduled
+            # Counted from now: requests arriving meanwhile do not schedule another flush.
+            self._last_flush = time.monotonic()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='endpoint-metrics')
+            self._scheduled = self._executor.submit(self._flush_and_close)
+            return self._scheduled
+
+    def _flush_and_close(self):
+        try:
+            self.flush()
+        finally:
+            # The pool thread outlives the request cycle that would otherwise close its connection.
+            connections.close_all()
+
+    def flush(self):
+        """Merge the pending statistics into the database and reset them. If the write fails, they are kept for the
+        next flush."""
+        from appointment.models import EndpointMetric
+
+        with self._lock:
+            pending, self._stats = self._stats, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            with transaction.atomic():
+                existing = {m.url_name: m for m in EndpointMetric.objects.select_for_update().filter(
+                    url_name__in=pending)}
+                for url_name, stats in pending.items():
+                    metric = existing.get(url_name) or EndpointMetric(url_name=url_name)
+                    metric.requests += stats.requests
+                    metric.total_ms += stats.total_ms
+                    metric.max_ms = max(metric.max_ms, stats.max_ms)
+                    metric.queries += stats.queries
+                    metric.max_queries = max(metric.max_queries, stats.max_queries)
+                    metric.sql_ms += stats.sql_ms
+                    duplicates = Counter(metric.duplicate_queries)
+                    duplicates.update(stats.duplicates)
+                    metric.duplicate_queries = dict(duplicates.most_common(APPOINTMENT_INSTRUMENTATION_TOP_DUPLICATES))
+                    metric.save()
+        except Exception as e:
+            _logger.error(f"Could not flush endpoint metrics: {e}")
+            # Merged with what was recorded meanwhile, so that no request is lost.
+            with self._lock:
+                for url_name, stats in pending.items():
+                    current = self._stats.get(url_name)
+                    if current is None:
+                        self._stats[url_name] = stats
+                    else:
+                        current.merge(stats)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+aggregator = StatsAggregator()
+
+
+def get_endpoint_report(top: Optional[int] = None, sort: str = 'total') -> List[dict]:
+    """Flush this process and return the endpoint statistics, most expensive first.
+
+    :param top: Maximum number of endpoints to return.
+    :param sort: ``total`` (total time), ``mean`` (mean latency), ``queries`` (mean query count) or
+                 ``duplicates`` (repeated queries).
+    :return: One dict per endpoint, see ``EndpointMetric.to_dict``.
+    """
+    from appointment.models import EndpointMetric
+
+    aggregator.flush()
+    keys = {
+        'total': lambda m: m.total_ms,
+        'mean': lambda m: m.get_mean_ms(),
+        'queries': lambda m: m.get_mean_queries(),
+        'duplicates': lambda m: sum(m.duplicate_queries.values()),
+    }
+    if sort not in keys:
+        raise ValueError(f"Unknown sort '{sort}', expected one of {', '.join(keys)}")
+    metrics = sorted(EndpointMetric.objects.all(), key=keys[sort], reverse=True)
+    return [m.to_dict() for m in metrics[:top]]
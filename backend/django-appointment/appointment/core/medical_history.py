@@ -0,0 +1,241 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Medical history PDFs, rendered in the background and cached on disk.
+
+A PDF is stored under ``APPOINTMENT_PDF_CACHE_DIR/<client id>/<version>.pdf``, where the version is a hash of the
+client and medical record fields shown in the report and of the report template. Any edit of those changes the
+version, so a cached file is never stale and repeat downloads are served from disk. Missing PDFs are rendered by a
+task of the task queue (run ``manage.py run_tasks --processes`` so that WeasyPrint runs on a process pool, not in
+the web workers); callers poll :func:`get_history_pdfs` until the PDF is ready. :func:`stream_histories_zip` streams
+many cached PDFs as a ZIP archive, a chunk at a time.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template, render_to_string
+
+from appointment.core.task_queue import enqueue
+from appointment.logger_config import get_logger
+from appointment.models import Client, MedicalRecord, Task
+from appointment.settings import APPOINTMENT_PDF_CACHE_DIR, APPOINTMENT_PDF_MAX_ATTEMPTS
+
+_logger = get_logger(__name__)
+
+RENDER_TASK = 'appointment.core.medical_history.render_history_pdf'
+TEMPLATE_NAME = 'reports/medical_report.html'
+DOCTOR_NAME = "Miquel Barón"
+
+# The fields shown in the report: a change of any of them makes a new version.
+_CLIENT_FIELDS = ('first_name', 'last_name', 'email', 'phone_number', 'date_of_birth', 'gender', 'address')
+_RECORD_FIELDS = ('blood_type', 'allergies', 'medical_conditions', 'medications', 'notes')
+
+_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class HistoryPdf:
+    client_id: int
+    version: str
+    status: str  # 'ready', 'pending' or 'failed'
+    path: str
+    error: str = ''
+
+
+@lru_cache(maxsize=None)
+def _template_digest() -> str:
+    """Hash of the report template, read once per process, so that editing it renders the PDFs again."""
+    return hashlib.sha256(get_template(TEMPLATE_NAME).template.source.encode()).hexdigest()
+
+
+def history_versions(client_ids: Iterable[int]) -> Dict[int, str]:
+    """Return the current version of the medical history of each existing client, in two queries.
+
+    :param client_ids: The clients.
+    :return: The versions by client id.
+    """
+    client_ids = list(client_ids)
+    records = {row[0]: row[1:] for row in MedicalRecord.objects.filter(client_id__in=client_ids).values_list(
+        'client_id', *_RECORD_FIELDS)}
+    versions = {}
+    for row in Client.objects.filter(id__in=client_ids).values_list('id', *_CLIENT_FIELDS):
+        data = json.dumps([_template_digest(), row[1:], records.get(row[0])], default=str)
+        versions[row[0]] = hashlib.sha256(data.encode()).hexdigest()[:32]
+    return versions
+
+
+def pdf_path(client_id: int, version: str) -> str:
+    return os.path.join(APPOINTMENT_PDF_CACHE_DIR, str(client_id), f"{version}.pdf")
+
+
+def get_history_pdfs(client_ids: Iterable[int], retry_failed: bool = True) -> Dict[int, HistoryPdf]:
+    """Return the state of the cached PDF of each client, queuing the rendering of those missing.
+
+    :param client_ids: The clients; unknown ids are left out of the result.
+    :param retry_failed: Queue the rendering again when the last one failed, instead of reporting it failed.
+    :return: The PDFs by client id.
+    """
+    pdfs, missing = {}, {}
+    for client_id, version in history_versions(client_ids).items():
+        path = pdf_path(client_id, version)
+        if os.path.exists(path):
+            pdfs[client_id] = HistoryPdf(client_id, version, 'ready', path)
+        else:
+            missing[client_id] = version
+    if not missing:
+        return pdfs
+
+    # The latest task for each missing version; done tasks are ignored, their file may have been removed since.
+    latest = {}
+    for task in Task.objects.filter(name=RENDER_TASK, status__in=('pending', 'running', 'failed'),
+                                    args__0__in=list(missing)).order_by('id').only('args', 'status', 'last_error'):
+        client_id, version = task.args[0], task.args[1]
+        if missing.get(client_id) == version:
+            latest[client_id] = task
+
+    for client_id, version in missing.items():
+        pdf = HistoryPdf(client_id, version, 'pending', pdf_path(client_id, version))
+        task = latest.get(client_id)
+        if task is not None and task.status == 'failed' and not retry_failed:
+            error = task.last_error.strip()
+            pdf.status, pdf.error = 'failed', error.splitlines()[-1] if error else ''
+        elif task is None or task.status == 'failed':
+            # Two requests racing here may both queue a rendering; the second one only finds the file rendered.
+            enqueue(RENDER_TASK, client_id, version, max_attempts=APPOINTMENT_PDF_MAX_ATTEMPTS)
+        pdfs[client_id] = pdf
+    return pdfs
+
+
+def get_history_pdf(client_id: int, retry_failed: bool = True) -> Optional[HistoryPdf]:
+    """Return the state of the cached PDF of one client, see :func:`get_history_pdfs`, or None if it does not exist."""
+    return get_history_pdfs([client_id], retry_failed).get(client_id)
+
+
+def _static_uri(path: str) -> str:
+    found = finders.find(path)
+    return Path(found).as_uri() if found else ''
+
+
+def render_pdf(html: str) -> bytes:
+    # Imported here: WeasyPrint needs system libraries that only the task workers must have.
+    from weasyprint import HTML
+    return HTML(string=html).write_pdf()
+
+
+def render_history_pdf(client_id: int, version: str) -> Optional[str]:
+    """Render the medical history of a client to the PDF cache. Runs as a background task.
+
+    The current data is rendered, under its current version, even if it changed since the task was queued. Older
+    versions of the client's PDF are removed.
+
+    :param client_id: The client.
+    :param version: The version the task was queued for.
+    :return: The path of the PDF, or None if the client no longer exists.
+    """
+    patient = Client.objects.filter(id=client_id).select_related('medical_record').first()
+    if patient is None:
+        return None
+    current = history_versions([client_id])[client_id]
+    if current != version:
+        _logger.info(f"Medical history of client {client_id} changed since it was queued, rendering the new version")
+    path = pdf_path(client_id, current)
+    if os.path.exists(path):
+        return path
+
+    html = render_to_string(TEMPLATE_NAME, {
+        "patient": patient,
+        "record": getattr(patient, "medical_record", None),
+        "generated": datetime.now().strftime("%d/%m/%Y %H:%M"),
+        # Read from disk by the worker: there is no request to build absolute URLs from.
+        "logo_url": _static_uri("img/logo_clinic.png"),
+        "doctor_signature_url": _static_uri("img/signature.png"),
+        "doctor_name": DOCTOR_NAME,
+    })
+    pdf = render_pdf(html)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Written to a temporary file and renamed, so that a reader never sees a partial PDF.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(pdf)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    for name in os.listdir(directory):
+        if name.endswith('.pdf') and name != os.path.basename(path):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    _logger.info(f"Rendered the medical history of client {client_id} ({len(pdf)} bytes)")
+    return path
+
+
+def history_filename(client_id: int) -> str:
+    return f"medical_history_{client_id}.pdf"
+
+
+class _ChunkWriter:
+    """A write-only file collecting what ``zipfile`` writes, so that it can be handed out in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def stream_histories_zip(pdfs: Iterable[HistoryPdf]) -> Iterator[bytes]:
+    """Yield a ZIP archive of cached PDFs a chunk at a time, reading each PDF from disk while it is written.
+
+    Memory use depends on the chunk size, not on the number or size of the PDFs. PDFs whose file was removed
+    meanwhile are left out.
+
+    :param pdfs: Ready PDFs.
+    """
+    out = _ChunkWriter()
+    # The writer cannot seek: sizes and checksums go in data descriptors after each file.
+    with zipfile.ZipFile(out, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for pdf in pdfs:
+            try:
+                source = open(pdf.path, 'rb')
+            except FileNotFoundError:
+                _logger.warning(f"Medical history PDF of client {pdf.client_id} vanished from the cache")
+                continue
+            with source, archive.open(history_filename(pdf.client_id), mode='w') as target:
+                while True:
+                    chunk = source.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = out.take()
+                    if data:
+                        yield data
+            data = out.take()
+            if data:
+                yield data
+    data = out.take()
+    if data:
+        yield data
@@ -1,7 +1,13 @@
 # core/middleware.py
 import json
+import time
+
+from django.db import connection
 from django.http import JsonResponse
 
+from appointment.core.instrumentation import QueryRecorder, aggregator
+
+
 class JsonExceptionMiddleware:
     """
     Middleware to return JSON for all uncaught exceptions.
@@ -15,3 +21,27 @@ class JsonExceptionMiddleware:
             return response
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Middleware that records the latency, SQL query count and repeated queries (N+1 patterns) of every request,
+    aggregated per URL name and flushed periodically to ``EndpointMetric`` from a background thread.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            url_name = match.view_name or match._func_path
+            aggregator.record(url_name, elapsed_ms, recorder)
+            if aggregator.should_flush():
+                aggregator.flush_in_background()
+        return response
@@ -0,0 +1,102 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+from datetime import time
+from math import ceil
+from typing import Iterable, List
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from appointment.settings import APPOINTMENT_OCCUPANCY_BIN_MINUTES
+
+# Fields of Appointment that decide which bins it occupies.
+OCCUPANCY_FIELDS = frozenset({'staff_member', 'staff_member_id', 'date', 'start_time', 'end_time'})
+
+
+class SlotUnavailableError(ValidationError, ValueError):
+    """
+    Raised when an appointment would occupy a slot bin already held by another appointment of the same staff
+    member. It is both a ``ValidationError`` and a ``ValueError`` so existing booking error handlers catch it.
+    """
+
+
+def _minutes(t: time) -> float:
+    return t.hour * 60 + t.minute + t.second / 60 + t.microsecond / 60_000_000
+
+
+def slot_bins(start_time: time, end_time: time, bin_minutes: int = APPOINTMENT_OCCUPANCY_BIN_MINUTES) -> range:
+    """Return the bins of the day covered by ``[start_time, end_time)``.
+
+    Bins are ``bin_minutes`` wide and numbered from midnight. Times off the bin grid are widened to whole bins, so
+    two appointments that share a bin are rejected even when their exact intervals only touch inside it.
+    """
+    first = int(_minutes(start_time) // bin_minutes)
+    stop = ceil(_minutes(end_time) / bin_minutes)
+    return range(first, max(first, stop))
+
+
+def _ledger_rows(appointments: Iterable) -> List:
+    from appointment.models import SlotOccupancy
+
+    return [
+        SlotOccupancy(staff_member_id=appt.staff_member_id, date=appt.date, bin=b, appointment_id=appt.pk)
+        for appt in appointments if appt.staff_member_id
+        for b in slot_bins(appt.start_time, appt.end_time)
+    ]
+
+
+def occupy_slots(appointments: Iterable):
+    """Insert the ledger rows of saved appointments that hold none yet (``bulk_create`` paths).
+
+    :raises SlotUnavailableError: If a bin is already held. Call inside the transaction that wrote the appointments
+                                  so that they are rolled back with the ledger.
+    """
+    from appointment.models import SlotOccupancy
+
+    rows = _ledger_rows(appointments)
+    try:
+        with transaction.atomic():
+            SlotOccupancy.objects.bulk_create(rows, batch_size=500)
+    except IntegrityError as e:
+        raise SlotUnavailableError("Requested appointment overlaps with an existing appointment for that staff.") from e
+
+
+def sync_slots(appointment):
+    """Make the ledger rows of a saved appointment match its current staff member, date and times."""
+    from appointment.models import SlotOccupancy
+
+    SlotOccupancy.objects.filter(appointment_id=appointment.pk).delete()
+    occupy_slots([appointment])
+
+
+def rebuild_ledger(batch_size: int = 1000) -> int:
+    """Rebuild the whole ledger from the appointments table.
+
+    Overlapping legacy appointments cannot all hold their bins: the later ones (by id) are skipped.
+
+    :return: The number of ledger rows written.
+    """
+    from appointment.models import Appointment, SlotOccupancy
+
+    written = 0
+    with transaction.atomic():
+        SlotOccupancy.objects.all().delete()
+        held = set()
+        rows = []
+        for appt in Appointment.objects.exclude(staff_member=None).order_by('id').only(
+                'id', 'staff_member_id', 'date', 'start_time', 'end_time').iterator(chunk_size=batch_size):
+            for row in _ledger_rows([appt]):
+                key = (row.staff_member_id, row.date, row.bin)
+                if key not in held:
+                    held.add(key)
+                    rows.append(row)
+            if len(rows) >= batch_size:
+                SlotOccupancy.objects.bulk_create(rows)
+                written += len(rows)
+                rows = []
+        SlotOccupancy.objects.bulk_create(rows)
+        written += len(rows)
+    return written
@@ -0,0 +1,215 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from appointment.core.availability import (
+    DAY_OFF, NO_WORKING_HOURS, OUTSIDE_WORKING_HOURS, OVERLAPS_APPOINTMENT, StaffSchedule
+)
+from appointment.core.availability_cache import invalidate_staff_day
+from appointment.core.availability_summary import refresh_staff_days
+from appointment.core.occupancy import occupy_slots
+from appointment.logger_config import get_logger
+from appointment.models import Appointment, SlotOccupancy, StaffMember
+from appointment.notifications.tasks import send_appointment_notification
+
+_logger = get_logger(__name__)
+
+NO_QUALIFIED_STAFF = "no other staff member offers the service"
+NO_FREE_STAFF = "no qualified staff member is free at that time"
+
+
+@dataclass
+class ReassignmentPlan:
+    """Proposed new staff member of each appointment affected by a day off."""
+    staff_member: StaffMember
+    start_date: date
+    end_date: date
+    assignments: List[Tuple[Appointment, StaffMember]] = field(default_factory=list)
+    unassigned: List[Tuple[Appointment, str]] = field(default_factory=list)
+    applied: bool = False
+
+    def to_dict(self) -> dict:
+        return {
+            "staff_member_id": self.staff_member.id,
+            "start_date": str(self.start_date),
+            "end_date": str(self.end_date),
+            "applied": self.applied,
+            "assignments": [{
+                "appointment_id": appt.id,
+                "date": str(appt.date),
+                "start_time": str(appt.start_time),
+                "end_time": str(appt.end_time),
+                "service_id": appt.service_id,
+                "staff_member_id": staff.id,
+                "staff_name": staff.get_staff_member_name(),
+            } for appt, staff in self.assignments],
+            "unassigned": [{
+                "appointment_id": appt.id,
+                "date": str(appt.date),
+                "start_time": str(appt.start_time),
+                "reason": reason,
+            } for appt, reason in self.unassigned],
+        }
+
+
+def _free_reason(schedule: StaffSchedule, day: date, start: time, end: time,
+                 booked: List[Tuple[time, time]]) -> Optional[str]:
+    """Why a staff member cannot take ``[start, end)`` on ``day`` as it is, or None if they can.
+
+    Unlike a new booking, a reassigned appointment keeps its time, so only the working window matters, not the
+    slot grid of the new staff member.
+    """
+    hours = schedule.hours_for(day)
+    if not hours:
+        return NO_WORKING_HOURS
+    if schedule.is_day_off(day):
+        return DAY_OFF
+    if start < hours[0] or end > hours[1]:
+        return OUTSIDE_WORKING_HOURS
+    for booked_start, booked_end in booked:
+        if booked_start < end and booked_end > start:
+            return OVERLAPS_APPOINTMENT
+    return None
+
+
+def plan_reassignment(staff: StaffMember, start_date: date, end_date: date,
+                      now: Optional[datetime] = None) -> ReassignmentPlan:
+    """Find another staff member for every upcoming appointment of ``staff`` between two dates.
+
+    The roster is loaded once: the affected appointments, the staff members offering their services (one query on
+    the service link table, one for the staff members), their schedules (see :meth:`StaffSchedule.build_many`) and
+    their appointments over the range. Matching then runs in memory, day by day: the appointments with the fewest
+    candidates are placed first, each one on the candidate with the fewest appointments that day, lowest id first.
+    A placed appointment blocks its time for the following ones.
+
+    :param staff: The staff member who is off.
+    :param start_date: First day off.
+    :param end_date: Last day off, inclusive.
+    :param now: Reference time, defaults to the current local time. Appointments that already started are ignored.
+    :return: The plan, not applied.
+    """
+    now = now or timezone.localtime().replace(tzinfo=None)
+    plan = ReassignmentPlan(staff_member=staff, start_date=start_date, end_date=end_date)
+
+    affected = list(
+        Appointment.objects.filter(staff_member=staff, date__range=(start_date, end_date))
+        .filter(Q(date__gt=now.date()) | Q(date=now.date(), start_time__gte=now.time()))
+        .select_related('client', 'service').order_by('date', 'start_time', 'id')
+    )
+    if not affected:
+        return plan
+
+    link = StaffMember.services_offered.through
+    qualified: Dict[int, List[int]] = defaultdict(list)
+    for staff_id, service_id in link.objects.filter(
+            service_id__in={appt.service_id for appt in affected}).exclude(
+            staffmember_id=staff.id).values_list('staffmember_id', 'service_id'):
+        qualified[service_id].append(staff_id)
+    candidates = StaffMember.objects.select_related('user').in_bulk(
+        {staff_id for staff_ids in qualified.values() for staff_id in staff_ids})
+    schedules = StaffSchedule.build_many(candidates.values(), start_date, end_date)
+
+    booked: Dict[Tuple[int, date], List[Tuple[time, time]]] = defaultdict(list)
+    for staff_id, day, appt_start, appt_end in Appointment.objects.filter(
+            staff_member_id__in=list(candidates), date__range=(start_date, end_date)).values_list(
+            'staff_member_id', 'date', 'start_time', 'end_time'):
+        booked[(staff_id, day)].append((appt_start, appt_end))
+
+    by_day: Dict[date, List[Appointment]] = defaultdict(list)
+    for appt in affected:
+        by_day[appt.date].append(appt)
+
+    for day, appointments in by_day.items():
+        options: Dict[int, List[int]] = {}
+        reasons: Dict[int, str] = {}
+        for appt in appointments:
+            staff_ids = qualified.get(appt.service_id, [])
+            if not staff_ids:
+                reasons[appt.id] = NO_QUALIFIED_STAFF
+            options[appt.id] = sorted(
+                staff_id for staff_id in staff_ids
+                if _free_reason(schedules[staff_id], day, appt.start_time, appt.end_time,
+                                booked[(staff_id, day)]) is None)
+
+        load = {staff_id: len(booked[(staff_id, day)]) for staff_ids in options.values() for staff_id in staff_ids}
+        for appt in sorted(appointments, key=lambda a: (len(options[a.id]), a.start_time, a.id)):
+            free = [staff_id for staff_id in options[appt.id] if not any(
+                booked_start < appt.end_time and booked_end > appt.start_time
+                for booked_start, booked_end in booked[(staff_id, day)])]
+            if not free:
+                plan.unassigned.append((appt, reasons.get(appt.id, NO_FREE_STAFF)))
+                continue
+            chosen = min(free, key=lambda staff_id: (load[staff_id], staff_id))
+            booked[(chosen, day)].append((appt.start_time, appt.end_time))
+            load[chosen] += 1
+            plan.assignments.append((appt, candidates[chosen]))
+
+    plan.assignments.sort(key=lambda item: (item[0].date, item[0].start_time, item[0].id))
+    plan.unassigned.sort(key=lambda item: (item[0].date, item[0].start_time, item[0].id))
+    return plan
+
+
+def apply_reassignment(plan: ReassignmentPlan) -> ReassignmentPlan:
+    """Write a plan in one transaction: one ``bulk_update`` and the matching slot ledger rows.
+
+    The new staff members are notified once the transaction is committed.
+
+    :param plan: A plan from :func:`plan_reassignment`.
+    :return: The plan, marked as applied.
+    :raises SlotUnavailableError: If a booking made since planning took one of the slots; nothing is written.
+    """
+    if not plan.assignments:
+        plan.applied = True
+        return plan
+
+    appointments = []
+    touched = set()
+    with transaction.atomic():
+        SlotOccupancy.objects.filter(appointment_id__in=[appt.id for appt, _ in plan.assignments]).delete()
+        updated_at = timezone.now()
+        for appt, staff in plan.assignments:
+            touched.add((appt.staff_member_id, appt.date))
+            appt.staff_member = staff
+            appt.updated_at = updated_at
+            touched.add((staff.id, appt.date))
+            appointments.append(appt)
+        Appointment.objects.bulk_update(appointments, ['staff_member', 'updated_at'], batch_size=500)
+        occupy_slots(appointments)
+
+        def after_commit():
+            for staff_id, day in touched:
+                invalidate_staff_day(staff_id, day)
+            refresh_staff_days(touched)
+            for appt in appointments:
+                send_appointment_notification(appt, "appointment.reassigned")
+        transaction.on_commit(after_commit)
+
+    plan.applied = True
+    _logger.info(f"Day off of staff {plan.staff_member.id}: {len(plan.assignments)} appointments reassigned, "
+                 f"{len(plan.unassigned)} left unassigned")
+    return plan
+
+
+def reassign_day_off(staff: StaffMember, start_date: date, end_date: date, apply: bool = False,
+                     now: Optional[datetime] = None) -> ReassignmentPlan:
+    """Plan, and optionally apply, the reassignment of the appointments of a day off.
+
+    :param staff: The staff member who is off.
+    :param start_date: First day off.
+    :param end_date: Last day off, inclusive.
+    :param apply: Write the plan.
+    :param now: See :func:`plan_reassignment`.
+    :return: The plan.
+    """
+    plan = plan_reassignment(staff, start_date, end_date, now)
+    return apply_reassignment(plan) if apply else plan
@@ -0,0 +1,160 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+from dateutil.rrule import rrulestr
+from django.db import transaction
+
+from appointment.core.availability import StaffSchedule, start_conflict
+from appointment.core.availability_cache import invalidate_staff
+from appointment.core.availability_summary import refresh_staff_days
+from appointment.core.occupancy import occupy_slots
+from appointment.logger_config import get_logger
+from appointment.models import Appointment, AppointmentSeries, Client, Service, StaffMember
+from appointment.settings import APPOINTMENT_SERIES_MAX_HORIZON_DAYS, APPOINTMENT_SERIES_MAX_OCCURRENCES
+
+_logger = get_logger(__name__)
+
+IN_THE_PAST = "in the past"
+
+
+@dataclass
+class SeriesPlan:
+    """Occurrences of a series split into the ones that can be booked and the conflicting ones."""
+    bookable: List[Tuple[date, time, time]] = field(default_factory=list)
+    conflicts: List[Tuple[date, str]] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "bookable": [{"date": str(day), "start_time": str(start), "end_time": str(end)}
+                         for day, start, end in self.bookable],
+            "conflicts": [{"date": str(day), "reason": reason} for day, reason in self.conflicts],
+        }
+
+
+def expand_occurrences(rule: str, start_date: date, start_time: time,
+                       until: Optional[date] = None) -> List[date]:
+    """Expand a recurrence rule into the dates of its occurrences.
+
+    The expansion is bounded by ``until`` (inclusive), ``APPOINTMENT_SERIES_MAX_HORIZON_DAYS`` after
+    ``start_date`` and ``APPOINTMENT_SERIES_MAX_OCCURRENCES``, so unbounded rules are safe.
+
+    :param rule: RFC 5545 recurrence rule, with or without the ``RRULE:`` prefix, e.g. ``FREQ=WEEKLY;COUNT=20``.
+    :param start_date: First candidate date (DTSTART).
+    :param start_time: Start time of every occurrence.
+    :param until: Optional last date of the horizon.
+    :return: Sorted occurrence dates.
+    :raises ValueError: If the rule cannot be parsed.
+    """
+    horizon = start_date + timedelta(days=APPOINTMENT_SERIES_MAX_HORIZON_DAYS)
+    if until is not None:
+        horizon = min(horizon, until)
+    rule = rule.strip()
+    if rule.upper().startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    try:
+        recurrence = rrulestr(rule, dtstart=datetime.combine(start_date, start_time))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid recurrence rule '{rule}': {e}")
+
+    dates = []
+    for occurrence in recurrence:
+        if occurrence.date() > horizon or len(dates) >= APPOINTMENT_SERIES_MAX_OCCURRENCES:
+            break
+        dates.append(occurrence.date())
+    return dates
+
+
+def plan_series(staff: StaffMember, service: Service, start_time: time, dates: List[date],
+                now: Optional[datetime] = None) -> SeriesPlan:
+    """Check every occurrence against the staff member's working hours, days off and appointments.
+
+    The whole span is loaded with one query for working hours, one for days off and one range query for the
+    appointments, whatever the number of occurrences. Occurrences follow the same rules as single bookings
+    (see :func:`appointment.core.availability.start_conflict`).
+
+    :param staff: The staff member.
+    :param service: The service to book.
+    :param start_time: Start time of every occurrence.
+    :param dates: Occurrence dates, sorted.
+    :param now: Reference time, defaults to ``datetime.now()``.
+    :return: The plan.
+    """
+    plan = SeriesPlan()
+    if not dates:
+        return plan
+    now = now or datetime.now()
+    first, last = dates[0], dates[-1]
+    schedule = StaffSchedule.build(staff, first, last)
+
+    booked = {}
+    for day, appt_start, appt_end in Appointment.objects.filter(
+            staff_member=staff, date__range=(first, last)).values_list('date', 'start_time', 'end_time'):
+        booked.setdefault(day, []).append((appt_start, appt_end))
+
+    for day in dates:
+        start = datetime.combine(day, start_time)
+        end = start + service.duration
+        if day < now.date():
+            reason = IN_THE_PAST
+        elif end.date() != day:
+            reason = "ends after midnight"
+        else:
+            reason = start_conflict(schedule, day, start, service.duration, booked.get(day, ()), now)
+        if reason:
+            plan.conflicts.append((day, reason))
+        else:
+            plan.bookable.append((day, start_time, end.time()))
+    return plan
+
+
+def book_series(client: Client, service: Service, staff: StaffMember, rule: str, start_date: date,
+                start_time: time, until: Optional[date] = None, additional_info: str = '',
+                dry_run: bool = False) -> Tuple[Optional[AppointmentSeries], List[Appointment], SeriesPlan]:
+    """Expand a recurrence rule, book the occurrences that fit and report the conflicting ones.
+
+    The valid occurrences are written with one ``bulk_create`` together with their slot ledger rows, in the
+    transaction that creates the series. Like other bulk writes, they send no notification.
+
+    :param client: The client.
+    :param service: The service to book.
+    :param staff: The staff member.
+    :param rule: RFC 5545 recurrence rule, see :func:`expand_occurrences`.
+    :param start_date: First candidate date.
+    :param start_time: Start time of every occurrence.
+    :param until: Optional last date of the horizon.
+    :param additional_info: Copied to every appointment.
+    :param dry_run: Only plan, write nothing.
+    :return: The series (None on dry run), the created appointments and the plan.
+    :raises ValueError: If the rule is invalid or no occurrence can be booked.
+    :raises SlotUnavailableError: If a concurrent booking took one of the slots; nothing is written.
+    """
+    dates = expand_occurrences(rule, start_date, start_time, until)
+    if not dates:
+        raise ValueError("The recurrence rule has no occurrence in the horizon")
+    plan = plan_series(staff, service, start_time, dates)
+    if dry_run:
+        return None, [], plan
+    if not plan.bookable:
+        raise ValueError("None of the occurrences can be booked")
+
+    with transaction.atomic():
+        series = AppointmentSeries.objects.create(client=client, service=service, staff_member=staff, rule=rule,
+                                                  start_date=start_date, start_time=start_time,
+                                                  additional_info=additional_info)
+        appointments = Appointment.objects.bulk_create([
+            Appointment(client=client, service=service, staff_member=staff, date=day, start_time=start,
+                        end_time=end, series=series, additional_info=additional_info)
+            for day, start, end in plan.bookable
+        ])
+        occupy_slots(appointments)
+        transaction.on_commit(lambda: invalidate_staff(staff.id))
+        transaction.on_commit(lambda: refresh_staff_days((staff.id, appt.date) for appt in appointments))
+
+    _logger.info(f"Series {series.id}: {len(appointments)} appointments booked, {len(plan.conflicts)} conflicts")
+    return series, appointments, plan
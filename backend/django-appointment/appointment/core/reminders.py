@@ -0,0 +1,180 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Appointment reminders, driven by the indexed ``Appointment.reminder_at`` column.
+
+``Appointment.save()`` keeps ``reminder_at`` in step with the start time, so booking, rescheduling or cancelling a
+reminder is a column update. A single scheduler loop (``manage.py run_reminders``) claims the reminders that are
+due with one range query on the partial index, a batch at a time, and hands each batch to the task queue, which
+queues its emails in the outbox (see :mod:`appointment.core.email_outbox`). Its cost per tick depends on the batch
+size, not on the number of upcoming appointments; between ticks it sleeps until the next due reminder.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from appointment.core.email_outbox import Email, queue_emails
+from appointment.core.task_queue import enqueue
+from appointment.logger_config import get_logger
+from appointment.models import Appointment
+from appointment.settings import (
+    APPOINTMENT_REMINDER_BATCH_SIZE, APPOINTMENT_REMINDER_MAX_SLEEP, APPOINTMENT_REMINDER_POLL_INTERVAL
+)
+
+_logger = get_logger(__name__)
+
+
+def _start(appointment: Appointment) -> datetime:
+    start = appointment.get_start_time()
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def set_reminder(appointment: Appointment, want_reminder: bool = True):
+    """Turn the reminder of an appointment on or off; ``reminder_at`` follows on save."""
+    appointment.want_reminder = want_reminder
+    appointment.save(update_fields=['want_reminder', 'updated_at'])
+
+
+def claim_due_reminders(limit: int = APPOINTMENT_REMINDER_BATCH_SIZE, now: Optional[datetime] = None) -> List[int]:
+    """Mark up to ``limit`` due reminders as sent and return the ids of their appointments, oldest first.
+    See :func:`_process_due_reminders`.
+
+    :param limit: Maximum number of reminders to claim.
+    :param now: Current time.
+    :return: The ids of the appointments to remind.
+    """
+    return _process_due_reminders(limit, now)[0]
+
+
+def _process_due_reminders(limit: int, now: Optional[datetime] = None) -> Tuple[List[int], int]:
+    """Claim up to ``limit`` due reminders, oldest first.
+
+    Reminders of appointments that already started are dropped without being sent. Rows whose ``reminder_at`` is
+    stale (written by a bulk update that bypassed ``save()``) are rescheduled instead.
+
+    :param limit: Maximum number of reminders to process.
+    :param now: Current time.
+    :return: The ids of the appointments to remind, and the number of rows processed, dropped and moved included.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = Appointment.objects.filter(reminder_at__lte=now).order_by('reminder_at', 'id').only(
+            'id', 'date', 'start_time', 'want_reminder', 'reminder_at', 'reminder_sent_at')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        claimed, dropped, moved = [], [], []
+        for appointment in due[:limit]:
+            expected = appointment.compute_reminder_at()
+            if expected is None or expected > now:
+                appointment.reminder_at = expected
+                moved.append(appointment)
+            elif _start(appointment) <= now:
+                dropped.append(appointment.id)
+            else:
+                claimed.append(appointment.id)
+        if claimed:
+            Appointment.objects.filter(id__in=claimed).update(reminder_at=None, reminder_sent_at=now)
+        if dropped:
+            Appointment.objects.filter(id__in=dropped).update(reminder_at=None)
+        if moved:
+            Appointment.objects.bulk_update(moved, ['reminder_at'])
+    if dropped:
+        _logger.warning(f"Dropped {len(dropped)} reminders of appointments that already started")
+    return claimed, len(claimed) + len(dropped) + len(moved)
+
+
+def next_reminder_at() -> Optional[datetime]:
+    """Return when the earliest pending reminder is due, possibly already, from the index."""
+    return Appointment.objects.filter(reminder_at__isnull=False).order_by('reminder_at').values_list(
+        'reminder_at', flat=True).first()
+
+
+def send_reminder_emails(appointment_ids: Iterable[int]) -> int:
+    """Queue the reminder emails of some appointments in the outbox, which sends them one connection per batch.
+    Runs as a background task.
+
+    :param appointment_ids: The appointments to remind.
+    :return: The number of emails queued.
+    """
+    appointments = Appointment.objects.filter(id__in=list(appointment_ids), client__isnull=False).select_related(
+        'client', 'service', 'staff_member__user').order_by('date', 'start_time')
+    emails = []
+    for appointment in appointments:
+        day, start = appointment.date.strftime('%d/%m/%Y'), appointment.start_time.strftime('%H:%M')
+        emails.append(Email(
+            recipient=appointment.client.email,
+            subject=_("Reminder: your appointment on %(date)s") % {'date': day},
+            template_name='mail/reminder_email.html',
+            context={
+                'first_name': appointment.client.first_name,
+                'service': appointment.get_service_name(),
+                'date': day,
+                'start_time': start,
+                'staff': appointment.staff_member.get_staff_member_name() if appointment.staff_member else "",
+            },
+            # A retried task, or a reminder claimed twice, does not email the client twice.
+            dedup_key=f"reminder:{appointment.id}:{appointment.date.isoformat()}:{start}",
+        ))
+    queued = queue_emails(emails)
+    _logger.info(f"Queued {queued} appointment reminders")
+    return queued
+
+
+class ReminderScheduler:
+    """Claims due reminders a batch at a time and queues one email task per batch."""
+
+    def __init__(self, batch_size: int = APPOINTMENT_REMINDER_BATCH_SIZE,
+                 max_sleep: float = APPOINTMENT_REMINDER_MAX_SLEEP,
+                 poll_interval: float = APPOINTMENT_REMINDER_POLL_INTERVAL):
+        self.batch_size = max(1, batch_size)
+        self.max_sleep = max_sleep
+        self.poll_interval = min(poll_interval, max_sleep)
+        self._stopped = threading.Event()
+        self._processed = 0
+
+    def stop(self):
+        self._stopped.set()
+
+    def tick(self, now: Optional[datetime] = None) -> int:
+        """Claim one batch of due reminders and queue its emails.
+
+        :return: The number of reminders claimed.
+        """
+        with transaction.atomic():
+            claimed, self._processed = _process_due_reminders(self.batch_size, now)
+            if claimed:
+                # Queued in the same transaction: a claimed reminder is never lost between the two writes.
+                enqueue(send_reminder_emails, claimed)
+        return len(claimed)
+
+    def seconds_until_next(self, now: Optional[datetime] = None) -> float:
+        now = now or timezone.now()
+        upcoming = next_reminder_at()
+        if upcoming is None:
+            return self.max_sleep
+        return min(max((upcoming - now).total_seconds(), 0), self.max_sleep)
+
+    def run(self, once: bool = False) -> int:
+        """Send reminders until :meth:`stop` is called, or with ``once`` until none is due.
+
+        :return: The number of reminders queued.
+        """
+        queued = 0
+        while not self._stopped.is_set():
+            queued += self.tick()
+            wait = self.seconds_until_next()
+            if not self._processed:
+                # Due rows that could not be processed are locked by another scheduler: do not spin on them.
+                wait = max(wait, self.poll_interval)
+            if wait > 0:
+                if once:
+                    break
+                self._stopped.wait(wait)
+        return queued
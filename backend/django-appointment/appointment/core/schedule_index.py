@@ -0,0 +1,215 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Per-process index of the weekly working hours and the days off of every staff member.
+
+Working hours and days off change rarely but are read on every availability computation and booking check. The
+index keeps them in memory, with the days off of each staff member as a sorted array of ranges, so membership
+checks are bisections instead of queries. Like the cached config, it is tagged with a shared version key that the
+``WorkingHours`` and ``DayOff`` signals bump; a process notices the change within
+``APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL`` seconds and rebuilds the index on its next read.
+"""
+
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, time as dtime
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from appointment.settings import APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL
+
+_VERSION_KEY = 'schedule_index:version'
+
+DayOffRange = Tuple[date, date, int]
+
+
+class _StaffDaysOff:
+    """Days off of one staff member: the raw ranges sorted by start and their merged union."""
+    __slots__ = ('ranges', 'range_starts', 'merged', 'merged_starts')
+
+    def __init__(self, ranges: List[DayOffRange]):
+        self.ranges = sorted(ranges)
+        self.range_starts = [start for start, _, _ in self.ranges]
+        self.merged: List[Tuple[date, date]] = []
+        for start, end, _ in self.ranges:
+            if self.merged and start <= self.merged[-1][1]:
+                if end > self.merged[-1][1]:
+                    self.merged[-1] = (self.merged[-1][0], end)
+            else:
+                self.merged.append((start, end))
+        self.merged_starts = [start for start, _ in self.merged]
+
+    def overlaps(self, start_date: date, end_date: date, exclude_id: Optional[int] = None) -> bool:
+        if exclude_id is None:
+            index = bisect_right(self.merged_starts, end_date) - 1
+            return index >= 0 and self.merged[index][1] >= start_date
+        # Only the ranges starting on or before ``end_date`` can overlap.
+        return any(end >= start_date and day_off_id != exclude_id
+                   for _, end, day_off_id in self.ranges[:bisect_right(self.range_starts, end_date)])
+
+
+_NO_DAYS_OFF = _StaffDaysOff([])
+
+
+class ScheduleIndex:
+    """Immutable snapshot of the ``WorkingHours`` and ``DayOff`` tables."""
+    __slots__ = ('version', '_working_hours', '_days_off')
+
+    def __init__(self, version: Optional[int], working_hours: Dict[int, Dict[int, Tuple[dtime, dtime]]],
+                 days_off: Dict[int, List[DayOffRange]]):
+        self.version = version
+        self._working_hours = working_hours
+        self._days_off = {staff_id: _StaffDaysOff(ranges) for staff_id, ranges in days_off.items()}
+
+    @classmethod
+    def load(cls, version: Optional[int] = None) -> 'ScheduleIndex':
+        """Build the index with one query per table."""
+        from appointment.models import DayOff, WorkingHours
+
+        working_hours: Dict[int, Dict[int, Tuple[dtime, dtime]]] = defaultdict(dict)
+        for staff_id, day_of_week, start_time, end_time in WorkingHours.objects.order_by('id').values_list(
+                'staff_member_id', 'day_of_week', 'start_time', 'end_time'):
+            # Like ``.first()`` on the table, the oldest row wins if a day was entered twice.
+            working_hours[staff_id].setdefault(day_of_week, (start_time, end_time))
+        days_off: Dict[int, List[DayOffRange]] = defaultdict(list)
+        for day_off_id, staff_id, start_date, end_date in DayOff.objects.values_list(
+                'id', 'staff_member_id', 'start_date', 'end_date'):
+            days_off[staff_id].append((start_date, end_date, day_off_id))
+        return cls(version, dict(working_hours), dict(days_off))
+
+    def working_hours(self, staff_id: int) -> Dict[int, Tuple[dtime, dtime]]:
+        """Return the ``{day_of_week: (start_time, end_time)}`` working hours of a staff member."""
+        return self._working_hours.get(staff_id, {})
+
+    def hours_for(self, staff_id: int, day_of_week: int) -> Optional[Tuple[dtime, dtime]]:
+        return self._working_hours.get(staff_id, {}).get(day_of_week)
+
+    def is_working_day(self, staff_id: int, day_of_week: int) -> bool:
+        return day_of_week in self._working_hours.get(staff_id, {})
+
+    def days_off(self, staff_id: int, start_date: Optional[date] = None,
+                 end_date: Optional[date] = None) -> List[Tuple[date, date]]:
+        """Return the ``(start_date, end_date)`` days off of a staff member, optionally those overlapping a window."""
+        ranges = self._days_off.get(staff_id, _NO_DAYS_OFF).ranges
+        if start_date is not None and end_date is not None:
+            return [(start, end) for start, end, _ in ranges if start <= end_date and end >= start_date]
+        return [(start, end) for start, end, _ in ranges]
+
+    def is_day_off(self, staff_id: int, day: date) -> bool:
+        return self._days_off.get(staff_id, _NO_DAYS_OFF).overlaps(day, day)
+
+    def has_day_off_between(self, staff_id: int, start_date: date, end_date: date,
+                            exclude_id: Optional[int] = None) -> bool:
+        """Whether a day off of the staff member overlaps ``[start_date, end_date]``, ignoring ``exclude_id``."""
+        return self._days_off.get(staff_id, _NO_DAYS_OFF).overlaps(start_date, end_date, exclude_id)
+
+
+# (index, checked_at) of this process, replaced as a whole so readers never see a half update.
+_state = None
+
+
+def _new_version() -> int:
+    return time.time_ns()
+
+
+def _get_shared_version() -> int:
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+class _TransactionState:
+    """An index built inside the current transaction of a connection, which may contain uncommitted rows.
+
+    It is registered as an ``on_commit`` callback, which drops it: it is kept while the callback is pending, that is
+    until the transaction commits or the savepoint it was built in rolls back.
+    """
+    __slots__ = ('index', 'checked_at')
+
+    def __init__(self, index: ScheduleIndex, checked_at: float):
+        self.index = index
+        self.checked_at = checked_at
+
+    def is_pending(self) -> bool:
+        return any(entry[1] is self for entry in connection.run_on_commit)
+
+    def __call__(self):
+        if getattr(connection, '_schedule_index_state', None) is self:
+            connection._schedule_index_state = None
+
+
+def _get_transaction_index(now: float) -> ScheduleIndex:
+    """Return the index for a read inside a transaction, loaded at most once per transaction and shared version."""
+    global _state
+    state = getattr(connection, '_schedule_index_state', None)
+    if state is not None and not state.is_pending():
+        state = None
+    if state is not None and now - state.checked_at < APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL:
+        return state.index
+
+    version = _get_shared_version()
+    process_state = _state
+    if process_state is not None and process_state[0].version == version:
+        _state = (process_state[0], now)
+        return process_state[0]
+    if state is not None and state.index.version == version:
+        state.checked_at = now
+        return state.index
+
+    state = _TransactionState(ScheduleIndex.load(version), now)
+    connection._schedule_index_state = state
+    transaction.on_commit(state)
+    return state.index
+
+
+def get_schedule_index() -> ScheduleIndex:
+    """Return the schedule index of the current process, rebuilding it if the shared version moved.
+
+    An index built inside a transaction may contain uncommitted rows, so it is only kept for the rest of that
+    transaction, not for the rest of the process.
+
+    :return: The index.
+    """
+    global _state
+    now = time.monotonic()
+    state = _state
+    if state is not None and now - state[1] < APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL:
+        return state[0]
+    if connection.in_atomic_block:
+        return _get_transaction_index(now)
+
+    version = _get_shared_version()
+    if state is not None and state[0].version == version:
+        _state = (state[0], now)
+        return state[0]
+
+    index = ScheduleIndex.load(version)
+    _state = (index, now)
+    return index
+
+
+def _reset():
+    global _state
+    _state = None
+    connection._schedule_index_state = None
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, _new_version(), timeout=None)
+
+
+def invalidate_schedule_index():
+    """Drop the index of this process and tell the other processes to rebuild theirs.
+
+    Inside a transaction this is done again on commit, so a thread or process that rebuilt the index before the
+    commit does not keep a snapshot without the change.
+    """
+    _reset()
+    if connection.in_atomic_block:
+        transaction.on_commit(_reset)
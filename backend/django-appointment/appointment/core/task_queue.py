@@ -0,0 +1,237 @@
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Lightweight background tasks stored in the ``Task`` table and run by ``manage.py run_tasks``.
+
+A task is a call to a function given by its dotted path, with JSON arguments. Enqueuing inside a transaction only
+makes the task visible to workers once it commits. Workers claim due tasks in batches: with
+``select_for_update(skip_locked=True)`` where the database supports it (PostgreSQL, MySQL 8), so concurrent
+workers never wait on each other, and with a conditional update everywhere, so a task is never claimed twice, even
+on SQLite. Claimed tasks run on a thread or process pool; results are recorded by the worker loop, which retries
+failed attempts with an exponential backoff.
+"""
+
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from django.db import connection, connections, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from appointment.logger_config import get_logger
+from appointment.models import Task
+from appointment.settings import (
+    APPOINTMENT_TASK_BATCH_SIZE, APPOINTMENT_TASK_MAX_ATTEMPTS, APPOINTMENT_TASK_POLL_INTERVAL,
+    APPOINTMENT_TASK_RETRY_BACKOFF, APPOINTMENT_TASK_RETRY_MAX_BACKOFF, APPOINTMENT_TASK_TIMEOUT,
+    APPOINTMENT_TASK_WORKERS
+)
+
+_logger = get_logger(__name__)
+
+Outcome = Tuple[bool, float, str]
+
+
+def enqueue(func: Union[str, Callable], *args, run_at: Optional[datetime] = None, delay: Optional[timedelta] = None,
+            max_attempts: int = APPOINTMENT_TASK_MAX_ATTEMPTS, **kwargs) -> Task:
+    """Queue a call to ``func(*args, **kwargs)``.
+
+    :param func: The function, or its dotted path. It must be importable by the worker.
+    :param run_at: Do not run before this time.
+    :param delay: Do not run before this delay has passed; ignored if ``run_at`` is given.
+    :param max_attempts: Attempts before the task is marked failed.
+    :return: The stored task.
+    """
+    name = func if isinstance(func, str) else f"{func.__module__}.{func.__qualname__}"
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    return Task.objects.create(name=name, args=list(args), kwargs=kwargs, run_at=run_at, max_attempts=max_attempts)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Delay before retrying a task that has failed ``attempts`` times."""
+    return timedelta(seconds=min(APPOINTMENT_TASK_RETRY_BACKOFF * 2 ** max(attempts - 1, 0),
+                                 APPOINTMENT_TASK_RETRY_MAX_BACKOFF))
+
+
+def claim_tasks(worker_id: str, limit: int, now: Optional[datetime] = None) -> List[Task]:
+    """Mark up to ``limit`` due tasks as running for ``worker_id`` and return them, oldest ``run_at`` first.
+
+    :param worker_id: Identifier of the claiming worker.
+    :param limit: Maximum number of tasks to claim.
+    :param now: Current time.
+    :return: The claimed tasks.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = Task.objects.filter(status='pending', run_at__lte=now).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        # The status condition keeps a concurrent worker from claiming the same rows where nothing was locked.
+        Task.objects.filter(id__in=ids, status='pending').update(
+            status='running', locked_by=worker_id, started_at=now, attempts=F('attempts') + 1)
+    return list(Task.objects.filter(id__in=ids, status='running', locked_by=worker_id, started_at=now)
+                .order_by('run_at', 'id'))
+
+
+def record_result(task: Task, outcome: Outcome, now: Optional[datetime] = None) -> str:
+    """Store the outcome of a claimed task: done, pending again after a backoff, or failed.
+
+    Nothing is written if the task was meanwhile requeued by :func:`requeue_stale_tasks`.
+
+    :param task: The task, as claimed.
+    :param outcome: ``(succeeded, duration_ms, error)``.
+    :param now: Current time.
+    :return: The new status.
+    """
+    now = now or timezone.now()
+    succeeded, duration_ms, error = outcome
+    if succeeded:
+        fields = {'status': 'done', 'last_error': ''}
+    elif task.attempts < task.max_attempts:
+        fields = {'status': 'pending', 'run_at': now + retry_delay(task.attempts), 'last_error': error}
+    else:
+        fields = {'status': 'failed', 'last_error': error}
+    Task.objects.filter(pk=task.pk, status='running', locked_by=task.locked_by, started_at=task.started_at).update(
+        locked_by='', finished_at=now, duration_ms=duration_ms, **fields)
+    if not succeeded:
+        _logger.warning(f"Task {task.pk} {task.name} failed (attempt {task.attempts}/{task.max_attempts}): "
+                        f"{error.strip().splitlines()[-1] if error.strip() else ''}")
+    return fields['status']
+
+
+def requeue_stale_tasks(now: Optional[datetime] = None) -> int:
+    """Count the running tasks not renewed by their worker for ``APPOINTMENT_TASK_TIMEOUT`` as failed attempts of a
+    lost worker. Live workers renew their tasks, see :meth:`Worker._renew`.
+
+    :param now: Current time.
+    :return: The number of tasks requeued or failed.
+    """
+    now = now or timezone.now()
+    stale = Task.objects.filter(status='running', started_at__lt=now - timedelta(seconds=APPOINTMENT_TASK_TIMEOUT))
+    error = f"Not renewed for {APPOINTMENT_TASK_TIMEOUT}s, worker presumed lost"
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', locked_by='', finished_at=now, last_error=error)
+    retried = stale.update(status='pending', locked_by='', run_at=now, last_error=error)
+    if failed or retried:
+        _logger.warning(f"Recovered {failed + retried} stale tasks ({failed} failed, {retried} requeued)")
+    return failed + retried
+
+
+def call_task(name: str, args: list, kwargs: dict) -> Outcome:
+    """Run one task function and time it. Runs in the pool, so it must not raise."""
+    start = time.perf_counter()
+    try:
+        import_string(name)(*args, **kwargs)
+        return True, (time.perf_counter() - start) * 1000, ''
+    except Exception:
+        return False, (time.perf_counter() - start) * 1000, traceback.format_exc()
+    finally:
+        # Pool threads and processes do not go through the request cycle that closes connections.
+        connections.close_all()
+
+
+def task_stats() -> List[dict]:
+    """Per task name: the number of tasks in each status and the mean and max duration of their last attempt."""
+    return list(Task.objects.values('name').annotate(
+        done=Count('id', filter=Q(status='done')),
+        failed=Count('id', filter=Q(status='failed')),
+        pending=Count('id', filter=Q(status='pending')),
+        running=Count('id', filter=Q(status='running')),
+        retried=Count('id', filter=Q(attempts__gt=1)),
+        mean_ms=Avg('duration_ms', filter=Q(status='done')),
+        max_ms=Max('duration_ms', filter=Q(status='done')),
+    ).order_by('name'))
+
+
+class Worker:
+    """
+    Claims due tasks and runs them on a pool of ``concurrency`` threads, or processes with ``processes=True``.
+
+    Only the loop thread touches the ``Task`` table, so bookkeeping writes never compete with each other. Process
+    pools are forked, which requires a POSIX system; elsewhere threads are used.
+    """
+
+    def __init__(self, concurrency: int = APPOINTMENT_TASK_WORKERS, processes: bool = False,
+                 batch_size: int = APPOINTMENT_TASK_BATCH_SIZE, poll_interval: float = APPOINTMENT_TASK_POLL_INTERVAL,
+                 worker_id: Optional[str] = None):
+        self.concurrency = max(1, concurrency)
+        self.processes = processes and 'fork' in multiprocessing.get_all_start_methods()
+        if processes and not self.processes:
+            _logger.warning("Process pools need the fork start method, running tasks on threads instead")
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping = False
+        self._renewed_at = time.monotonic()
+
+    def stop(self):
+        """Stop claiming tasks; the running ones are finished and recorded."""
+        self._stopping = True
+
+    def _renew(self, running: Dict[Future, Task]):
+        """Move the start of the tasks this worker is running to now, a few times per ``APPOINTMENT_TASK_TIMEOUT``,
+        so that long tasks of a live worker are not requeued as stale by :func:`requeue_stale_tasks`."""
+        if not running or time.monotonic() - self._renewed_at < APPOINTMENT_TASK_TIMEOUT / 3:
+            return
+        self._renewed_at = time.monotonic()
+        now = timezone.now()
+        tasks = list(running.values())
+        Task.objects.filter(id__in=[task.id for task in tasks], status='running', locked_by=self.worker_id).update(
+            started_at=now)
+        # record_result matches the row on started_at.
+        for task in tasks:
+            task.started_at = now
+
+    def _executor(self):
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.concurrency, mp_context=multiprocessing.get_context('fork'))
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='task')
+
+    def run(self, once: bool = False) -> int:
+        """Run tasks until :meth:`stop` is called, or with ``once`` until no task is due.
+
+        :return: The number of tasks run.
+        """
+        running: Dict[Future, Task] = {}
+        processed = 0
+        with self._executor() as executor:
+            while True:
+                if not self._stopping:
+                    self._renew(running)
+                    requeue_stale_tasks()
+                    free = self.concurrency - len(running)
+                    claimed = claim_tasks(self.worker_id, min(self.batch_size, free)) if free > 0 else []
+                    if claimed and self.processes:
+                        # Children are forked on demand and must not share the parent's connections.
+                        connections.close_all()
+                    for task in claimed:
+                        running[executor.submit(call_task, task.name, task.args, task.kwargs)] = task
+                if not running:
+                    if once or self._stopping:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+
+                finished, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        outcome = future.result()
+                    except Exception:
+                        # The pool itself failed, e.g. a child process died.
+                        outcome = (False, 0.0, traceback.format_exc())
+                    record_result(task, outcome)
+                    processed += 1
+        return processed
@@ -0,0 +1,66 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+from appointment.benchmarks.runner import build_report, compare_reports, run_benchmarks, write_report
+
+
+class Command(BaseCommand):
+    help = ("Generate a synthetic clinic in a throwaway test database, time the availability, booking and listing "
+            "paths and write the wall times and SQL query counts to a JSON file.")
+
+    def add_arguments(self, parser):
+        defaults = ClinicSpec()
+        parser.add_argument('--staff', type=int, default=defaults.staff_count)
+        parser.add_argument('--services', type=int, default=defaults.service_count)
+        parser.add_argument('--services-per-staff', type=int, default=defaults.services_per_staff)
+        parser.add_argument('--slot', type=int, default=defaults.slot_duration, help="Slot duration in minutes.")
+        parser.add_argument('--days', type=int, default=defaults.days)
+        parser.add_argument('--density', type=float, default=defaults.booking_density,
+                            help="Probability that a slot is booked (0-1).")
+        parser.add_argument('--days-off', type=float, default=defaults.days_off_ratio,
+                            help="Fraction of staff members with a day off in the window.")
+        parser.add_argument('--clients', type=int, default=defaults.client_count)
+        parser.add_argument('--start-date', type=date.fromisoformat, default=defaults.start_date)
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help="Previous JSON report to compare against.")
+
+    def handle(self, *args, **options):
+        spec = ClinicSpec(
+            staff_count=options['staff'], service_count=options['services'],
+            services_per_staff=options['services_per_staff'], slot_duration=options['slot'], days=options['days'],
+            booking_density=options['density'], days_off_ratio=options['days_off'], client_count=options['clients'],
+            start_date=options['start_date'], seed=options['seed'],
+        )
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            clinic = generate_clinic(spec)
+            self.stdout.write(f"Generated {len(clinic.staffs)} staff members, {len(clinic.services)} services and "
+                              f"{clinic.appointment_count} appointments on {connection.vendor}.")
+            report = build_report(clinic, run_benchmarks(clinic, options['repeat']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        write_report(report, options['output'])
+        for result in report['results']:
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f"{result['name']:<36} ERROR {result['error']}"))
+            else:
+                self.stdout.write(f"{result['name']:<36} mean {result['mean_ms']:>10.2f}ms  "
+                                  f"max {result['max_ms']:>10.2f}ms  queries {result['queries']}")
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fh:
+                baseline = json.load(fh)
+            for line in compare_reports(baseline, report):
+                self.stdout.write(line)
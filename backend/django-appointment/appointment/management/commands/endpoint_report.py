@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from appointment.core.instrumentation import get_endpoint_report
+
+
+class Command(BaseCommand):
+    help = "Print the slowest and most query-heavy endpoints recorded by QueryInstrumentationMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--sort', default='total', choices=['total', 'mean', 'queries', 'duplicates'])
+        parser.add_argument('--duplicates', action='store_true', help="Also list the repeated query fingerprints.")
+
+    def handle(self, *args, **options):
+        try:
+            report = get_endpoint_report(top=options['top'], sort=options['sort'])
+        except ValueError as e:
+            raise CommandError(e)
+        if not report:
+            self.stdout.write("No endpoint metrics recorded yet.")
+            return
+
+        self.stdout.write(f"{'endpoint':<40} {'requests':>9} {'mean ms':>10} {'max ms':>10} "
+                          f"{'queries':>8} {'max q':>6} {'sql ms':>9} {'dup q':>6}")
+        for row in report:
+            self.stdout.write(f"{row['url_name']:<40} {row['requests']:>9} {row['mean_ms']:>10.2f} "
+                              f"{row['max_ms']:>10.2f} {row['mean_queries']:>8.1f} {row['max_queries']:>6} "
+                              f"{row['mean_sql_ms']:>9.2f} {sum(row['duplicate_queries'].values()):>6}")
+            if options['duplicates']:
+                for fingerprint, count in row['duplicate_queries'].items():
+                    self.stdout.write(f"    x{count:<5} {fingerprint[:200]}")
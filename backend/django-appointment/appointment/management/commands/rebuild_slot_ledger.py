@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from appointment.core.occupancy import rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the slot occupancy ledger from the appointments table. Run it once after upgrading, or after "
+            "writing appointments with bulk operations that bypass Appointment.save().")
+
+    def handle(self, *args, **options):
+        written = rebuild_ledger()
+        self.stdout.write(self.style.SUCCESS(f"Slot ledger rebuilt: {written} bins held."))
@@ -0,0 +1,34 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from appointment.core.reminders import ReminderScheduler
+from appointment.settings import (
+    APPOINTMENT_REMINDER_BATCH_SIZE, APPOINTMENT_REMINDER_MAX_SLEEP, APPOINTMENT_REMINDER_POLL_INTERVAL
+)
+
+
+class Command(BaseCommand):
+    help = ("Queue the appointment reminders that are due, a batch at a time, for the run_tasks worker to send. "
+            "Run a single instance; it sleeps until the next reminder is due.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=APPOINTMENT_REMINDER_BATCH_SIZE,
+                            help="Reminders claimed per query and sent per email task.")
+        parser.add_argument('--max-sleep', type=float, default=APPOINTMENT_REMINDER_MAX_SLEEP,
+                            help="Longest wait between two checks, in seconds.")
+        parser.add_argument('--poll-interval', type=float, default=APPOINTMENT_REMINDER_POLL_INTERVAL,
+                            help="Shortest wait after a check that claimed nothing, in seconds.")
+        parser.add_argument('--once', action='store_true', help="Exit once no reminder is due.")
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(batch_size=options['batch_size'], max_sleep=options['max_sleep'],
+                                      poll_interval=options['poll_interval'])
+
+        def stop(signum, frame):
+            scheduler.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        queued = scheduler.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"{queued} reminders queued."))
@@ -0,0 +1,47 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from appointment.core.task_queue import Worker, task_stats
+from appointment.settings import APPOINTMENT_TASK_BATCH_SIZE, APPOINTMENT_TASK_POLL_INTERVAL, APPOINTMENT_TASK_WORKERS
+
+
+class Command(BaseCommand):
+    help = ("Run the background tasks queued in the Task table (emails, reminders, PDF rendering...) on a local "
+            "thread or process pool. Several workers can run at once, on one or many hosts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=APPOINTMENT_TASK_WORKERS,
+                            help="Number of tasks run at once.")
+        parser.add_argument('--processes', action='store_true',
+                            help="Run tasks in forked processes instead of threads, for CPU-bound tasks.")
+        parser.add_argument('--batch-size', type=int, default=APPOINTMENT_TASK_BATCH_SIZE,
+                            help="Maximum number of tasks claimed per query.")
+        parser.add_argument('--poll-interval', type=float, default=APPOINTMENT_TASK_POLL_INTERVAL,
+                            help="Seconds to wait when no task is due.")
+        parser.add_argument('--once', action='store_true', help="Exit once no task is due.")
+        parser.add_argument('--stats', action='store_true', help="Print per task statistics and exit.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for row in task_stats():
+                mean = f"{row['mean_ms']:.1f}" if row['mean_ms'] is not None else '-'
+                peak = f"{row['max_ms']:.1f}" if row['max_ms'] is not None else '-'
+                self.stdout.write(f"{row['name']}: {row['done']} done, {row['failed']} failed, "
+                                  f"{row['pending']} pending, {row['running']} running, {row['retried']} retried, "
+                                  f"mean {mean} ms, max {peak} ms")
+            return
+
+        worker = Worker(concurrency=options['concurrency'], processes=options['processes'],
+                        batch_size=options['batch_size'], poll_interval=options['poll_interval'])
+
+        def stop(signum, frame):
+            self.stdout.write("Stopping after the running tasks...")
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"Worker {worker.worker_id} started "
+                          f"({worker.concurrency} {'processes' if worker.processes else 'threads'})")
+        processed = worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker.worker_id} stopped after {processed} tasks."))
@@ -9,7 +9,7 @@ from django.utils.text import slugify
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxLengthValidator, MinLengthValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django import forms
 from django.http import JsonResponse
 from django.urls import reverse
@@ -17,6 +17,10 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .core.config_cache import get_cached_config
+from .core.schedule_index import get_schedule_index
+from .core.occupancy import OCCUPANCY_FIELDS, sync_slots
+from .settings import APPOINTMENT_REMINDER_LEAD_HOURS
 from .core.date_time import convert_minutes_in_human_readable_format, get_timestamp, get_weekday_num, \
     time_difference, combine_date_and_time
 
@@ -25,6 +29,9 @@ PAYMENT_TYPES = (
     ('down', _('Down payment')),
 )
 
+# Fields that move the due time of an appointment's reminder.
+REMINDER_FIELDS = frozenset({'date', 'start_time', 'want_reminder', 'reminder_sent_at'})
+
 DAYS_OF_WEEK = (
     (0, 'Monday'),
     (1, 'Tuesday'),
@@ -176,7 +183,7 @@ class StaffMember(models.Model):
         return f"{self.get_staff_member_name()}"
 
     def get_slot_duration(self):
-        config = Config.objects.first()
+        config = get_cached_config()
         return self.slot_duration or (config.slot_duration if config else 0)
 
     def get_slot_duration_text(self):
@@ -184,11 +191,11 @@ class StaffMember(models.Model):
         return convert_minutes_in_human_readable_format(slot_duration)
 
     def get_lead_time(self):
-        config = Config.objects.first()
+        config = get_cached_config()
         return self.lead_time or (config.lead_time if config else None)
 
     def get_finish_time(self):
-        config = Config.objects.first()
+        config = get_cached_config()
         return self.finish_time or (config.finish_time if config else None)
 
     def works_on_both_weekends_day(self):
@@ -236,7 +243,7 @@ class StaffMember(models.Model):
         return self.services_offered.filter(id=service_id).exists()
 
     def get_appointment_buffer_time(self):
-        config = Config.objects.first()
+        config = get_cached_config()
         return self.appointment_buffer_time or (config.appointment_buffer_time if config else 0)
 
     def get_appointment_buffer_time_text(self):
@@ -280,6 +287,12 @@ class Appointment(models.Model):
     date = models.DateField(null=False, blank=False, default=datetime.date.today)
     start_time = models.TimeField(null=False, blank=False,default=datetime.time(0, 0))
     end_time = models.TimeField(null=False, blank=False, default=datetime.time(0, 0))
+    series = models.ForeignKey('AppointmentSeries', on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='appointments')
+    want_reminder = models.BooleanField(default=False)
+    # When the pending reminder is due, kept up to date by save(); null when there is none. See core/reminders.py.
+    reminder_at = models.DateTimeField(null=True, blank=True)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
     # meta datas
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -291,6 +304,9 @@ class Appointment(models.Model):
         ]
         indexes = [
             models.Index(fields=['staff_member', 'date']),
+            models.Index(fields=['date', 'start_time', 'id']),
+            models.Index(fields=['reminder_at'], condition=models.Q(reminder_at__isnull=False),
+                         name='appointment_reminder_due_idx'),
         ]
         permissions = [
             ("can_view_sensitive_info", "Can view sensitive appointment information"),
@@ -317,7 +333,32 @@ class Appointment(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
-        return super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self.reminder_at = self.compute_reminder_at()
+        if update_fields is not None and REMINDER_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = update_fields = set(update_fields) | {'reminder_at'}
+        # The slot ledger is written in the same transaction, its unique index rejects double bookings.
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            if update_fields is None or OCCUPANCY_FIELDS.intersection(update_fields):
+                sync_slots(self)
+        return result
+
+    def compute_reminder_at(self):
+        """Return when the reminder of this appointment is due, or None if it needs none.
+
+        The reminder is due ``APPOINTMENT_REMINDER_LEAD_HOURS`` before the start. A reminder already sent covers the
+        appointment unless it was moved to a later start since, in which case it is reminded again.
+        """
+        if not self.want_reminder or not self.date or not self.start_time:
+            return None
+        start = datetime.datetime.combine(self.date, self.start_time)
+        if settings.USE_TZ:
+            start = timezone.make_aware(start)
+        due = start - datetime.timedelta(hours=APPOINTMENT_REMINDER_LEAD_HOURS)
+        if self.reminder_sent_at is not None and self.reminder_sent_at >= due:
+            return None
+        return due
 
     def get_client_name(self):
         return self.client.get_full_name() if self.client else ""
@@ -374,15 +415,16 @@ class Appointment(models.Model):
         weekday_num = get_weekday_num(weekday)
         sm_name = staff_member.get_staff_member_name()
 
+        schedule_index = get_schedule_index()
+
         # Check if the staff member works on the given day
-        try:
-            working_hours = WorkingHours.objects.get(staff_member=staff_member, day_of_week=weekday_num)
-        except WorkingHours.DoesNotExist:
+        working_hours = schedule_index.hours_for(staff_member.pk, weekday_num)
+        if working_hours is None:
             message = _("{staff_member} does not work on this day.").format(staff_member=sm_name)
             return False, message
 
         # Check if the start time falls within the staff member's working hours
-        if not (working_hours.start_time <= start_time.time() <= working_hours.end_time):
+        if not (working_hours[0] <= start_time.time() <= working_hours[1]):
             message = _("The appointment start time is outside of {staff_member}'s working hours.").format(
                 staff_member=sm_name)
             return False, message
@@ -398,8 +440,7 @@ class Appointment(models.Model):
                 return False, message
 
         # Check if the staff member has a day off on the appointment's date
-        days_off = DayOff.objects.filter(staff_member=staff_member, start_date__lte=appt_date, end_date__gte=appt_date)
-        if days_off.exists():
+        if schedule_index.is_day_off(staff_member.pk, appt_date):
             message = _("{staff_member} has a day off on this date.").format(staff_member=sm_name)
             return False, message
 
@@ -421,6 +462,27 @@ class Appointment(models.Model):
         }
 
 
+class AppointmentSeries(models.Model):
+    """
+    A recurring booking (e.g. a weekly treatment plan), described by an RFC 5545 recurrence rule.
+    Its occurrences are materialized as regular appointments linked to the series.
+
+    """
+    client = models.ForeignKey('Client', on_delete=models.CASCADE, related_name='appointment_series')
+    service = models.ForeignKey('Service', on_delete=models.SET_NULL, null=True)
+    staff_member = models.ForeignKey('StaffMember', on_delete=models.SET_NULL, null=True)
+    rule = models.CharField(max_length=255, help_text=_("Recurrence rule, e.g. FREQ=WEEKLY;BYDAY=TU;COUNT=20"))
+    start_date = models.DateField()
+    start_time = models.TimeField()
+    additional_info = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.client} - {self.rule} from {self.start_date} at {self.start_time.strftime('%H:%M')}"
+
+
 class Config(models.Model):
     """
     Represents configuration settings for the appointment system. There can only be one Config object in the database.
@@ -681,4 +743,167 @@ class Notification(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"Notification for {self.user} - {self.created_at}"
\ No newline at end of file
+        return f"Notification for {self.user} - {self.created_at}"
+
+
+class SlotOccupancy(models.Model):
+    """
+    One bin of ``APPOINTMENT_OCCUPANCY_BIN_MINUTES`` held by an appointment of a staff member on a date.
+    The unique constraint makes concurrent bookings of the same slot fail atomically instead of racing.
+
+    """
+    staff_member = models.ForeignKey('StaffMember', on_delete=models.CASCADE)
+    date = models.DateField()
+    bin = models.PositiveSmallIntegerField(help_text=_("Bin index counted from midnight."))
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='occupied_slots')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['staff_member', 'date', 'bin'], name='unique_slot_occupancy')
+        ]
+
+    def __str__(self):
+        return f"{self.staff_member_id} - {self.date} - bin {self.bin}"
+
+
+class DailyAvailability(models.Model):
+    """
+    Free time of a staff member on a date, on their slot grid: the longest run of consecutive free slots and the
+    total of free slots, in minutes. Used to tell which days of a month can fit a service without computing slots.
+
+    """
+    staff_member = models.ForeignKey('StaffMember', on_delete=models.CASCADE, related_name='daily_availability')
+    date = models.DateField()
+    max_free_minutes = models.PositiveIntegerField(default=0)
+    free_minutes = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['staff_member', 'date'], name='unique_daily_availability')
+        ]
+        indexes = [
+            models.Index(fields=['date', 'max_free_minutes'], name='daily_availability_fit_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.staff_member_id} - {self.date} - {self.max_free_minutes} min"
+
+
+class EndpointMetric(models.Model):
+    """
+    Aggregated request statistics of one URL name, flushed periodically by ``QueryInstrumentationMiddleware``.
+
+    """
+    url_name = models.CharField(max_length=255, unique=True)
+    requests = models.PositiveBigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    queries = models.PositiveBigIntegerField(default=0)
+    max_queries = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    duplicate_queries = models.JSONField(default=dict, blank=True,
+                                         help_text=_("Repeated query fingerprints and how many times they repeated."))
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.url_name}: {self.requests} requests"
+
+    def get_mean_ms(self):
+        return self.total_ms / self.requests if self.requests else 0
+
+    def get_mean_queries(self):
+        return self.queries / self.requests if self.requests else 0
+
+    def to_dict(self):
+        return {
+            "url_name": self.url_name,
+            "requests": self.requests,
+            "mean_ms": round(self.get_mean_ms(), 3),
+            "max_ms": round(self.max_ms, 3),
+            "mean_queries": round(self.get_mean_queries(), 2),
+            "max_queries": self.max_queries,
+            "mean_sql_ms": round(self.sql_ms / self.requests, 3) if self.requests else 0,
+            "duplicate_queries": self.duplicate_queries,
+        }
+
+
+TASK_STATUSES = (
+    ('pending', _('Pending')),
+    ('running', _('Running')),
+    ('done', _('Done')),
+    ('failed', _('Failed')),
+)
+
+
+class Task(models.Model):
+    """
+    A function call to run in the background by the ``run_tasks`` worker, see :mod:`appointment.core.task_queue`.
+    Workers claim pending tasks whose ``run_at`` has passed, in ``run_at`` order; failed attempts are retried later
+    with an exponential backoff, up to ``max_attempts``.
+
+    """
+    name = models.CharField(max_length=255, help_text=_("Dotted path of the function to call."))
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=TASK_STATUSES, default='pending')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(blank=True, default='')
+    locked_by = models.CharField(max_length=100, blank=True, default='',
+                                 help_text=_("Worker running the task, while it runs."))
+
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True, help_text=_("Duration of the last attempt."))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+EMAIL_STATUSES = (
+    ('pending', _('Pending')),
+    ('sending', _('Sending')),
+    ('sent', _('Sent')),
+    ('failed', _('Failed')),
+)
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email waiting in the outbox, rendered and sent in batches by :mod:`appointment.core.email_outbox`.
+    A non-empty ``dedup_key`` is unique per recipient, so the same email is never queued twice.
+
+    """
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=255)
+    context = models.JSONField(default=dict, blank=True)
+    dedup_key = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=10, choices=EMAIL_STATUSES, default='pending')
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'dedup_key'], condition=~models.Q(dedup_key=''),
+                                    name='unique_outgoing_email_dedup')
+        ]
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='outgoing_email_due_idx'),
+            models.Index(fields=['recipient', 'sent_at'], name='outgoing_email_rate_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient}: {self.subject} ({self.status})"
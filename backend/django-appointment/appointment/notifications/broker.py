@@ -0,0 +1,159 @@
+# appointment/notifications/broker.py
+"""
+Author: Miquel Barón
+Since: 1.0.0
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from django.utils.module_loading import import_string
+
+from appointment.logger_config import get_logger
+from appointment.settings import (
+    APPOINTMENT_NOTIFICATION_BROKER, APPOINTMENT_NOTIFICATION_REDIS_URL, APPOINTMENT_SSE_QUEUE_SIZE
+)
+
+_logger = get_logger(__name__)
+
+
+class Subscription:
+    """Live events of one user for one SSE connection, delivered to the event loop that opened it."""
+
+    def __init__(self, broker: 'InProcessBroker', user_id: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=APPOINTMENT_SSE_QUEUE_SIZE)
+
+    def _put(self, event: dict):
+        # Runs on the subscriber loop. A client that stopped reading loses its oldest events; they can still be
+        # replayed from the Notification table on reconnection.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Wait for the next event, or return None after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Delivers events to the subscribers of the current process. Suitable for a single worker (development)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a subscription. Must be called from the event loop that will consume it."""
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, event_id: Optional[int], data: dict):
+        """Send an event to every connection of a user. Safe to call from any thread.
+
+        :param user_id: Recipient.
+        :param event_id: Id of the stored ``Notification``, used as SSE id for ``Last-Event-ID`` replay.
+        :param data: JSON-serializable payload.
+        """
+        self._deliver(user_id, {"id": event_id, "data": data})
+
+    def _deliver(self, user_id: int, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # The loop of a dead connection is closed.
+                self.unsubscribe(subscription)
+
+    def connection_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes events on Redis so that every worker process receives them. Each process keeps a single pattern
+    subscription, read by one daemon thread, and fans the events out to its local connections.
+    """
+    channel_prefix = 'appointment:notifications:'
+
+    def __init__(self, url: str = APPOINTMENT_NOTIFICATION_REDIS_URL):
+        super().__init__()
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        self._ensure_listener()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id: int, event_id: Optional[int], data: dict):
+        payload = json.dumps({"id": event_id, "data": data})
+        try:
+            self._redis.publish(f"{self.channel_prefix}{user_id}", payload)
+        except Exception as e:
+            _logger.error(f"Could not publish notification for user {user_id}: {e}")
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='notification-redis-listener',
+                                                  daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{self.channel_prefix}*")
+                backoff = 1
+                for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    channel = message['channel'].decode()
+                    user_id = int(channel[len(self.channel_prefix):])
+                    self._deliver(user_id, json.loads(message['data']))
+            except Exception as e:
+                _logger.error(f"Redis notification listener failed, retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> InProcessBroker:
+    """Return the process-wide broker configured by ``APPOINTMENT_NOTIFICATION_BROKER``."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(APPOINTMENT_NOTIFICATION_BROKER)()
+    return _broker
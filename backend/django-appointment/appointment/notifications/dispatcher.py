@@ -0,0 +1,202 @@
+# appointment/notifications/dispatcher.py
+"""
+Author: Miquel Barón
+Since: 1.0.0
+
+Deferred fan-out of appointment notifications, off the request path.
+
+Callers only capture the ids a notification needs and hand them to ``transaction.on_commit``, so a rolled back
+booking never notifies anyone. Committed events go to a small thread pool, which waits
+``APPOINTMENT_NOTIFICATION_COALESCE_SECONDS`` for more events, then stores the notifications of every pending event
+with one ``bulk_create`` and publishes them to the broker. The ids of the admins are cached.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, time as time_of_day
+from typing import Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from appointment.logger_config import get_logger
+from appointment.notifications.sse import add_notification_to_queue
+from appointment.settings import (
+    APPOINTMENT_NOTIFICATION_ADMINS_CACHE_TIMEOUT, APPOINTMENT_NOTIFICATION_BATCH_SIZE,
+    APPOINTMENT_NOTIFICATION_COALESCE_SECONDS, APPOINTMENT_NOTIFICATION_WORKERS
+)
+
+_logger = get_logger(__name__)
+
+ADMIN_IDS_CACHE_KEY = 'notifications:admin_ids'
+
+
+@dataclass(frozen=True)
+class AppointmentEvent:
+    """What a notification needs from an appointment, captured before it may be deleted."""
+    type: str
+    appointment_id: int
+    client_id: int
+    service_id: int
+    staff_member_id: int
+    date: date
+    start_time: time_of_day
+
+    @classmethod
+    def from_appointment(cls, appointment, notification_type: str) -> 'AppointmentEvent':
+        return cls(notification_type, appointment.id, appointment.client_id, appointment.service_id,
+                   appointment.staff_member_id, appointment.date, appointment.start_time)
+
+
+def get_admin_ids() -> List[int]:
+    """Return the ids of the users of the Admins group, cached until the group or its members change."""
+    admin_ids = cache.get(ADMIN_IDS_CACHE_KEY)
+    if admin_ids is None:
+        from appointment.models import User
+
+        admin_ids = list(User.objects.filter(groups__name='Admins').order_by('id').values_list('id', flat=True))
+        cache.set(ADMIN_IDS_CACHE_KEY, admin_ids, APPOINTMENT_NOTIFICATION_ADMINS_CACHE_TIMEOUT)
+    return admin_ids
+
+
+def invalidate_admin_ids():
+    cache.delete(ADMIN_IDS_CACHE_KEY)
+
+
+def deliver_events(events: Iterable[AppointmentEvent]) -> int:
+    """Store and publish the notifications of some events, notifying the staff member and every admin.
+
+    Clients, services and staff members are loaded with one query each, and every notification is inserted with
+    one ``bulk_create``, whatever the number of events.
+
+    :param events: The events to deliver.
+    :return: The number of notifications created.
+    """
+    from appointment.models import Client, Notification, Service, StaffMember
+
+    events = list(events)
+    if not events:
+        return 0
+    clients = Client.objects.only('first_name', 'last_name').in_bulk({event.client_id for event in events})
+    services = Service.objects.in_bulk({event.service_id for event in events})
+    staffs = StaffMember.objects.select_related('user').in_bulk({event.staff_member_id for event in events})
+    admin_ids = get_admin_ids()
+
+    notifications = []
+    for event in events:
+        client, service, staff = clients.get(event.client_id), services.get(event.service_id), \
+            staffs.get(event.staff_member_id)
+        data = {
+            "type": event.type,
+            "appointment_id": event.appointment_id,
+            "client": f"{client.first_name} {client.last_name}" if client else "",
+            "service": service.name if service else "",
+            "date": str(event.date),
+            "start_time": str(event.start_time),
+            "staff": staff.user.get_full_name() if staff else "",
+            "duration": service.get_duration_readable() if service else "",
+        }
+        recipients = ([staff.user_id] if staff else []) + admin_ids
+        notifications.extend(Notification(user_id=user_id, message=data) for user_id in dict.fromkeys(recipients))
+
+    created = Notification.objects.bulk_create(notifications)
+    # The id lets the dashboard replay missed events with Last-Event-ID.
+    for notification in created:
+        add_notification_to_queue(notification.user_id, notification.message, event_id=notification.pk)
+    _logger.info(f"Stored {len(created)} notifications for {len(events)} appointment events")
+    return len(created)
+
+
+class NotificationDispatcher:
+    """
+    Delivers events from a pool of ``workers`` threads, coalescing the events that arrive within
+    ``coalesce_seconds`` into one delivery. With no workers, events are delivered in the calling thread.
+    """
+
+    def __init__(self, workers: int = APPOINTMENT_NOTIFICATION_WORKERS,
+                 coalesce_seconds: float = APPOINTMENT_NOTIFICATION_COALESCE_SECONDS,
+                 batch_size: int = APPOINTMENT_NOTIFICATION_BATCH_SIZE):
+        self.coalesce_seconds = coalesce_seconds
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending: List[AppointmentEvent] = []
+        self._scheduled = False
+        self._running = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notifications') \
+            if workers > 0 else None
+
+    def submit(self, event: AppointmentEvent):
+        """Queue an event for delivery. Call it once the transaction that produced the event has committed."""
+        if self._executor is None:
+            self._deliver([event])
+            return
+        with self._lock:
+            self._pending.append(event)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self._running += 1
+        self._executor.submit(self._drain)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued event has been delivered.
+
+        :param timeout: Seconds to wait at most.
+        :return: False if the timeout expired first.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _drain(self):
+        try:
+            if self.coalesce_seconds > 0:
+                time.sleep(self.coalesce_seconds)
+            with self._lock:
+                events, self._pending = self._pending, []
+                self._scheduled = False
+            for offset in range(0, len(events), self.batch_size):
+                self._deliver(events[offset:offset + self.batch_size])
+        finally:
+            # Pool threads outlive the request cycle that would otherwise close their connections.
+            connections.close_all()
+            with self._idle:
+                self._running -= 1
+                self._idle.notify_all()
+
+    def _deliver(self, events: List[AppointmentEvent]):
+        try:
+            deliver_events(events)
+        except Exception as e:
+            _logger.error(f"Error delivering {len(events)} appointment notifications: {e}")
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """Return the process-wide dispatcher."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher()
+    return _dispatcher
+
+
+def notify_on_commit(appointment, notification_type: str, using: Optional[str] = None):
+    """Notify about an appointment once the current transaction commits; nothing is sent if it rolls back.
+
+    :param appointment: The appointment, possibly already deleted.
+    :param notification_type: ``appointment.created``, ``appointment.deleted``, ...
+    :param using: Database alias of the transaction.
+    """
+    event = AppointmentEvent.from_appointment(appointment, notification_type)
+    transaction.on_commit(lambda: get_dispatcher().submit(event), using=using)
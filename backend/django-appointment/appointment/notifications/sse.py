@@ -1,49 +1,75 @@
 # appointment/notifications/sse.py
 import json
-import time
-import threading
 from django.http import StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_GET
 import logging
 
+from appointment.notifications.broker import get_broker
+from appointment.settings import APPOINTMENT_SSE_KEEPALIVE, APPOINTMENT_SSE_REPLAY_LIMIT
+
 logger = logging.getLogger(__name__)
 
-# Almacenamiento en memoria para SSE
-user_messages = {}
-messages_lock = threading.Lock()
+
+def format_event(data, event_id=None) -> str:
+    """Serialize one SSE message."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def _parse_last_event_id(request):
+    # Browsers send the header on automatic reconnection; the query parameter covers the first connection.
+    value = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def _replay(user_id, last_event_id):
+    from appointment.models import Notification
+
+    queryset = Notification.objects.filter(user_id=user_id, id__gt=last_event_id).order_by('id')
+    return [n async for n in queryset[:APPOINTMENT_SSE_REPLAY_LIMIT]]
+
 
 @require_GET
 @login_required
-def notification_stream(request):
-    """SSE stream - conexiones persistentes"""
-    user_id = request.user.id
+async def notification_stream(request):
+    """SSE stream - conexiones persistentes
+
+    The connection waits on the user's broker subscription instead of polling, so an idle connection costs
+    no thread and no CPU under ASGI. Notifications missed since ``Last-Event-ID`` are replayed first.
+    """
+    user = await request.auser()
+    user_id = user.id
+    last_event_id = _parse_last_event_id(request)
     logger.info(f"🎯 Usuario {user_id} conectado a SSE")
 
-    def event_generator():
+    async def event_generator():
+        # Subscribe before replaying so nothing created in between is lost; duplicates are skipped by id.
+        subscription = get_broker().subscribe(user_id)
         try:
-            # Mensaje de conexión
-            yield f"data: {json.dumps({'type': 'connected', 'user_id': user_id})}\n\n"
-
-            # Mantener conexión
-            while True:
-                user_key = f"user_{user_id}"
-
-                with messages_lock:
-                    if user_key in user_messages and user_messages[user_key]:
-                        message = user_messages[user_key].pop(0)
-                        yield f"data: {json.dumps(message)}\n\n"
-                        logger.info(f"📤 Mensaje enviado a usuario {user_id}")
-                    else:
-                        # Keep-alive
-                        yield ":keep-alive\n\n"
+            yield format_event({'type': 'connected', 'user_id': user_id})
 
-                time.sleep(1)
+            last_sent = last_event_id
+            if last_event_id is not None:
+                for notification in await _replay(user_id, last_event_id):
+                    yield format_event(notification.message, notification.id)
+                    last_sent = notification.id
 
-        except GeneratorExit:
+            while True:
+                event = await subscription.get(APPOINTMENT_SSE_KEEPALIVE)
+                if event is None:
+                    yield ":keep-alive\n\n"
+                    continue
+                if event['id'] is not None and last_sent is not None and event['id'] <= last_sent:
+                    continue
+                yield format_event(event['data'], event['id'])
+                logger.info(f"📤 Mensaje enviado a usuario {user_id}")
+        finally:
+            subscription.close()
             logger.info(f"Usuario {user_id} desconectado")
-        except Exception as e:
-            logger.error(f"❌ Error en SSE: {e}")
 
     response = StreamingHttpResponse(
         event_generator(),
@@ -53,15 +79,9 @@ def notification_stream(request):
     response['X-Accel-Buffering'] = 'no'
     return response
 
-def add_notification_to_queue(user_id, message):
-    """Añade notificación a la cola del usuario"""
-    user_key = f"user_{user_id}"
-
-    with messages_lock:
-        if user_key not in user_messages:
-            user_messages[user_key] = []
-
-        user_messages[user_key].append(message)
-        logger.info(f"Notificación en cola para usuario {user_id}")
 
-    return True
\ No newline at end of file
+def add_notification_to_queue(user_id, message, event_id=None):
+    """Publica la notificación a las conexiones del usuario, en cualquier proceso"""
+    get_broker().publish(user_id, event_id, message)
+    logger.info(f"Notificación publicada para usuario {user_id}")
+    return True
@@ -1,6 +1,8 @@
 # settings.py
 # Path: appointment/settings.py
 
+import os
+
 from django.conf import settings
 from django.conf.global_settings import DEFAULT_FROM_EMAIL
 
@@ -17,6 +19,61 @@ APPOINTMENT_SLOT_DURATION = getattr(settings, 'APPOINTMENT_SLOT_DURATION', 30)
 APPOINTMENT_BUFFER_TIME = getattr(settings, 'APPOINTMENT_BUFFER_TIME', 0)
 APPOINTMENT_LEAD_TIME = getattr(settings, 'APPOINTMENT_LEAD_TIME', (9, 0))
 APPOINTMENT_FINISH_TIME = getattr(settings, 'APPOINTMENT_FINISH_TIME', (18, 30))
+APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS = getattr(settings, 'APPOINTMENT_AVAILABILITY_MAX_RANGE_DAYS', 31)
+APPOINTMENT_AVAILABILITY_CACHE = getattr(settings, 'APPOINTMENT_AVAILABILITY_CACHE', 'default')
+APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT = getattr(settings, 'APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT', 3600)
+# 'interval' (pure Python), 'bitmap' (vectorized, requires numpy; falls back to 'interval' without it) or 'sql'
+# (computed by the database, SQLite or PostgreSQL; falls back to 'interval' on other databases).
+APPOINTMENT_AVAILABILITY_ENGINE = getattr(settings, 'APPOINTMENT_AVAILABILITY_ENGINE', 'interval')
+APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL = getattr(settings, 'APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL', 5)
+APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL = getattr(settings, 'APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL', 5)
+APPOINTMENT_INSTRUMENTATION_FLUSH_INTERVAL = getattr(settings, 'APPOINTMENT_INSTRUMENTATION_FLUSH_INTERVAL', 60)
+APPOINTMENT_INSTRUMENTATION_TOP_DUPLICATES = getattr(settings, 'APPOINTMENT_INSTRUMENTATION_TOP_DUPLICATES', 10)
+APPOINTMENT_LIST_PAGE_SIZE = getattr(settings, 'APPOINTMENT_LIST_PAGE_SIZE', 500)
+APPOINTMENT_LIST_MAX_PAGE_SIZE = getattr(settings, 'APPOINTMENT_LIST_MAX_PAGE_SIZE', 2000)
+APPOINTMENT_NOTIFICATION_BROKER = getattr(settings, 'APPOINTMENT_NOTIFICATION_BROKER',
+                                          'appointment.notifications.broker.InProcessBroker')
+APPOINTMENT_NOTIFICATION_REDIS_URL = getattr(settings, 'APPOINTMENT_NOTIFICATION_REDIS_URL', 'redis://localhost:6379/0')
+# Notification fan-out runs after commit on a pool of this many threads; 0 delivers in the committing thread.
+APPOINTMENT_NOTIFICATION_WORKERS = getattr(settings, 'APPOINTMENT_NOTIFICATION_WORKERS', 2)
+APPOINTMENT_NOTIFICATION_COALESCE_SECONDS = getattr(settings, 'APPOINTMENT_NOTIFICATION_COALESCE_SECONDS', 0.05)
+APPOINTMENT_NOTIFICATION_BATCH_SIZE = getattr(settings, 'APPOINTMENT_NOTIFICATION_BATCH_SIZE', 500)
+APPOINTMENT_NOTIFICATION_ADMINS_CACHE_TIMEOUT = getattr(settings, 'APPOINTMENT_NOTIFICATION_ADMINS_CACHE_TIMEOUT', 300)
+APPOINTMENT_SSE_KEEPALIVE = getattr(settings, 'APPOINTMENT_SSE_KEEPALIVE', 15)
+APPOINTMENT_SSE_REPLAY_LIMIT = getattr(settings, 'APPOINTMENT_SSE_REPLAY_LIMIT', 100)
+APPOINTMENT_SSE_QUEUE_SIZE = getattr(settings, 'APPOINTMENT_SSE_QUEUE_SIZE', 100)
+APPOINTMENT_OCCUPANCY_BIN_MINUTES = getattr(settings, 'APPOINTMENT_OCCUPANCY_BIN_MINUTES', 5)
+APPOINTMENT_BULK_MAX_OPERATIONS = getattr(settings, 'APPOINTMENT_BULK_MAX_OPERATIONS', 5000)
+APPOINTMENT_SERIES_MAX_OCCURRENCES = getattr(settings, 'APPOINTMENT_SERIES_MAX_OCCURRENCES', 104)
+APPOINTMENT_SERIES_MAX_HORIZON_DAYS = getattr(settings, 'APPOINTMENT_SERIES_MAX_HORIZON_DAYS', 366)
+APPOINTMENT_TASK_WORKERS = getattr(settings, 'APPOINTMENT_TASK_WORKERS', 4)
+APPOINTMENT_TASK_BATCH_SIZE = getattr(settings, 'APPOINTMENT_TASK_BATCH_SIZE', 20)
+APPOINTMENT_TASK_POLL_INTERVAL = getattr(settings, 'APPOINTMENT_TASK_POLL_INTERVAL', 1.0)
+APPOINTMENT_TASK_MAX_ATTEMPTS = getattr(settings, 'APPOINTMENT_TASK_MAX_ATTEMPTS', 3)
+# A failed attempt is retried after base * 2 ** (attempt - 1) seconds, capped at the max.
+APPOINTMENT_TASK_RETRY_BACKOFF = getattr(settings, 'APPOINTMENT_TASK_RETRY_BACKOFF', 30)
+APPOINTMENT_TASK_RETRY_MAX_BACKOFF = getattr(settings, 'APPOINTMENT_TASK_RETRY_MAX_BACKOFF', 3600)
+# A task whose worker has not renewed it for this many seconds is presumed lost with its worker and counted as a failed
+# attempt. Workers renew their running tasks three times per timeout.
+APPOINTMENT_TASK_TIMEOUT = getattr(settings, 'APPOINTMENT_TASK_TIMEOUT', 900)
+APPOINTMENT_REMINDER_LEAD_HOURS = getattr(settings, 'APPOINTMENT_REMINDER_LEAD_HOURS', 24)
+APPOINTMENT_REMINDER_BATCH_SIZE = getattr(settings, 'APPOINTMENT_REMINDER_BATCH_SIZE', 200)
+# Longest sleep of the reminder scheduler, so that reminders booked meanwhile are picked up.
+APPOINTMENT_REMINDER_MAX_SLEEP = getattr(settings, 'APPOINTMENT_REMINDER_MAX_SLEEP', 60)
+# Shortest sleep of the reminder scheduler after a pass that claimed nothing, e.g. due rows locked by another one.
+APPOINTMENT_REMINDER_POLL_INTERVAL = getattr(settings, 'APPOINTMENT_REMINDER_POLL_INTERVAL', 1.0)
+APPOINTMENT_EMAIL_BATCH_SIZE = getattr(settings, 'APPOINTMENT_EMAIL_BATCH_SIZE', 100)
+APPOINTMENT_EMAIL_MAX_ATTEMPTS = getattr(settings, 'APPOINTMENT_EMAIL_MAX_ATTEMPTS', 5)
+# Rate control of the outbox: messages per minute overall, and per recipient over a window of seconds.
+APPOINTMENT_EMAIL_MAX_PER_MINUTE = getattr(settings, 'APPOINTMENT_EMAIL_MAX_PER_MINUTE', 120)
+APPOINTMENT_EMAIL_MAX_PER_RECIPIENT = getattr(settings, 'APPOINTMENT_EMAIL_MAX_PER_RECIPIENT', 5)
+APPOINTMENT_EMAIL_RECIPIENT_WINDOW = getattr(settings, 'APPOINTMENT_EMAIL_RECIPIENT_WINDOW', 3600)
+# Rendered medical history PDFs, one file per client and version of its data.
+APPOINTMENT_PDF_CACHE_DIR = getattr(settings, 'APPOINTMENT_PDF_CACHE_DIR', os.path.join(
+    getattr(settings, 'MEDIA_ROOT', '') or os.path.join(str(getattr(settings, 'BASE_DIR', '.')), 'media'),
+    'medical_history'))
+APPOINTMENT_PDF_MAX_ATTEMPTS = getattr(settings, 'APPOINTMENT_PDF_MAX_ATTEMPTS', 3)
+APPOINTMENT_PDF_BULK_MAX_CLIENTS = getattr(settings, 'APPOINTMENT_PDF_BULK_MAX_CLIENTS', 1000)
 APP_DEFAULT_FROM_EMAIL = getattr(settings, 'DEFAULT_FROM_EMAIL', DEFAULT_FROM_EMAIL)
 
 
@@ -1,10 +1,16 @@
 # appointment/signals.py
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
 from django.dispatch import receiver
 
+from appointment.core.availability_cache import invalidate_all, invalidate_staff, invalidate_staff_day
+from appointment.core.availability_summary import drop_upcoming_summaries, refresh_staff_days
+from appointment.core.config_cache import invalidate_cached_config
+from appointment.core.schedule_index import invalidate_schedule_index
 from appointment.core.db_helpers import WorkingHours
 from appointment.logger_config import get_logger
-from appointment.models import Appointment
+from appointment.models import Appointment, Config, DayOff, StaffMember, User
+from appointment.notifications.dispatcher import invalidate_admin_ids
 from appointment.notifications.tasks import send_appointment_notification
 
 _logger = get_logger(__name__)
@@ -17,7 +23,7 @@ def notify_appointment(sender, instance, created, **kwargs):
     try:
         _logger.info(f"🎯 Signal: New appointment {instance.id}")
         send_appointment_notification(instance, "appointment.created")
-        _logger.info(f"✅ Notificación procesada para cita {instance.id}")
+        _logger.info(f"✅ Notificación programada para cita {instance.id}")
     except Exception as e:
         _logger.error(f"❌ Error en señal: {e}")
 
@@ -26,7 +32,7 @@ def notify_appointment(sender, instance,**kwargs):
     try:
         _logger.info(f"🎯 Signal: Appointment deleted {instance.id}")
         send_appointment_notification(instance, "appointment.deleted")
-        _logger.info(f"✅ Notificación procesada para la eliminacion de la cita {instance.id}")
+        _logger.info(f"✅ Notificación programada para la eliminacion de la cita {instance.id}")
     except Exception as e:
         _logger.error(f"❌ Error en señal: {e}")
 
@@ -42,4 +48,56 @@ def set_boolean_working_hours_true(sender, instance, created, **kwargs):
     staff = instance.staff_member
     print(staff)
     staff.set_timetable = True
-    staff.save()
\ No newline at end of file
+    staff.save()
+
+
+# Availability cache invalidation
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    # An update may move the appointment: the day it leaves must be invalidated too.
+    instance._previous_slot = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_slot = Appointment.objects.filter(pk=instance.pk).values_list(
+            'staff_member_id', 'date').first()
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_appointment_availability(sender, instance, **kwargs):
+    invalidate_staff_day(instance.staff_member_id, instance.date)
+    previous = getattr(instance, '_previous_slot', None)
+    if previous and previous != (instance.staff_member_id, instance.date):
+        invalidate_staff_day(*previous)
+    refresh_staff_days([(instance.staff_member_id, instance.date)] + ([previous] if previous else []))
+
+@receiver(post_save, sender=WorkingHours)
+@receiver(post_delete, sender=WorkingHours)
+@receiver(post_save, sender=DayOff)
+@receiver(post_delete, sender=DayOff)
+def invalidate_staff_schedule_availability(sender, instance, **kwargs):
+    invalidate_schedule_index()
+    invalidate_staff(instance.staff_member_id)
+    drop_upcoming_summaries(instance.staff_member_id)
+
+@receiver(post_save, sender=StaffMember)
+@receiver(post_delete, sender=StaffMember)
+def invalidate_staff_member_availability(sender, instance, **kwargs):
+    invalidate_staff(instance.pk)
+    drop_upcoming_summaries(instance.pk)
+
+@receiver(post_save, sender=Config)
+@receiver(post_delete, sender=Config)
+def invalidate_config_availability(sender, instance, **kwargs):
+    invalidate_cached_config()
+    invalidate_all()
+    drop_upcoming_summaries()
+
+
+# Cached notification recipients
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=User)
+def invalidate_notification_admins(sender, **kwargs):
+    invalidate_admin_ids()
@@ -33,12 +33,15 @@ urlpatterns = [
 
     # Appointments
     path('appointments/', list_appointments, name='appointments_list'),  # GET & POST
+    path('appointments/bulk/', bulk_appointments, name='appointments_bulk'),
+    path('appointments/series/', appointment_series, name='appointments_series'),
     path('appointments/<int:appointment_id>/', appointment_detail, name='appointment_detail'),
     path('appointments/<str:start_date>/<str:end_date>/', appointments_interval, name='appointments_interval'),
     path('appointments/today/', appointments_today, name='appointments_today'),
     path('appointments/recent/', appointments_recent, name='appointments_recent'),
 
     # Availability
+    path('availability/month/<int:service_id>/<str:month_str>/', availability_month, name='availability_month'),
     path('availability/<str:service_name>/<str:date_str>/', availability, name='availability'),
 
     # Clients
@@ -62,9 +65,14 @@ urlpatterns = [
     path('daysoff/', get_days_off, name='manage_days_off'),
 
     # Report
+    path("export-history/", export_medical_histories, name="export_medical_histories"),
     path("export-history/<int:patient_id>/", export_medical_history, name="export_medical_history"),
+    path("export-history/<int:patient_id>/status/", medical_history_status, name="medical_history_status"),
 
     # SSE
     path('stream/', notification_stream, name='notification-stream'),
 
+    # Instrumentation
+    path('metrics/', endpoint_metrics, name='endpoint_metrics'),
+
 ]
\ No newline at end of file
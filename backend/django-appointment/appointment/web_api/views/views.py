@@ -2,13 +2,28 @@ from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.db import transaction
 from django.forms import model_to_dict
 
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponseBadRequest, HttpResponseServerError
+from django.http import (
+    FileResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseServerError, JsonResponse,
+    StreamingHttpResponse
+)
+from django.urls import reverse
 from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
 
 from appointment.core.db_helpers import get_staffs_assigned_to_service
 from appointment.models import Appointment, StaffMember, Service, Client, WorkingHours, DayOff
 from appointment.core.api_helpers import create_appointment_safe, get_availability_for_service_across_staffs
+from appointment.core.availability_cache import invalidate_staff
+from appointment.core.schedule_index import invalidate_schedule_index
+from appointment.core.instrumentation import get_endpoint_report
+from appointment.core.appointment_listing import get_appointments_page
+from appointment.core.bulk_booking import apply_bulk_operations
+from appointment.core.recurrence import book_series
+from appointment.core.reassignment import reassign_day_off
+from appointment.core.availability_summary import drop_upcoming_summaries, get_month_availability
+from appointment.core.occupancy import SlotUnavailableError
+from appointment.core.medical_history import get_history_pdf, get_history_pdfs, history_filename, stream_histories_zip
+from appointment.settings import APPOINTMENT_BULK_MAX_OPERATIONS, APPOINTMENT_PDF_BULK_MAX_CLIENTS
 from datetime import datetime
 #Login
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, Group
@@ -22,35 +37,31 @@ import json
 @login_required
 def list_appointments(request):
     """
-    GET/appointments/
+    GET/appointments/?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD&limit=500&cursor=...
     POST/appointments/
     Admin --> can see all appointments
     Staff --> can only see his own appointments
+    GET is paginated on (date, start_time, id): pass the returned next_cursor to get the following page.
     """
     user = request.user
     if request.method == 'GET':
         if user.is_superuser or user.groups.filter(name="Admins").exists():
             appointments = Appointment.objects.all()
-            print("Admin appointments")
         else:
             appointments = Appointment.objects.filter(staff_member__user=request.user)
-            print("Staff appointments")
-            print(request.user)
-        print(appointments)
-
-        data = [
-            {
-                "id": a.id,
-                "client": f"{a.client.first_name} {a.client.last_name}",
-                "service": a.service.name,
-                "date": str(a.date),
-                "start_time": str(a.start_time),
-                "end_time": str(a.end_time),
-                "staff": a.staff_member.user.get_full_name(),
-            }
-            for a in appointments
-        ]
-        return JsonResponse({'appointments': data})
+
+        try:
+            start_date = parse_date(request.GET['start_date']) if 'start_date' in request.GET else None
+            end_date = parse_date(request.GET['end_date']) if 'end_date' in request.GET else None
+            if ('start_date' in request.GET and start_date is None) or ('end_date' in request.GET and end_date is None):
+                raise ValueError("Dates must use the YYYY-MM-DD format")
+            limit = int(request.GET['limit']) if 'limit' in request.GET else None
+            data, next_cursor = get_appointments_page(appointments, start_date, end_date,
+                                                      cursor=request.GET.get('cursor'), limit=limit)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+        return JsonResponse({'appointments': data, 'next_cursor': next_cursor})
 
     if request.method == 'POST':
         print("POST data received:", request.body)
@@ -104,6 +115,78 @@ def list_appointments(request):
             return JsonResponse({'success': False, 'error': ve.message})
 
 
+@login_required
+def bulk_appointments(request):
+    """
+    POST /appointments/bulk/
+    Admin only --> create, move or cancel many appointments in one transaction
+    Body: {"operations": [{"action": "create"|"move"|"cancel", ...}], "all_or_nothing": false}
+    See appointment.core.bulk_booking.apply_bulk_operations for the fields of each operation.
+    """
+    user = request.user
+    if not (user.is_superuser or user.groups.filter(name="Admins").exists()):
+        return HttpResponseForbidden("You do not have permission")
+    if request.method != 'POST':
+        return HttpResponseBadRequest("Method not allowed")
+
+    try:
+        data = json.loads(request.body)
+        operations = data['operations']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("Expected a JSON body with an 'operations' list")
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return HttpResponseBadRequest("'operations' must be a list of objects")
+    if len(operations) > APPOINTMENT_BULK_MAX_OPERATIONS:
+        return HttpResponseBadRequest(f"At most {APPOINTMENT_BULK_MAX_OPERATIONS} operations per request")
+
+    try:
+        results = apply_bulk_operations(operations, all_or_nothing=bool(data.get('all_or_nothing')))
+    except SlotUnavailableError as e:
+        return JsonResponse({'success': False, 'error': e.message}, status=409)
+    return JsonResponse({
+        'success': not any(r['status'] in ('error', 'skipped') for r in results),
+        'results': results,
+    })
+
+
+@login_required
+def appointment_series(request):
+    """
+    POST /appointments/series/
+    Book a recurring series: every occurrence of the rule that fits is created, the others are reported.
+    Body: {"client_id", "service_id", "staff_id" (user id), "rule": "FREQ=WEEKLY;COUNT=20", "start_date",
+           "start_time", "until" (optional), "additional_info" (optional), "dry_run" (optional)}
+    """
+    user = request.user
+    if request.method != 'POST':
+        return HttpResponseBadRequest("Method not allowed")
+    if not user.has_perm('appointment.add_appointment'):
+        return HttpResponseForbidden()
+
+    try:
+        data = json.loads(request.body)
+        staff = StaffMember.objects.get(user__id=data['staff_id'])
+        service = Service.objects.get(id=data['service_id'])
+        client = Client.objects.get(id=data['client_id'])
+        start_date = datetime.strptime(data['start_date'], "%Y-%m-%d").date()
+        start_time = datetime.strptime(data['start_time'], "%H:%M").time()
+        until = datetime.strptime(data['until'], "%Y-%m-%d").date() if data.get('until') else None
+        series, created, plan = book_series(client, service, staff, data['rule'], start_date, start_time,
+                                            until=until, additional_info=data.get('additional_info', ''),
+                                            dry_run=bool(data.get('dry_run')))
+    except SlotUnavailableError as e:
+        return JsonResponse({'success': False, 'error': e.message}, status=409)
+    except (KeyError, ValueError, TypeError, Client.DoesNotExist, StaffMember.DoesNotExist,
+            Service.DoesNotExist) as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = {'success': True, 'dry_run': series is None, **plan.to_dict()}
+    if series is not None:
+        response['series_id'] = series.id
+        response['appointment_ids'] = [appt.id for appt in created]
+    return JsonResponse(response)
+
+
 @login_required
 def appointment_detail(request, appointment_id):
     """
@@ -198,6 +281,33 @@ def availability(request, service_name, date_str):
     return JsonResponse({'slots': slots})
 
 
+@login_required
+def availability_month(request, service_id, month_str):
+    """
+    GET /availability/month/<service_id>/<YYYY-MM>/?staff_id=<user id>
+    Days of the month on which the service fits, for the month picker (any staff member, or only staff_id).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method Not Allowed'}, status=405)
+    try:
+        month = datetime.strptime(month_str, "%Y-%m").date()
+        service = Service.objects.get(id=service_id)
+        staff = StaffMember.objects.get(user__id=request.GET['staff_id']) if request.GET.get('staff_id') else None
+    except ValueError:
+        return HttpResponseBadRequest("Invalid month format, expected YYYY-MM")
+    except (Service.DoesNotExist, StaffMember.DoesNotExist) as e:
+        return HttpResponseBadRequest(str(e))
+
+    duration_minutes = service.duration.total_seconds() / 60
+    free_runs = get_month_availability(service, month.year, month.month, staff)
+    return JsonResponse({
+        'service_id': service.id,
+        'month': month_str,
+        'days': [{'date': str(day), 'available': free > 0 and free >= duration_minutes, 'max_free_minutes': free}
+                 for day, free in free_runs.items()],
+    })
+
+
 
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
 from reportlab.lib.styles import getSampleStyleSheet
@@ -209,33 +319,91 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 from django.http import HttpResponse
-from weasyprint import HTML
 from datetime import datetime
 import os
 
 @login_required
 def export_medical_history(request, patient_id):
-    patient = get_object_or_404(Client, id=patient_id)
-    record = getattr(patient, "medical_record", None)
-
-    logo_url = request.build_absolute_uri("/static/img/logo_clinic.png")
-     #Cnstruye la url absoluta de la imagen para poder encontrarla al generar el pdf.
-    doctor_signature_url = request.build_absolute_uri("/static/img/signature.png")
-    doctor_name = "Miquel Barón"
-
-    html = render_to_string("reports/medical_report.html", {
-        "patient": patient,
-        "record": record,
-        "generated": datetime.now().strftime("%d/%m/%Y %H:%M"),
-        "logo_url": logo_url,
-        "doctor_signature_url": doctor_signature_url,
-        "doctor_name": doctor_name
-    }) # Sustituye las variables por los valores reales y genera el html completo.
-
-    pdf = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf()
-
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f"attachment; filename=medical_history_{patient_id}.pdf"
+    """
+    GET/export-history/<patient_id>/
+    Downloads the medical history PDF when it is cached. Otherwise its rendering is queued for the run_tasks
+    worker and a 202 is returned with the URL to poll, export-history/<patient_id>/status/.
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+    pdf = get_history_pdf(patient_id)
+    if pdf is None:
+        return JsonResponse({'error': 'Client not found'}, status=404)
+    if pdf.status == 'ready':
+        return FileResponse(open(pdf.path, 'rb'), as_attachment=True, filename=history_filename(patient_id),
+                            content_type="application/pdf")
+    return _history_pdf_status_response(request, pdf, status=202)
+
+
+@login_required
+def medical_history_status(request, patient_id):
+    """
+    GET/export-history/<patient_id>/status/
+    Returns {"status": "pending" | "ready" | "failed", "download_url": ...} for the medical history PDF. A failed
+    rendering is reported rather than retried; requesting the download queues it again.
+    """
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+    pdf = get_history_pdf(patient_id, retry_failed=False)
+    if pdf is None:
+        return JsonResponse({'error': 'Client not found'}, status=404)
+    return _history_pdf_status_response(request, pdf)
+
+
+def _history_pdf_status_response(request, pdf, status=200):
+    data = {
+        'client_id': pdf.client_id,
+        'status': pdf.status,
+        'status_url': request.build_absolute_uri(reverse('appointment:medical_history_status',
+                                                         args=[pdf.client_id])),
+        'download_url': request.build_absolute_uri(reverse('appointment:export_medical_history',
+                                                           args=[pdf.client_id])),
+    }
+    if pdf.error:
+        data['error'] = pdf.error
+    return JsonResponse(data, status=status)
+
+
+@login_required
+def export_medical_histories(request):
+    """
+    GET/export-history/?clients=1,2,3
+    Streams a ZIP of the medical history PDFs of several clients (repeated or comma separated ids) once they are
+    all cached. Until then the missing ones are queued and a 202 is returned with the progress; poll the same URL.
+    Only admins can export several clients at once.
+    """
+    user = request.user
+    if request.method != 'GET':
+        return HttpResponseBadRequest()
+    if not (user.is_superuser or user.groups.filter(name="Admins").exists()):
+        return HttpResponseForbidden()
+    try:
+        client_ids = {int(value) for param in request.GET.getlist('clients') for value in param.split(',')
+                      if value.strip()}
+    except ValueError:
+        return JsonResponse({'error': 'clients must be a list of ids'}, status=400)
+    if not client_ids:
+        return JsonResponse({'error': 'clients is required'}, status=400)
+    if len(client_ids) > APPOINTMENT_PDF_BULK_MAX_CLIENTS:
+        return JsonResponse({'error': f'At most {APPOINTMENT_PDF_BULK_MAX_CLIENTS} clients per export'}, status=400)
+
+    pdfs = get_history_pdfs(client_ids)
+    not_found = sorted(client_ids - set(pdfs))
+    if not_found:
+        return JsonResponse({'error': 'Clients not found', 'clients': not_found}, status=404)
+    pending = sorted(pdf.client_id for pdf in pdfs.values() if pdf.status != 'ready')
+    if pending:
+        return JsonResponse({'status': 'pending', 'ready': len(pdfs) - len(pending), 'total': len(pdfs),
+                             'pending': pending}, status=202)
+
+    response = StreamingHttpResponse(stream_histories_zip(pdfs[client_id] for client_id in sorted(pdfs)),
+                                     content_type="application/zip")
+    response["Content-Disposition"] = "attachment; filename=medical_histories.zip"
     return response
 
 @login_required
@@ -268,8 +436,7 @@ def availability_for_staff(request, staff_id, service_id, day_str):
     service = Service.objects.get(id=service_id)
     day = datetime.strptime(day_str, "%Y-%m-%d").date()
 
-    appointments = Appointment.objects.filter(staff_member=staff, date=day)
-    slots = get_available_slots_for_service(staff, day, service, appointments_of_day=appointments)
+    slots = get_available_slots_for_service(staff, day, service)
 
     # Devolver como ISO strings
     slot_strings = [s.isoformat(sep=" ") for s in slots]
@@ -591,9 +758,6 @@ def set_working_hours(request, staff_id):
         try:
             data = json.loads(request.body)
 
-            # Opcional: borrar horarios anteriores
-            WorkingHours.objects.filter(staff_member=staff_member).delete()
-
             working_hours = []
             for item in data:
                 print("Current item working hours:", item)
@@ -605,8 +769,15 @@ def set_working_hours(request, staff_id):
                         end_time=item["end_time"],
                     )
                 )
-            # Create multiple database objects in one operation
-            WorkingHours.objects.bulk_create(working_hours)
+            with transaction.atomic():
+                # Opcional: borrar horarios anteriores
+                WorkingHours.objects.filter(staff_member=staff_member).delete()
+                # Create multiple database objects in one operation
+                WorkingHours.objects.bulk_create(working_hours)
+                # bulk_create does not send post_save: the index is reset here, and again on commit
+                invalidate_schedule_index()
+                invalidate_staff(staff_member.id)
+                drop_upcoming_summaries(staff_member.id)
             staff_member.set_timetable = True
 
             return JsonResponse({"status": "success"}, status=201)
@@ -674,19 +845,31 @@ def manage_days_off(request, staff_id):
             start_date = datetime.strptime(data["start_date"], "%Y-%m-%d").date()
             end_date = datetime.strptime(data["end_date"], "%Y-%m-%d").date()
             description = data["description"]
+            # "plan" returns the proposed reassignment of the affected appointments, "apply" also writes it.
+            reassign = data.get("reassign")
+            if reassign not in (None, "plan", "apply"):
+                return HttpResponseBadRequest("reassign must be 'plan' or 'apply'")
 
-            day_off = DayOff.objects.create(
-                staff_member=staff_member,
-                start_date=start_date,
-                end_date=end_date,
-                description=description,
-            )
-            return JsonResponse({
+            with transaction.atomic():
+                day_off = DayOff.objects.create(
+                    staff_member=staff_member,
+                    start_date=start_date,
+                    end_date=end_date,
+                    description=description,
+                )
+                plan = reassign_day_off(staff_member, start_date, end_date,
+                                        apply=reassign == "apply") if reassign else None
+            response = {
                 "id": day_off.id,
                 "start_date": str(day_off.start_date),
                 "end_date": str(day_off.end_date),
                 "description": day_off.description,
-            }, status=201)
+            }
+            if plan is not None:
+                response["reassignment"] = plan.to_dict()
+            return JsonResponse(response, status=201)
+        except SlotUnavailableError as e:
+            return JsonResponse({"success": False, "error": e.message}, status=409)
         except Exception as e:
             logger.exception(f"Error creating days off: {str(e)}")
             return HttpResponseBadRequest("Error creating days off")
@@ -734,12 +917,21 @@ def set_staff_services(request, staff_id):
             return JsonResponse({"error": "Staff member not found"}, status=404)
 
 
+@login_required
+def endpoint_metrics(request):
+    """
+    GET /metrics/?top=20&sort=total
+    Admin only --> per-endpoint latency and SQL query statistics, most expensive first
+    """
+    user = request.user
+    if not (user.is_superuser or user.groups.filter(name="Admins").exists()):
+        return HttpResponseForbidden("You do not have permission")
+    if request.method != 'GET':
+        return HttpResponseBadRequest("Method not allowed")
 
-
-
-
-
-
-
-
-
+    try:
+        top = int(request.GET['top']) if 'top' in request.GET else None
+        report = get_endpoint_report(top=top, sort=request.GET.get('sort', 'total'))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"endpoints": report})
@@ -1,9 +1,17 @@
 # appointments/asgi.py
 import os
+from django.conf import settings
 from django.core.asgi import get_asgi_application
-from django.urls import path
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "appointments.settings")
 
 django_asgi_app = get_asgi_application()
 
+# The SSE notification stream is async: serve the project with an ASGI server (uvicorn) so idle connections
+# do not hold a worker thread.
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(django_asgi_app)
+else:
+    application = django_asgi_app
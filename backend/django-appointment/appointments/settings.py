@@ -59,7 +59,8 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
-    "appointment.core.middleware.JsonExceptionMiddleware"
+    "appointment.core.middleware.JsonExceptionMiddleware",
+    "appointment.core.middleware.QueryInstrumentationMiddleware",
 
 ]
 
@@ -108,6 +109,8 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Concurrent bookings queue on the write lock instead of failing when a read transaction is upgraded.
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
     }
 }
 
@@ -178,4 +181,16 @@ ADMINS = [(ADMIN_NAME, ADMIN_EMAIL)] if ADMIN_EMAIL else []
     'orm': 'default',
     'sync': True,
 }
-'''
\ No newline at end of file
+'''
+# Availability is cached through Django's cache framework (local memory by default, one copy per process).
+# To share it between workers, point the cache to redis:
+'''CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379"),
+    }
+}
+'''
+# SSE notifications are fanned out in process by default. With several workers, publish them through redis:
+# APPOINTMENT_NOTIFICATION_BROKER = 'appointment.notifications.broker.RedisBroker'
+# APPOINTMENT_NOTIFICATION_REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
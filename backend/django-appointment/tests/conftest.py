@@ -0,0 +1,30 @@
+import pytest
+from django.core.cache import cache
+
+from appointment.core.config_cache import invalidate_cached_config
+from appointment.core.schedule_index import invalidate_schedule_index
+from appointment.notifications.dispatcher import get_dispatcher
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Database ids are reused between tests, so cached data must not leak from one test to another."""
+    cache.clear()
+    invalidate_cached_config()
+    invalidate_schedule_index()
+    yield
+    # Notifications committed by the test must not be delivered during the next one.
+    get_dispatcher().flush(timeout=10)
+    cache.clear()
+    invalidate_cached_config()
+    invalidate_schedule_index()
+
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix, tmp_path_factory):
+    """Use a file database for SQLite so that tests with concurrent connections queue on its lock."""
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    if database['ENGINE'] == 'django.db.backends.sqlite3':
+        database.setdefault('TEST', {})['NAME'] = str(tmp_path_factory.mktemp('db') / 'test.sqlite3')
@@ -0,0 +1,54 @@
+import pytest
+from datetime import date
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+from appointment.core.appointment_listing import get_appointments_page
+from appointment.models import Appointment
+
+
+@pytest.mark.django_db
+def test_keyset_pages_cover_every_appointment_once_in_order():
+    spec = ClinicSpec(staff_count=4, service_count=2, days=6, booking_density=0.6, client_count=10,
+                      start_date=date(2031, 3, 3))
+    clinic = generate_clinic(spec)
+
+    seen, cursor, pages = [], None, 0
+    with CaptureQueriesContext(connection) as ctx:
+        while True:
+            rows, cursor = get_appointments_page(Appointment.objects.all(), cursor=cursor, limit=7)
+            seen.extend(rows)
+            pages += 1
+            if cursor is None:
+                break
+    # One joined query per page, whatever the number of rows.
+    assert len(ctx.captured_queries) == pages
+
+    expected = list(Appointment.objects.order_by('date', 'start_time', 'id').values_list('id', flat=True))
+    assert [row['id'] for row in seen] == expected
+    assert len(seen) == clinic.appointment_count
+
+    first = Appointment.objects.select_related('client', 'service', 'staff_member__user').get(id=seen[0]['id'])
+    assert seen[0]['client'] == f"{first.client.first_name} {first.client.last_name}"
+    assert seen[0]['service'] == first.service.name
+    assert seen[0]['staff'] == first.staff_member.user.get_full_name()
+
+
+@pytest.mark.django_db
+def test_date_range_filter_and_invalid_cursor():
+    spec = ClinicSpec(staff_count=2, service_count=1, days=5, booking_density=0.5, client_count=5,
+                      start_date=date(2031, 3, 3))
+    generate_clinic(spec)
+
+    rows, cursor = get_appointments_page(Appointment.objects.all(), start_date=date(2031, 3, 4),
+                                         end_date=date(2031, 3, 5))
+    assert cursor is None
+    assert rows and {row['date'] for row in rows} <= {'2031-03-04', '2031-03-05'}
+    assert len(rows) == Appointment.objects.filter(date__range=(date(2031, 3, 4), date(2031, 3, 5))).count()
+
+    with pytest.raises(ValueError):
+        get_appointments_page(Appointment.objects.all(), cursor='not-a-cursor')
+    with pytest.raises(ValueError):
+        get_appointments_page(Appointment.objects.all(), limit=0)
@@ -1,10 +1,21 @@
+import json
 import pytest
 import random
 from datetime import datetime, timedelta, time, date
+from django.core.cache import cache
 
-from django.contrib.auth.models import User
-from appointment.models import StaffMember, Service, WorkingHours, Appointment, Client
-from appointment.core.api_helpers import get_availability_for_service_across_staffs
+from appointment.models import User, StaffMember, Service, WorkingHours, Appointment, Client, DayOff
+from appointment.core.api_helpers import get_availability_for_service_across_staffs, get_available_slots_for_service, \
+    get_available_slots_for_staffs, get_available_slots_for_staffs_in_range, find_available_staff
+from appointment.core.availability_cache import get_cached_availability, set_cached_availability
+from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+from appointment.chatbot_api.views.availability import api_get_availability_range, api_get_availability_services
+from appointment.chatbot_api.views.appointments import appointment as api_appointment
+from appointment.core.availability import (
+    generate_base_slots_for_day, compute_occupied_slots_from_appointments, compute_blocked_slots,
+    filter_slots_for_service, merge_intervals, subtract_intervals, to_dt, StaffSchedule,
+    compute_valid_starts_for_schedule, is_start_bookable
+)
 
 
 @pytest.mark.django_db
@@ -35,7 +46,7 @@ def test_extreme_staff_service_availability():
         end_hour = start_hour + random.randint(4, 7)
         WorkingHours.objects.create(
             staff_member=staff,
-            day_of_week=2,  # Martes
+            day_of_week=1,  # Martes
             start_time=time(start_hour, 0),
             end_time=time(end_hour, 0)
         )
@@ -63,14 +74,15 @@ def test_extreme_staff_service_availability():
         if slot_key in occupied_slots:
             continue
         occupied_slots.add(slot_key)
-        Appointment.objects.create(
+        # Overlapping appointments are rejected by the slot ledger on save(); bulk_create bypasses it, like legacy rows
+        Appointment.objects.bulk_create([Appointment(
             client=client,
             service=service,
             staff_member=staff,
             date=date(2025, 10, 28),
             start_time=time(start_hour, start_minute),
             end_time=(datetime.combine(date.today(), time(start_hour, start_minute)) + service.duration).time()
-        )
+        )])
 
     # Obtener disponibilidad para cada servicio
     for service in services:
@@ -87,3 +99,295 @@ def test_extreme_staff_service_availability():
         assert all_slots > 0, f"No hay slots disponibles para {service.name}"
 
     print("Test extremo completado: disponibilidad comprobada para todos los staffs y servicios.")
+
+
+def test_merge_and_subtract_intervals():
+    d = date(2025, 10, 28)
+    busy = [(to_dt(d, time(11)), to_dt(d, time(12))), (to_dt(d, time(9)), to_dt(d, time(10))),
+            (to_dt(d, time(9, 30)), to_dt(d, time(10, 15))), (to_dt(d, time(12)), to_dt(d, time(12, 30)))]
+    assert merge_intervals(busy) == [(to_dt(d, time(9)), to_dt(d, time(10, 15))),
+                                     (to_dt(d, time(11)), to_dt(d, time(12, 30)))]
+
+    window = (to_dt(d, time(8)), to_dt(d, time(13)))
+    assert subtract_intervals(window, busy) == [(to_dt(d, time(8)), to_dt(d, time(9))),
+                                                (to_dt(d, time(10, 15)), to_dt(d, time(11))),
+                                                (to_dt(d, time(12, 30)), to_dt(d, time(13)))]
+
+
+def _legacy_available_slots(staff, day, service):
+    """Per-slot set scan used before the interval engine."""
+    schedule = StaffSchedule.build(staff)
+    base_slots = generate_base_slots_for_day(schedule, day)
+    if not base_slots:
+        return []
+    slot_td = timedelta(minutes=schedule.slot_minutes)
+    appointments = Appointment.objects.filter(staff_member=staff, date=day)
+    occupied = compute_occupied_slots_from_appointments(schedule, day, base_slots, appointments)
+    blocked = compute_blocked_slots(schedule, day, base_slots, slot_td)
+    wh = WorkingHours.objects.get(staff_member=staff, day_of_week=day.weekday())
+    return filter_slots_for_service(base_slots, slot_td, service.duration, to_dt(day, wh.end_time),
+                                    occupied, blocked)
+
+
+@pytest.mark.django_db
+def test_interval_engine_matches_slot_scan():
+    random.seed(7)
+    day = date(2031, 3, 4)
+    client = Client.objects.create(first_name="Jane", last_name="Doe",
+                                   phone_number="+34123456780", email="jane@example.com")
+    services = [Service.objects.create(name=f"S{d}", duration=timedelta(minutes=d), price=10)
+                for d in (10, 25, 45, 90)]
+
+    for i in range(8):
+        staff = StaffMember.objects.create(user=User.objects.create(username=f"diff{i}"),
+                                           slot_duration=random.choice([10, 15, 20, 30]))
+        start = time(random.randint(7, 10), random.choice([0, 5, 30]))
+        end = time(random.randint(15, 19), random.choice([0, 10, 45]))
+        WorkingHours.objects.create(staff_member=staff, day_of_week=day.weekday(), start_time=start, end_time=end)
+        for _ in range(random.randint(0, 12)):
+            a_start = to_dt(day, time(random.randint(7, 18), random.choice([0, 5, 15, 20, 40])))
+            if Appointment.objects.filter(staff_member=staff, date=day, start_time=a_start.time()).exists():
+                continue
+            # Overlapping on purpose: bulk_create bypasses the slot ledger
+            Appointment.objects.bulk_create([Appointment(
+                client=client, service=services[0], staff_member=staff, date=day, start_time=a_start.time(),
+                end_time=(a_start + timedelta(minutes=random.randint(5, 80))).time())])
+
+        for service in services:
+            assert get_available_slots_for_service(staff, day, service) == _legacy_available_slots(staff, day, service)
+
+
+@pytest.mark.django_db
+def test_availability_across_staffs_uses_fixed_number_of_queries(django_assert_max_num_queries):
+    day = date(2031, 3, 5)
+    client = Client.objects.create(first_name="Jane", last_name="Doe",
+                                   phone_number="+34123456781", email="jane@example.com")
+    service = Service.objects.create(name="Massage", duration=timedelta(minutes=45), price=40)
+    staffs = []
+    for i in range(30):
+        staff = StaffMember.objects.create(user=User.objects.create(username=f"batch{i}"),
+                                           slot_duration=[15, 30][i % 2])
+        staff.services_offered.add(service)
+        WorkingHours.objects.create(staff_member=staff, day_of_week=day.weekday(),
+                                    start_time=time(9), end_time=time(14))
+        Appointment.objects.create(client=client, service=service, staff_member=staff, date=day,
+                                   start_time=time(10 + i % 3), end_time=time(11 + i % 3))
+        staffs.append(staff)
+    DayOff.objects.create(staff_member=staffs[0], start_date=day, end_date=day)
+
+    with django_assert_max_num_queries(6):
+        availability = get_availability_for_service_across_staffs(service.name, day)
+
+    assert availability[staffs[0].user.username] == []
+    for staff in staffs:
+        expected = [s.isoformat(sep=' ') for s in get_available_slots_for_service(staff, day, service)]
+        assert availability[staff.user.username] == expected
+
+
+@pytest.mark.django_db
+def test_availability_range_matches_daily_and_stops_early(rf):
+    start = date(2031, 3, 3)  # Monday
+    patient = Client.objects.create(first_name="Jane", last_name="Doe",
+                                    phone_number="+34123456782", email="jane@example.com")
+    service = Service.objects.create(name="Physio", duration=timedelta(minutes=60), price=30)
+    staffs = []
+    for i in range(3):
+        staff = StaffMember.objects.create(user=User.objects.create(username=f"range{i}"), slot_duration=30)
+        staff.services_offered.add(service)
+        for weekday in range(5):
+            WorkingHours.objects.create(staff_member=staff, day_of_week=weekday,
+                                        start_time=time(9 + i), end_time=time(13))
+        Appointment.objects.create(client=patient, service=service, staff_member=staff,
+                                   date=start + timedelta(days=i), start_time=time(11), end_time=time(12))
+        staffs.append(staff)
+    DayOff.objects.create(staff_member=staffs[1], start_date=start + timedelta(days=2),
+                          end_date=start + timedelta(days=3))
+
+    end = start + timedelta(days=6)
+    window = get_available_slots_for_staffs_in_range(staffs, start, end, service)
+    assert list(window) == [start + timedelta(days=i) for i in range(7)]
+    for day, day_slots in window.items():
+        for staff in staffs:
+            assert day_slots[staff.id] == get_available_slots_for_service(staff, day, service)
+
+    earliest = get_available_slots_for_staffs_in_range(staffs, start, end, service, limit=4)
+    assert list(earliest) == [start]
+    assert sorted(s for slots in earliest[start].values() for s in slots) == \
+        sorted(s for slots in window[start].values() for s in slots)[:4]
+
+    response = api_get_availability_range(rf.get("/v1/chatbot/availability/range/", {
+        "service": "physio", "start_date": str(start), "days": 7, "first": 2}))
+    assert response.status_code == 200
+    assert json.loads(response.content)["slots"] == [{"staff": "range0", "slot": f"{start} 09:00:00"},
+                                        {"staff": "range0", "slot": f"{start} 09:30:00"}]
+
+    response = api_get_availability_range(rf.get("/v1/chatbot/availability/range/", {
+        "service": "physio", "start_date": str(start), "end_date": str(end), "staff": "range1"}))
+    assert response.status_code == 200
+    availability = json.loads(response.content)["availability"]
+    assert len(availability) == 7
+    assert availability[str(start + timedelta(days=2))] == {"range1": []}
+    assert availability[str(start)]["range1"] == [f"{start} 10:00:00", f"{start} 10:30:00",
+                                                  f"{start} 11:00:00", f"{start} 11:30:00", f"{start} 12:00:00"]
+
+
+@pytest.mark.django_db
+def test_cached_availability_is_invalidated_by_signals(django_assert_num_queries):
+    day = date(2031, 3, 6)
+    patient = Client.objects.create(first_name="Jane", last_name="Doe",
+                                    phone_number="+34123456783", email="jane@example.com")
+    service = Service.objects.create(name="Facial", duration=timedelta(minutes=30), price=25)
+    staff = StaffMember.objects.create(user=User.objects.create(username="cached"), slot_duration=30)
+    other = StaffMember.objects.create(user=User.objects.create(username="other"), slot_duration=30)
+    for s in (staff, other):
+        WorkingHours.objects.create(staff_member=s, day_of_week=day.weekday(), start_time=time(9), end_time=time(11))
+
+    assert get_available_slots_for_staffs([staff, other], day, service)[staff.id] == \
+        [to_dt(day, time(9)), to_dt(day, time(9, 30)), to_dt(day, time(10)), to_dt(day, time(10, 30))]
+    with django_assert_num_queries(0):
+        get_available_slots_for_staffs([staff, other], day, service)
+
+    appt = Appointment.objects.create(client=patient, service=service, staff_member=staff, date=day,
+                                      start_time=time(9, 30), end_time=time(10))
+    assert get_available_slots_for_service(staff, day, service) == \
+        [to_dt(day, time(9)), to_dt(day, time(10)), to_dt(day, time(10, 30))]
+
+    appt.staff_member = other
+    appt.save()
+    assert len(get_available_slots_for_service(staff, day, service)) == 4
+    assert len(get_available_slots_for_service(other, day, service)) == 3
+
+    DayOff.objects.create(staff_member=staff, start_date=day, end_date=day)
+    assert get_available_slots_for_service(staff, day, service) == []
+
+    appt.delete()
+    assert len(get_available_slots_for_service(other, day, service)) == 4
+
+
+@pytest.mark.django_db
+def test_availability_cached_before_commit_is_invalidated_on_commit(django_capture_on_commit_callbacks):
+    day = date(2031, 3, 6)
+    patient = Client.objects.create(first_name="Jane", last_name="Doe",
+                                    phone_number="+34123456784", email="jane@example.com")
+    service = Service.objects.create(name="Facial", duration=timedelta(minutes=30), price=25)
+    staff = StaffMember.objects.create(user=User.objects.create(username="racing"), slot_duration=30)
+    WorkingHours.objects.create(staff_member=staff, day_of_week=day.weekday(), start_time=time(9), end_time=time(10))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Appointment.objects.create(client=patient, service=service, staff_member=staff, date=day,
+                                   start_time=time(9), end_time=time(9, 30))
+        # A concurrent reader, which does not see the uncommitted row yet, caches the slots under the new version.
+        _, keys = get_cached_availability([(staff.id, day)], service.duration)
+        set_cached_availability({keys[(staff.id, day)]: ([to_dt(day, time(9)), to_dt(day, time(9, 30))], None)})
+    assert get_available_slots_for_service(staff, day, service) == [to_dt(day, time(9, 30))]
+
+
+@pytest.mark.django_db
+def test_staff_schedules_are_built_in_bulk(django_assert_max_num_queries):
+    staffs = [StaffMember.objects.create(user=User.objects.create(username=f"snap{i}"), slot_duration=15)
+              for i in range(10)]
+    for staff in staffs:
+        WorkingHours.objects.create(staff_member=staff, day_of_week=0, start_time=time(9), end_time=time(17))
+    DayOff.objects.create(staff_member=staffs[0], start_date=date(2031, 3, 3), end_date=date(2031, 3, 4))
+    DayOff.objects.create(staff_member=staffs[0], start_date=date(2031, 3, 5), end_date=date(2031, 3, 5))
+    DayOff.objects.create(staff_member=staffs[0], start_date=date(2031, 3, 10), end_date=date(2031, 3, 12))
+
+    with django_assert_max_num_queries(3):
+        schedules = StaffSchedule.build_many(staffs)
+
+    schedule = schedules[staffs[0].id]
+    assert schedule.days_off == [(date(2031, 3, 3), date(2031, 3, 5)), (date(2031, 3, 10), date(2031, 3, 12))]
+    assert [schedule.is_day_off(date(2031, 3, d)) for d in (2, 3, 5, 6, 10, 12, 13)] == \
+        [False, True, True, False, True, True, False]
+    assert schedule.hours_for(date(2031, 3, 3)) == (time(9), time(17))
+    assert schedule.hours_for(date(2031, 3, 4)) is None
+    assert not schedules[staffs[1].id].is_day_off(date(2031, 3, 3))
+    assert not hasattr(schedule, '__dict__')
+
+
+def test_point_check_matches_full_day_computation():
+    rng = random.Random(5)
+    day = date(2031, 3, 4)
+    for staff_id in range(60):
+        schedule = StaffSchedule(staff_id, rng.choice([10, 15, 20, 30]), 0, {
+            day.weekday(): (time(rng.randint(7, 10), rng.choice([0, 5, 30])),
+                            time(rng.randint(15, 19), rng.choice([0, 10, 45])))})
+        booked = []
+        for _ in range(rng.randint(0, 8)):
+            a_start = to_dt(day, time(rng.randint(7, 18), rng.choice([0, 5, 15, 20, 40])))
+            booked.append((a_start.time(), (a_start + timedelta(minutes=rng.randint(-5, 80))).time()))
+        for minutes in (10, 25, 45, 90):
+            duration = timedelta(minutes=minutes)
+            valid = set(compute_valid_starts_for_schedule(schedule, day, duration, booked))
+            for minute in range(6 * 60, 20 * 60, 5):
+                start = to_dt(day, time(minute // 60, minute % 60))
+                assert is_start_bookable(schedule, day, start, duration, booked) == (start in valid), \
+                    (staff_id, minutes, start)
+
+
+@pytest.mark.django_db
+def test_booking_picks_a_staff_free_at_the_requested_time(rf, django_assert_max_num_queries):
+    day = date(2031, 3, 4)
+    patient = Client.objects.create(first_name="Jane", last_name="Doe",
+                                    phone_number="+34123456783", email="jane@example.com")
+    service = Service.objects.create(name="Massage", duration=timedelta(minutes=30), price=30)
+    staffs = []
+    for i, (start, end) in enumerate([(time(9), time(10)), (time(9), time(18)), (time(9), time(18))]):
+        staff = StaffMember.objects.create(user=User.objects.create(username=f"point{i}"), slot_duration=15)
+        staff.services_offered.add(service)
+        WorkingHours.objects.create(staff_member=staff, day_of_week=day.weekday(), start_time=start, end_time=end)
+        staffs.append(staff)
+    for hour in (9, 10):
+        Appointment.objects.create(client=patient, service=service, staff_member=staffs[1], date=day,
+                                   start_time=time(hour), end_time=time(hour, 30))
+
+    # point0 only works 9-10 and point1 is busier than point2.
+    with django_assert_max_num_queries(4):
+        chosen = find_available_staff(staffs, day, time(15), service)
+    assert chosen == staffs[2]
+    assert find_available_staff(staffs, day, time(15, 5), service) is None
+    assert find_available_staff(staffs[:2], day, time(10), service) is None
+
+    response = api_appointment(rf.post("/v1/chatbot/appointment/", json.dumps({
+        "client_phone": "+34123456783", "service_name": "massage", "date": str(day), "start_time": "15:00",
+    }), content_type="application/json"))
+    assert response.status_code == 200
+    assert json.loads(response.content)["staff"] == "point2"
+
+    # Rescheduling keeps the current staff member when it is free at the new time.
+    response = api_appointment(rf.put("/v1/chatbot/appointment/", json.dumps({
+        "client_phone": "+34123456783", "service_name": "massage", "old_date": str(day), "old_start_time": "15:00",
+        "new_date": str(day), "new_start_time": "15:15",
+    }), content_type="application/json"))
+    assert response.status_code == 200
+    assert json.loads(response.content)["staff"] == "point2"
+
+
+
+@pytest.mark.django_db
+def test_availability_for_several_services_loads_staff_once(rf, django_assert_max_num_queries):
+    clinic = generate_clinic(ClinicSpec(staff_count=6, service_count=3, days=3, booking_density=0.4,
+                                        client_count=5, start_date=date(2031, 3, 3)))
+    start, end = clinic.days[0], clinic.days[-1]
+    usernames = dict(StaffMember.objects.values_list('id', 'user__username'))
+    expected = {}
+    for service in clinic.services:
+        window = get_available_slots_for_staffs_in_range(service.staff_members.order_by('id'), start, end, service)
+        expected[service.name] = {str(day): {usernames[staff_id]: [s.isoformat(sep=' ') for s in slots]
+                                             for staff_id, slots in day_slots.items()}
+                                  for day, day_slots in window.items()}
+
+    cache.clear()
+    names = [service.name for service in clinic.services]
+    request = rf.get(f"/v1/chatbot/availability/services/?services={names[0]},{names[1].upper()}"
+                     f"&services={names[2]}&start_date={start}&end_date={end}")
+    # Services, assignments, staff members, appointments and usernames, plus the schedule index reload after the
+    # cache was cleared, whatever the number of services.
+    with django_assert_max_num_queries(7):
+        response = api_get_availability_services(request)
+    assert response.status_code == 200
+    assert json.loads(response.content)["availability"] == expected
+
+    response = api_get_availability_services(rf.get("/v1/chatbot/availability/services/", {
+        "services": f"{names[0]},Unknown", "date": str(start)}))
+    assert response.status_code == 404
@@ -0,0 +1,69 @@
+import random
+import pytest
+from datetime import date, time, timedelta
+
+from django.core.cache import cache
+
+from appointment.core.availability import StaffSchedule, compute_valid_starts_for_schedule
+
+pytest.importorskip("numpy")
+
+from appointment.core.availability_bitmap import compute_valid_starts_bitmap  # noqa: E402
+
+
+def _random_roster(rng, staff_count, days):
+    schedules, booked = {}, {}
+    for staff_id in range(1, staff_count + 1):
+        working_hours = {
+            weekday: (time(rng.randint(6, 10), rng.choice([0, 5, 10, 30, 45])),
+                      time(rng.randint(14, 21), rng.choice([0, 7, 20, 50])))
+            for weekday in range(7) if rng.random() < 0.8
+        }
+        days_off = [(days[2], days[3])] if rng.random() < 0.2 else []
+        schedules[staff_id] = StaffSchedule(staff_id, rng.choice([5, 10, 15, 20, 30, 45]), 0, working_hours, days_off)
+        for day in days:
+            intervals = []
+            for _ in range(rng.randint(0, 10)):
+                start = timedelta(hours=rng.randint(5, 20), minutes=rng.randint(0, 59), seconds=rng.choice([0, 0, 30]))
+                end = start + timedelta(minutes=rng.randint(-5, 90))
+                as_time = lambda td: time(td.seconds // 3600, td.seconds // 60 % 60, td.seconds % 60)
+                intervals.append((as_time(start), as_time(min(end, timedelta(hours=23, minutes=59)))))
+            booked[(staff_id, day)] = intervals
+    return schedules, booked
+
+
+def test_bitmap_engine_matches_interval_engine():
+    rng = random.Random(11)
+    days = [date(2031, 3, 3) + timedelta(days=i) for i in range(7)]
+    schedules, booked = _random_roster(rng, 40, days)
+    pairs = [(staff_id, day) for day in days for staff_id in schedules]
+
+    for minutes in (5, 10, 25, 45, 61, 90, 240):
+        duration = timedelta(minutes=minutes)
+        bitmap = compute_valid_starts_bitmap(schedules, pairs, duration, booked)
+        for staff_id, day in pairs:
+            expected = compute_valid_starts_for_schedule(schedules[staff_id], day, duration,
+                                                         booked[(staff_id, day)])
+            assert bitmap[(staff_id, day)] == expected, (staff_id, day, minutes)
+
+
+@pytest.mark.django_db
+def test_bitmap_engine_setting_serves_range_queries(monkeypatch):
+    from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+    from appointment.core import api_helpers
+
+    clinic = generate_clinic(ClinicSpec(staff_count=6, service_count=2, days=5, booking_density=0.4,
+                                        client_count=10, start_date=date(2031, 3, 3)))
+    service = clinic.services[1]
+    start, end = clinic.days[0], clinic.days[-1]
+
+    interval = api_helpers.get_available_slots_for_staffs_in_range(clinic.staffs, start, end, service)
+    cache.clear()
+    calls = []
+    monkeypatch.setattr(api_helpers, 'APPOINTMENT_AVAILABILITY_ENGINE', 'bitmap')
+    monkeypatch.setattr(api_helpers, 'compute_valid_starts_bitmap',
+                        lambda *args: calls.append(args) or compute_valid_starts_bitmap(*args))
+    bitmap = api_helpers.get_available_slots_for_staffs_in_range(clinic.staffs, start, end, service)
+    assert len(calls) == 1
+    assert bitmap == interval
+    assert any(slots for day in bitmap.values() for slots in day.values())
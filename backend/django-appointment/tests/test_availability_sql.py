@@ -0,0 +1,64 @@
+import random
+
+import pytest
+from datetime import date, time, timedelta
+
+from django.core.cache import cache
+
+from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+from appointment.core import api_helpers
+from appointment.core.availability import StaffSchedule, compute_valid_starts_for_schedule
+from appointment.core.availability_sql import compute_valid_starts_sql
+from appointment.models import Appointment, StaffMember
+
+
+@pytest.fixture
+def clinic(db):
+    clinic = generate_clinic(ClinicSpec(staff_count=8, service_count=2, days=5, booking_density=0.5,
+                                        client_count=10, start_date=date(2031, 3, 3)))
+    # Legacy rows the ledger would refuse (overlaps, seconds, empty or inverted intervals), written around it.
+    rng = random.Random(5)
+    extra = []
+    for staff in clinic.staffs:
+        for day in clinic.days:
+            for _ in range(rng.randint(0, 4)):
+                start = timedelta(hours=rng.randint(6, 19), minutes=rng.randint(0, 59), seconds=rng.choice([0, 30]))
+                end = start + timedelta(minutes=rng.randint(-5, 75))
+                as_time = lambda td: time(td.seconds // 3600, td.seconds // 60 % 60, td.seconds % 60)
+                extra.append(Appointment(client=clinic.clients[0], service=clinic.services[0], staff_member=staff,
+                                         date=day, start_time=as_time(start), end_time=as_time(end)))
+    Appointment.objects.bulk_create(extra)
+    return clinic
+
+
+def test_sql_engine_matches_interval_engine(clinic):
+    days = clinic.days
+    schedules = StaffSchedule.build_many(clinic.staffs, days[0], days[-1])
+    pairs = [(staff.id, day) for day in days for staff in clinic.staffs]
+    booked = {pair: [] for pair in pairs}
+    for staff_id, day, start, end in Appointment.objects.values_list('staff_member_id', 'date', 'start_time',
+                                                                     'end_time'):
+        booked[(staff_id, day)].append((start, end))
+
+    found = 0
+    for minutes in (5, 15, 25, 45, 61, 90, 240):
+        duration = timedelta(minutes=minutes)
+        computed = compute_valid_starts_sql(schedules, pairs, duration)
+        for staff_id, day in pairs:
+            expected = compute_valid_starts_for_schedule(schedules[staff_id], day, duration, booked[(staff_id, day)])
+            assert computed[(staff_id, day)] == expected, (staff_id, day, minutes)
+            found += len(expected)
+    assert found
+
+
+def test_sql_engine_setting_serves_range_queries(clinic, monkeypatch, django_assert_max_num_queries):
+    service = clinic.services[1]
+    staffs = list(StaffMember.objects.all())
+    start, end = clinic.days[0], clinic.days[-1]
+
+    interval = api_helpers.get_available_slots_for_staffs_in_range(staffs, start, end, service)
+    cache.clear()
+    monkeypatch.setattr(api_helpers, 'APPOINTMENT_AVAILABILITY_ENGINE', 'sql')
+    with django_assert_max_num_queries(4):
+        sql = api_helpers.get_available_slots_for_staffs_in_range(staffs, start, end, service)
+    assert sql == interval
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+from datetime import date, time, timedelta
+
+from appointment.core.availability import StaffSchedule, compute_valid_starts_for_schedule
+from appointment.core.availability_summary import get_month_availability, summarize_day
+from appointment.models import (
+    Appointment, Client, DailyAvailability, DayOff, Service, StaffMember, User, WorkingHours
+)
+
+DAY = date(2031, 3, 4)
+
+
+def test_longest_free_run_tells_whether_a_service_fits():
+    rng = random.Random(7)
+    for _ in range(300):
+        slot = rng.choice([10, 15, 20, 30])
+        start = time(rng.randint(7, 10), rng.choice([0, 5, 30]))
+        end = time(rng.randint(13, 19), rng.choice([0, 10, 45]))
+        schedule = StaffSchedule(1, slot, 0, {DAY.weekday(): (start, end)})
+        booked = []
+        for _ in range(rng.randint(0, 8)):
+            minute = rng.randrange(6 * 60, 20 * 60)
+            length = rng.randint(5, 90)
+            booked.append((time(minute // 60, minute % 60), time(*divmod(min(minute + length, 23 * 60), 60))))
+
+        longest, total = summarize_day(schedule, DAY, booked)
+        assert longest <= total
+        for minutes in (5, 15, 25, 45, 60, 90, 120, 240):
+            fits = bool(compute_valid_starts_for_schedule(schedule, DAY, timedelta(minutes=minutes), booked))
+            assert fits == (longest >= minutes), (slot, start, end, booked, minutes)
+
+
+@pytest.fixture
+def clinic(db):
+    service = Service.objects.create(name="Long treatment", duration=timedelta(minutes=90), price=80)
+    staff = StaffMember.objects.create(user=User.objects.create(username="month"), slot_duration=30)
+    staff.services_offered.add(service)
+    WorkingHours.objects.create(staff_member=staff, day_of_week=DAY.weekday(), start_time=time(9), end_time=time(12))
+    client = Client.objects.create(first_name="Jane", last_name="Doe", phone_number="+34123456781",
+                                   email="jane@example.com")
+    return service, staff, client
+
+
+def test_month_view_is_one_query_and_follows_changes(clinic, django_assert_num_queries):
+    service, staff, client = clinic
+    month = get_month_availability(service, DAY.year, DAY.month)
+    assert len(month) == 31
+    assert month[DAY] == 180 and month[DAY + timedelta(days=1)] == 0
+    assert DailyAvailability.objects.filter(date__month=DAY.month).count() == 31
+
+    with django_assert_num_queries(1):
+        assert get_month_availability(service, DAY.year, DAY.month, staff)[DAY] == 180
+
+    Appointment.objects.create(client=client, service=service, staff_member=staff, date=DAY,
+                               start_time=time(10), end_time=time(10, 30))
+    assert get_month_availability(service, DAY.year, DAY.month)[DAY] == 90
+    assert DailyAvailability.objects.get(staff_member=staff, date=DAY).free_minutes == 150
+
+    DayOff.objects.create(staff_member=staff, start_date=DAY, end_date=DAY)
+    assert DailyAvailability.objects.get(staff_member=staff, date=DAY).max_free_minutes == 0
+    assert get_month_availability(service, DAY.year, DAY.month)[DAY] == 0
+
+
+def test_schedule_change_only_replaces_the_rows_of_its_staff_member(clinic, client):
+    service, staff, _ = clinic
+    other = StaffMember.objects.create(user=User.objects.create(username="colleague"), slot_duration=30)
+    other.services_offered.add(service)
+    WorkingHours.objects.create(staff_member=other, day_of_week=DAY.weekday(), start_time=time(14), end_time=time(15))
+    get_month_availability(service, DAY.year, DAY.month)
+    kept = dict(DailyAvailability.objects.filter(staff_member=other).values_list('id', 'max_free_minutes'))
+    assert len(kept) == 31
+
+    # Hours set through the view are bulk written: the summaries of the staff member follow all the same.
+    client.force_login(staff.user)
+    response = client.post(f"/v1/api/working_hours/staff/{staff.id}/", content_type="application/json",
+                           data=[{"day_of_week": DAY.weekday(), "start_time": "09:00", "end_time": "13:00"}])
+    assert response.status_code == 201
+    assert dict(DailyAvailability.objects.filter(staff_member=other).values_list('id', 'max_free_minutes')) == kept
+    assert DailyAvailability.objects.filter(staff_member=staff).count() == 31
+    assert get_month_availability(service, DAY.year, DAY.month)[DAY] == 240
+
+    DayOff.objects.create(staff_member=staff, start_date=DAY, end_date=DAY)
+    assert dict(DailyAvailability.objects.filter(staff_member=other).values_list('id', 'max_free_minutes')) == kept
+    assert get_month_availability(service, DAY.year, DAY.month)[DAY] == 60
@@ -0,0 +1,30 @@
+import pytest
+from datetime import date
+
+from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+from appointment.benchmarks.runner import build_report, compare_reports, measure
+from appointment.core.api_helpers import get_availability_for_service_across_staffs
+from appointment.models import Appointment, DayOff, WorkingHours
+
+
+@pytest.mark.django_db
+def test_generate_clinic_and_measure_availability():
+    spec = ClinicSpec(staff_count=6, service_count=3, days=5, booking_density=0.4, days_off_ratio=0.5,
+                      client_count=10, start_date=date(2031, 3, 3))
+    clinic = generate_clinic(spec)
+
+    assert len(clinic.staffs) == 6
+    assert WorkingHours.objects.filter(staff_member__in=clinic.staffs).count() >= 6 * 5
+    assert DayOff.objects.count() == 3
+    assert Appointment.objects.count() == clinic.appointment_count > 0
+
+    service = clinic.services[0]
+    result = measure("availability", lambda run: get_availability_for_service_across_staffs(service.name,
+                                                                                            spec.start_date),
+                     repeat=2)
+    assert result["runs"] == 2
+    assert 0 < result["queries"] <= 6
+
+    report = build_report(clinic, [result])
+    assert report["clinic"]["appointments"] == clinic.appointment_count
+    assert len(compare_reports(report, report)) == 1
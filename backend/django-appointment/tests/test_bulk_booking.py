@@ -0,0 +1,106 @@
+import pytest
+from datetime import date, time, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from appointment.benchmarks.generator import ClinicSpec, generate_clinic
+from appointment.core.bulk_booking import apply_bulk_operations
+from appointment.models import Appointment, Client, Service, SlotOccupancy, StaffMember, User
+
+DAY = date(2031, 3, 4)
+
+
+@pytest.fixture
+def clinic(db):
+    service = Service.objects.create(name="Bulk", duration=timedelta(minutes=30), price=10)
+    # Users that are not staff members, so that user ids and staff member ids differ.
+    User.objects.create(username="receptionist")
+    User.objects.create(username="patient")
+    staffs = [StaffMember.objects.create(user=User.objects.create(username=f"bulk{i}"), slot_duration=15)
+              for i in range(2)]
+    client = Client.objects.create(first_name="Jane", last_name="Doe", phone_number="+34123456784",
+                                   email="jane@example.com")
+    existing = Appointment.objects.create(client=client, service=service, staff_member=staffs[0], date=DAY,
+                                          start_time=time(10), end_time=time(10, 30))
+    return service, staffs, client, existing
+
+
+def _create(service, staff, client, start, **extra):
+    return dict(action="create", client_id=client.id, service_id=service.id, staff_id=staff.user.id, date=str(DAY),
+                start_time=start, **extra)
+
+
+def test_bulk_operations_report_per_item_results(clinic):
+    service, staffs, client, existing = clinic
+    results = apply_bulk_operations([
+        _create(service, staffs[0], client, "09:00"),
+        _create(service, staffs[0], client, "11:15"),       # hits the moved appointment
+        _create(service, staffs[0], client, "09:15"),       # hits the first item
+        _create(service, staffs[1], client, "10:00"),
+        dict(action="move", appointment_id=existing.id, start_time="11:00"),
+        _create(service, staffs[0], client, "10:00"),       # free once the existing one has moved
+        _create(service, staffs[1], client, "10:20"),       # hits staff 1's new appointment
+        dict(action="cancel", appointment_id=999999),
+        dict(action="teleport"),
+    ])
+    assert [r["status"] for r in results] == ["created", "error", "error", "created", "moved", "created",
+                                              "error", "error", "error"]
+    assert results[1]["error"] == "Overlaps another appointment of the request"
+    assert results[7]["error"] == "Unknown or missing appointment_id"
+
+    results = apply_bulk_operations([_create(service, staffs[1], client, "10:15")])
+    assert results[0]["error"] == "Overlaps an existing appointment"
+
+    existing.refresh_from_db()
+    assert (existing.start_time, existing.end_time) == (time(11), time(11, 30))
+    assert Appointment.objects.filter(staff_member=staffs[0]).count() == 3
+    assert SlotOccupancy.objects.count() == 6 * 4
+
+
+def test_rejected_move_keeps_its_place(clinic):
+    service, staffs, client, existing = clinic
+    Appointment.objects.create(client=client, service=service, staff_member=staffs[0], date=DAY,
+                               start_time=time(12), end_time=time(12, 30))
+    results = apply_bulk_operations([
+        dict(action="move", appointment_id=existing.id, start_time="12:00"),
+        _create(service, staffs[0], client, "10:00"),
+    ])
+    assert [r["status"] for r in results] == ["error", "error"]
+
+    results = apply_bulk_operations([
+        _create(service, staffs[0], client, "09:00"),
+        dict(action="cancel", appointment_id=existing.id),
+        _create(service, staffs[0], client, "13:00", end_time="12:00"),
+    ], all_or_nothing=True)
+    assert [r["status"] for r in results] == ["skipped", "skipped", "error"]
+    assert Appointment.objects.filter(pk=existing.pk).exists()
+
+
+def test_staff_is_referenced_by_user_id(clinic):
+    service, staffs, client, existing = clinic
+    results = apply_bulk_operations([
+        dict(action="move", appointment_id=existing.id, staff_id=staffs[1].user.id),
+        dict(_create(service, staffs[1], client, "09:00"), staff_id=staffs[1].id),
+    ])
+    assert results[0]["status"] == "moved"
+    assert results[1]["error"] == "Unknown or missing client_id, service_id or staff_id"
+    existing.refresh_from_db()
+    assert existing.staff_member == staffs[1]
+
+
+@pytest.mark.django_db
+def test_moving_a_whole_day_uses_a_fixed_number_of_queries():
+    spec = ClinicSpec(staff_count=10, service_count=2, days=2, booking_density=0.5, client_count=20,
+                      start_date=date(2031, 3, 3))
+    clinic = generate_clinic(spec)
+    day = Appointment.objects.filter(date=spec.start_date)
+    count = day.count()
+    operations = [dict(action="move", appointment_id=pk, date="2031-03-10") for pk in day.values_list('pk', flat=True)]
+
+    with CaptureQueriesContext(connection) as ctx:
+        results = apply_bulk_operations(operations)
+    assert all(r["status"] == "moved" for r in results)
+    assert Appointment.objects.filter(date=date(2031, 3, 10)).count() == count
+    assert len(ctx.captured_queries) < 20
+    assert SlotOccupancy.objects.filter(date=date(2031, 3, 10)).count() > 0
@@ -0,0 +1,65 @@
+import pytest
+from datetime import time
+
+from django.core.cache import cache
+
+from appointment.core import config_cache
+from appointment.core.db_helpers import get_appointment_slot_duration, get_config
+from appointment.models import User, Config, StaffMember
+
+
+@pytest.mark.django_db
+def test_config_reads_are_cached_and_invalidated_on_save(django_assert_num_queries):
+    Config.objects.create(slot_duration=20, lead_time=time(8), finish_time=time(17), appointment_buffer_time=0)
+    staff = StaffMember.objects.create(user=User.objects.create(username="config"), slot_duration=None)
+
+    assert staff.get_slot_duration() == 20
+    with django_assert_num_queries(0):
+        assert staff.get_slot_duration() == 20
+        assert staff.get_lead_time() == time(8)
+        assert staff.get_finish_time() == time(17)
+        assert get_appointment_slot_duration() == 20
+        assert get_config().slot_duration == 20
+
+    config = Config.objects.first()
+    config.slot_duration = 45
+    config.save()
+    assert staff.get_slot_duration() == 45
+
+
+@pytest.mark.django_db
+def test_config_is_reloaded_when_another_process_saves_it(monkeypatch):
+    Config.objects.create(slot_duration=20, lead_time=time(8), finish_time=time(17))
+    assert get_config().slot_duration == 20
+
+    # Simulate another worker: the row changes and the shared version is bumped, the local copy is untouched.
+    Config.objects.update(slot_duration=10)
+    cache.incr('config:version')
+    assert get_config().slot_duration == 20
+
+    monkeypatch.setattr(config_cache, 'APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL', 0)
+    assert get_config().slot_duration == 10
+
+
+@pytest.mark.django_db
+def test_config_loaded_before_commit_is_reloaded_on_commit(monkeypatch, django_capture_on_commit_callbacks):
+    config = Config.objects.create(slot_duration=20, lead_time=time(8), finish_time=time(17))
+    stale = Config.objects.get(pk=config.pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        config.slot_duration = 30
+        config.save()
+        # Another process, which does not see the uncommitted row, reloads the config under the bumped version.
+        seen = cache.get('config:version')
+
+    config_cache._state = (stale, seen, 0)
+    monkeypatch.setattr(config_cache, 'APPOINTMENT_CONFIG_CACHE_CHECK_INTERVAL', 0)
+    assert get_config().slot_duration == 30
+
+
+@pytest.mark.django_db
+def test_config_is_forgotten_when_deleted():
+    Config.objects.create(slot_duration=20, lead_time=time(8), finish_time=time(17))
+    assert get_config().slot_duration == 20
+    # Config.delete() is a no-op: the row can only go through a queryset, as the admin's bulk delete does.
+    Config.objects.all().delete()
+    assert get_config() is None
@@ -0,0 +1,103 @@
+import pytest
+from datetime import timedelta
+
+from django.core import mail
+from django.utils import timezone
+
+from appointment.core import email_outbox
+from appointment.core.email_outbox import Email, queue_email, queue_emails, send_pending_emails
+from appointment.models import OutgoingEmail, Task
+
+TEMPLATE = 'mail/reminder_email.html'
+
+
+def _email(recipient, n, dedup_key=''):
+    return Email(recipient, f"Reminder {n}", TEMPLATE, {'first_name': recipient.split('@')[0], 'service': 'Massage',
+                                                         'date': '04/03/2031', 'start_time': f'{8 + n}:00'},
+                 dedup_key=dedup_key)
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+    connect = email_outbox.get_connection
+
+    def get_connection():
+        backend = connect()
+        opened.append(backend)
+        return backend
+    monkeypatch.setattr(email_outbox, 'get_connection', get_connection)
+    return opened
+
+
+@pytest.mark.django_db
+def test_queued_emails_are_deduplicated_and_sent_one_connection_per_batch(connections, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        assert queue_emails(_email(f"client{i}@example.com", i, dedup_key='day') for i in range(5)) == 5
+        assert queue_emails([_email("client0@example.com", 0, dedup_key='day'),
+                             _email("client0@example.com", 1, dedup_key='other')]) == 1
+        assert queue_email("client0@example.com", "Again", TEMPLATE, dedup_key='day') is False
+    # One sender task is waiting, however many emails were queued.
+    assert Task.objects.filter(name=email_outbox.SENDER_TASK, status='pending').count() == 1
+
+    assert send_pending_emails(batch_size=4) == 6
+    assert len(connections) == 2
+    assert sorted(m.to[0] for m in mail.outbox) == sorted(["client0@example.com"] * 2 +
+                                                          [f"client{i}@example.com" for i in range(1, 5)])
+    assert "Hello client3" in next(m for m in mail.outbox if m.to == ["client3@example.com"]).body
+    assert set(OutgoingEmail.objects.values_list('status', flat=True)) == {'sent'}
+    assert send_pending_emails() == 0
+
+
+@pytest.mark.django_db
+def test_rate_limits_defer_emails(monkeypatch):
+    monkeypatch.setattr(email_outbox, 'APPOINTMENT_EMAIL_MAX_PER_RECIPIENT', 2)
+    queue_emails(_email("busy@example.com", i) for i in range(3))
+    queue_emails([_email("calm@example.com", 9)])
+
+    assert send_pending_emails() == 3
+    deferred = OutgoingEmail.objects.get(status='pending')
+    assert deferred.recipient == "busy@example.com" and deferred.send_after > timezone.now() + timedelta(minutes=30)
+    assert Task.objects.filter(name=email_outbox.SENDER_TASK, status='pending', run_at=deferred.send_after).exists()
+
+    monkeypatch.setattr(email_outbox, 'APPOINTMENT_EMAIL_MAX_PER_RECIPIENT', 10)
+    monkeypatch.setattr(email_outbox, 'APPOINTMENT_EMAIL_MAX_PER_MINUTE', 4)
+    OutgoingEmail.objects.filter(pk=deferred.pk).update(send_after=timezone.now())
+    queue_emails([_email("calm@example.com", 8)])
+    # Three were sent in the last minute: only one more fits.
+    assert send_pending_emails() == 1
+    assert OutgoingEmail.objects.filter(status='pending').count() == 1
+
+
+@pytest.mark.django_db
+def test_failed_sends_are_retried_then_given_up(monkeypatch):
+    monkeypatch.setattr(email_outbox, 'APPOINTMENT_EMAIL_MAX_ATTEMPTS', 2)
+    queue_emails([_email("ok@example.com", 1), _email("broken@example.com", 2)])
+    render = email_outbox.render_email
+
+    def flaky_render(email):
+        if email.recipient.startswith('broken'):
+            raise RuntimeError("template exploded")
+        return render(email)
+    monkeypatch.setattr(email_outbox, 'render_email', flaky_render)
+
+    assert send_pending_emails() == 1
+    broken = OutgoingEmail.objects.get(recipient="broken@example.com")
+    assert (broken.status, broken.attempts) == ('pending', 1) and "exploded" in broken.last_error
+
+    OutgoingEmail.objects.filter(pk=broken.pk).update(send_after=timezone.now())
+    assert send_pending_emails() == 0
+    broken.refresh_from_db()
+    assert (broken.status, broken.attempts) == ('failed', 2)
+
+
+def test_templates_are_compiled_once(monkeypatch):
+    email_outbox.get_compiled_template.cache_clear()
+    compiled = []
+    get_template = email_outbox.get_template
+    monkeypatch.setattr(email_outbox, 'get_template', lambda name: compiled.append(name) or get_template(name))
+    for i in range(3):
+        email_outbox.render_email(OutgoingEmail(recipient="a@example.com", subject="s", template_name=TEMPLATE,
+                                                context={'first_name': str(i)}))
+    assert compiled == [TEMPLATE]
+    email_outbox.get_compiled_template.cache_clear()
@@ -0,0 +1,97 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from django.db import DatabaseError
+from django.urls import ResolverMatch
+
+from appointment.core.instrumentation import aggregator, fingerprint_sql, get_endpoint_report
+from appointment.core.middleware import QueryInstrumentationMiddleware
+from appointment.models import Service, EndpointMetric
+
+
+@pytest.fixture(autouse=True)
+def clean_aggregator():
+    aggregator.reset()
+    yield
+    aggregator.reset()
+
+
+def _view(request):
+    # One list query followed by an N+1 style lookup per row.
+    for service in list(Service.objects.all()):
+        Service.objects.filter(pk=service.pk).exists()
+    return 'ok'
+
+
+def test_fingerprint_collapses_parameters():
+    assert fingerprint_sql('SELECT * FROM t WHERE id IN (%s, %s, %s)') == fingerprint_sql(
+        'SELECT * FROM t WHERE id IN (%s)')
+    assert fingerprint_sql("SELECT * FROM t WHERE name = 'a' LIMIT 1") == fingerprint_sql(
+        "SELECT * FROM t WHERE name = 'b' LIMIT 21")
+
+
+@pytest.mark.django_db
+def test_middleware_records_queries_and_duplicates(rf):
+    for i in range(3):
+        Service.objects.create(name=f"Service {i}", duration=timedelta(minutes=30), price=10)
+
+    middleware = QueryInstrumentationMiddleware(_view)
+    for _ in range(2):
+        request = rf.get('/services/')
+        request.resolver_match = ResolverMatch(_view, (), {}, url_name='services_list')
+        assert middleware(request) == 'ok'
+
+    unresolved = rf.get('/missing/')
+    middleware(unresolved)
+
+    report = get_endpoint_report()
+    assert [row['url_name'] for row in report] == ['services_list']
+    row = report[0]
+    assert row['requests'] == 2
+    assert row['mean_queries'] == 4
+    assert row['max_queries'] == 4
+    assert list(row['duplicate_queries'].values()) == [4]
+
+    # A second flush merges into the same row.
+    request = rf.get('/services/')
+    request.resolver_match = ResolverMatch(_view, (), {}, url_name='services_list')
+    middleware(request)
+    aggregator.flush()
+    assert EndpointMetric.objects.get(url_name='services_list').requests == 3
+
+
+@pytest.mark.django_db
+def test_middleware_flushes_in_a_background_thread(rf, monkeypatch):
+    flushed_by = []
+    monkeypatch.setattr(aggregator, 'flush_interval', 0)
+    monkeypatch.setattr(aggregator, 'flush', lambda: flushed_by.append(threading.current_thread()))
+
+    request = rf.get('/services/')
+    request.resolver_match = ResolverMatch(_view, (), {}, url_name='services_list')
+    QueryInstrumentationMiddleware(_view)(request)
+    aggregator.flush_in_background().result(timeout=10)
+    assert flushed_by and threading.current_thread() not in flushed_by
+
+
+@pytest.mark.django_db
+def test_failed_flush_keeps_the_statistics(rf, monkeypatch):
+    middleware = QueryInstrumentationMiddleware(_view)
+
+    def request():
+        r = rf.get('/services/')
+        r.resolver_match = ResolverMatch(_view, (), {}, url_name='services_list')
+        middleware(r)
+
+    request()
+    with monkeypatch.context() as m:
+        def fail(*args, **kwargs):
+            raise DatabaseError("database is locked")
+        m.setattr(EndpointMetric, 'save', fail)
+        aggregator.flush()
+    assert not EndpointMetric.objects.exists()
+
+    # Merged with the requests recorded since the failure.
+    request()
+    aggregator.flush()
+    assert EndpointMetric.objects.get(url_name='services_list').requests == 2
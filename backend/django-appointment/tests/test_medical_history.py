@@ -0,0 +1,105 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from appointment.core import medical_history
+from appointment.core.medical_history import get_history_pdf, get_history_pdfs, render_history_pdf
+from appointment.models import Client, MedicalRecord, Task, User
+
+
+@pytest.fixture
+def renders(monkeypatch, tmp_path):
+    """Cache PDFs in a temporary directory and replace WeasyPrint with a recorder of the rendered HTML."""
+    rendered = []
+    monkeypatch.setattr(medical_history, 'APPOINTMENT_PDF_CACHE_DIR', str(tmp_path))
+
+    def render_pdf(html):
+        rendered.append(html)
+        return b'%PDF-1.7\n' + html.encode()
+    monkeypatch.setattr(medical_history, 'render_pdf', render_pdf)
+    return rendered
+
+
+def _patients(n):
+    clients = [Client.objects.create(first_name=f"Patient{i}", last_name="Doe", phone_number=f"+3412345{i:04d}",
+                                     email=f"patient{i}@example.com") for i in range(n)]
+    for client in clients:
+        MedicalRecord.objects.create(client=client, blood_type="A+", allergies=f"Allergy of {client.first_name}")
+    return clients
+
+
+def _run_render_tasks():
+    tasks = list(Task.objects.filter(name=medical_history.RENDER_TASK, status='pending'))
+    for task in tasks:
+        render_history_pdf(*task.args, **task.kwargs)
+        Task.objects.filter(id=task.id).update(status='done')
+    return len(tasks)
+
+
+@pytest.mark.django_db
+def test_pdfs_are_rendered_once_per_version(renders):
+    client, = _patients(1)
+    assert get_history_pdf(client.id).status == 'pending'
+    # Polling does not queue the rendering again.
+    assert get_history_pdf(client.id).status == 'pending'
+    assert _run_render_tasks() == 1
+
+    pdf = get_history_pdf(client.id)
+    assert pdf.status == 'ready'
+    with open(pdf.path, 'rb') as f:
+        assert b"Allergy of Patient0" in f.read()
+    assert get_history_pdf(client.id).path == pdf.path and _run_render_tasks() == 0
+    assert len(renders) == 1
+
+    # An edit of the record makes a new version; the old file is removed once it is rendered.
+    MedicalRecord.objects.filter(client=client).update(allergies="Penicillin")
+    updated = get_history_pdf(client.id)
+    assert updated.status == 'pending' and updated.version != pdf.version
+    assert _run_render_tasks() == 1
+    assert get_history_pdf(client.id).status == 'ready' and "Penicillin" in renders[-1]
+    assert os.listdir(os.path.dirname(pdf.path)) == [os.path.basename(updated.path)]
+
+
+@pytest.mark.django_db
+def test_failed_rendering_is_reported_then_retried_on_request(renders):
+    client, = _patients(1)
+    pdf = get_history_pdf(client.id)
+    Task.objects.filter(name=medical_history.RENDER_TASK).update(
+        status='failed', last_error="Traceback...\nOSError: cannot load library 'pango'")
+
+    failed = get_history_pdf(client.id, retry_failed=False)
+    assert failed.status == 'failed' and failed.error == "OSError: cannot load library 'pango'"
+    assert get_history_pdf(client.id).status == 'pending'
+    queued = Task.objects.filter(name=medical_history.RENDER_TASK, status='pending')
+    assert [task.args for task in queued] == [[client.id, pdf.version]]
+    assert get_history_pdf(client.id, retry_failed=False).status == 'pending'
+
+
+@pytest.mark.django_db
+def test_bulk_export_streams_a_zip_once_every_pdf_is_ready(renders, client, django_assert_max_num_queries):
+    patients = _patients(5)
+    client.force_login(User.objects.create(username='admin', is_superuser=True))
+    url = f"/v1/api/export-history/?clients={','.join(str(p.id) for p in patients[:3])}&clients={patients[4].id}"
+
+    response = client.get(url)
+    assert response.status_code == 202
+    assert response.json()['pending'] == sorted([p.id for p in patients[:3]] + [patients[4].id])
+    assert _run_render_tasks() == 4
+
+    with django_assert_max_num_queries(6):
+        get_history_pdfs(p.id for p in patients[:4])
+    response = client.get(url)
+    assert response.status_code == 200 and response.streaming
+    chunks = list(response.streaming_content)
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.namelist() == [f"medical_history_{p.id}.pdf" for p in patients[:3] + [patients[4]]]
+        assert archive.read(f"medical_history_{patients[4].id}.pdf").startswith(b'%PDF')
+    assert len(renders) == 4
+
+    single = client.get(f"/v1/api/export-history/{patients[0].id}/")
+    assert single.status_code == 200 and b''.join(single.streaming_content).startswith(b'%PDF')
+    status = client.get(f"/v1/api/export-history/{patients[3].id}/status/").json()
+    assert status['status'] == 'pending'
+    assert client.get(f"/v1/api/export-history/?clients={patients[0].id},999999").status_code == 404
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+
+from appointment.models import User, Notification
+from appointment.notifications.broker import InProcessBroker, get_broker
+from appointment.notifications.sse import notification_stream, add_notification_to_queue
+
+
+def _stream_request(rf, user, **headers):
+    request = rf.get('/stream/', **headers)
+    request.user = user
+
+    async def auser():
+        return user
+    request.auser = auser
+    return request
+
+
+@pytest.mark.django_db
+def test_stream_replays_missed_notifications_then_delivers_live_events(rf):
+    user = User.objects.create_user(username='dashboard', password='x')
+    missed = [Notification.objects.create(user=user, message={"type": "appointment.created", "n": i})
+              for i in range(3)]
+    request = _stream_request(rf, user, HTTP_LAST_EVENT_ID=str(missed[0].id))
+
+    async def consume():
+        response = await notification_stream(request)
+        stream = response.streaming_content
+        chunks = [await stream.__anext__() for _ in range(3)]
+
+        live = await Notification.objects.acreate(user=user, message={"type": "appointment.deleted"})
+        # Published from another thread, as a request in another worker thread would.
+        await sync_to_async(add_notification_to_queue, thread_sensitive=False)(
+            user.id, live.message, event_id=live.id)
+        # An event already replayed is not sent twice.
+        add_notification_to_queue(user.id, missed[1].message, event_id=missed[1].id)
+        chunks.append(await asyncio.wait_for(stream.__anext__(), 2))
+        await stream.aclose()
+        return chunks, live
+
+    chunks, live = async_to_sync(consume)()
+    assert b'"connected"' in chunks[0]
+    assert chunks[1].startswith(f"id: {missed[1].id}\n".encode())
+    assert chunks[2].startswith(f"id: {missed[2].id}\n".encode())
+    assert chunks[3].startswith(f"id: {live.id}\n".encode())
+    assert b'appointment.deleted' in chunks[3]
+    assert get_broker().connection_count() == 0
+
+
+def test_in_process_broker_fans_out_to_every_connection_of_a_user():
+    broker = InProcessBroker()
+
+    async def run():
+        first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+        broker.publish(1, 7, {"type": "x"})
+        events = [await first.get(1), await second.get(1), await other.get(0.05)]
+        for subscription in (first, second, other):
+            subscription.close()
+        return events
+
+    events = asyncio.run(run())
+    assert events == [{"id": 7, "data": {"type": "x"}}, {"id": 7, "data": {"type": "x"}}, None]
+    assert broker.connection_count() == 0
@@ -0,0 +1,89 @@
+import pytest
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import Group
+from django.db import transaction
+
+from appointment.models import Appointment, Client, Notification, Service, StaffMember, User
+from appointment.notifications import dispatcher as notifications
+from appointment.notifications.dispatcher import NotificationDispatcher, get_admin_ids
+
+DAY = date(2031, 3, 4)
+
+
+@pytest.fixture
+def booking(db):
+    admins = Group.objects.create(name='Admins')
+    admin = User.objects.create(username='boss')
+    admin.groups.add(admins)
+    service = Service.objects.create(name="Massage", duration=timedelta(minutes=30), price=40)
+    staff = StaffMember.objects.create(user=User.objects.create(username='therapist', first_name='Ana'))
+    client = Client.objects.create(first_name="Jane", last_name="Doe", phone_number="+34123456790",
+                                   email="jane@example.com")
+    return admin, service, staff, client
+
+
+def _book(service, staff, client, hour):
+    return Appointment.objects.create(client=client, service=service, staff_member=staff, date=DAY,
+                                      start_time=time(hour), end_time=time(hour, 30))
+
+
+def test_notifications_wait_for_commit_and_are_coalesced(booking, monkeypatch, django_capture_on_commit_callbacks,
+                                                         django_assert_max_num_queries):
+    admin, service, staff, client = booking
+    dispatcher = NotificationDispatcher(workers=0)
+    monkeypatch.setattr(notifications, '_dispatcher', dispatcher)
+    submitted = []
+    monkeypatch.setattr(dispatcher, 'submit', submitted.append)
+
+    with pytest.raises(RuntimeError):
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                _book(service, staff, client, 9)
+                raise RuntimeError("rolled back")
+    assert not callbacks and not submitted
+
+    with django_capture_on_commit_callbacks(execute=True):
+        appointments = [_book(service, staff, client, hour) for hour in (10, 11, 12)]
+        appointments[0].delete()
+    assert [event.type for event in submitted] == ["appointment.created"] * 3 + ["appointment.deleted"]
+    assert not Notification.objects.exists()
+
+    # Clients, services, staff members, admins and one insert, whatever the number of events.
+    with django_assert_max_num_queries(5):
+        assert notifications.deliver_events(submitted) == 8
+    stored = Notification.objects.filter(user=staff.user).order_by('id')
+    assert [n.message["start_time"] for n in stored] == ["10:00:00", "11:00:00", "12:00:00", "10:00:00"]
+    assert stored[3].message["client"] == "Jane Doe" and stored[3].message["staff"] == "Ana"
+    assert Notification.objects.filter(user=admin).count() == 4
+
+
+def test_admin_recipients_are_cached_until_the_group_changes(booking, django_assert_num_queries):
+    admin, *_ = booking
+    assert get_admin_ids() == [admin.id]
+    with django_assert_num_queries(0):
+        assert get_admin_ids() == [admin.id]
+
+    other = User.objects.create(username='boss2')
+    other.groups.add(Group.objects.get(name='Admins'))
+    assert get_admin_ids() == [admin.id, other.id]
+    admin.delete()
+    assert get_admin_ids() == [other.id]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_pool_delivers_committed_bookings_in_one_batch(booking, monkeypatch):
+    admin, service, staff, client = booking
+    dispatcher = NotificationDispatcher(workers=2, coalesce_seconds=0.2)
+    monkeypatch.setattr(notifications, '_dispatcher', dispatcher)
+    batches = []
+    deliver = notifications.deliver_events
+    monkeypatch.setattr(notifications, 'deliver_events', lambda events: batches.append(len(events)) or
+                        deliver(events))
+
+    with transaction.atomic():
+        for hour in (9, 10, 11):
+            _book(service, staff, client, hour)
+    assert dispatcher.flush(timeout=10)
+    assert batches == [3]
+    assert Notification.objects.count() == 6
@@ -0,0 +1,90 @@
+import threading
+import pytest
+from datetime import date, time, timedelta
+
+from django.db import connection
+
+from appointment.core.api_helpers import create_appointment_safe
+from appointment.core.occupancy import SlotUnavailableError, rebuild_ledger, slot_bins
+from appointment.models import Appointment, Client, Service, SlotOccupancy, StaffMember, User
+
+DAY = date(2031, 3, 4)
+
+
+@pytest.fixture
+def booking(db):
+    staff = StaffMember.objects.create(user=User.objects.create(username="ledger"), slot_duration=15)
+    service = Service.objects.create(name="Ledger", duration=timedelta(minutes=30), price=10)
+    clients = [Client.objects.create(first_name=f"C{i}", last_name="L", phone_number=f"+3460000{i:04d}",
+                                     email=f"c{i}@example.com") for i in range(16)]
+    return staff, service, clients
+
+
+def test_slot_bins_widen_to_the_grid():
+    assert list(slot_bins(time(10, 0), time(10, 30))) == [120, 121, 122, 123, 124, 125]
+    assert list(slot_bins(time(10, 7), time(10, 11))) == [121, 122]
+    assert list(slot_bins(time(10, 0), time(10, 0))) == []
+
+
+def test_ledger_follows_create_update_and_delete(booking):
+    staff, service, clients = booking
+    appt = create_appointment_safe(clients[0], service, staff, DAY, time(10, 0), time(10, 30))
+    assert SlotOccupancy.objects.filter(appointment=appt).count() == 6
+
+    with pytest.raises(SlotUnavailableError):
+        create_appointment_safe(clients[1], service, staff, DAY, time(10, 15), time(10, 45))
+    with pytest.raises(SlotUnavailableError):
+        create_appointment_safe(clients[1], service, staff, DAY, time(10, 0), time(10, 30))
+    assert Appointment.objects.count() == 1
+
+    appt.start_time, appt.end_time = time(11, 0), time(11, 30)
+    appt.save()
+    assert set(SlotOccupancy.objects.values_list('bin', flat=True)) == set(slot_bins(time(11, 0), time(11, 30)))
+    create_appointment_safe(clients[1], service, staff, DAY, time(10, 0), time(10, 30))
+
+    appt.delete()
+    assert SlotOccupancy.objects.count() == 6
+
+    Appointment.objects.bulk_create([Appointment(client=clients[2], service=service, staff_member=staff, date=DAY,
+                                                 start_time=time(12, 0), end_time=time(12, 30))])
+    assert rebuild_ledger() == 12
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_bookings_have_exactly_one_winner_per_slot(booking):
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        pytest.skip("in-memory SQLite rejects concurrent writers instead of queueing them")
+    staff, service, clients = booking
+    starts = [time(9, 0), time(9, 30), time(10, 0)]
+    barrier = threading.Barrier(len(clients))
+    outcomes = []
+
+    def book(client, start):
+        try:
+            barrier.wait()
+            end = (datetime_on(start) + service.duration).time()
+            create_appointment_safe(client, service, staff, DAY, start, end)
+            outcomes.append(('won', start))
+        except SlotUnavailableError:
+            outcomes.append(('lost', start))
+        except Exception as e:  # pragma: no cover - reported by the assertion below
+            outcomes.append((repr(e), start))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=book, args=(client, starts[i % len(starts)])) for i, client in
+               enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {outcome for outcome, _ in outcomes} <= {'won', 'lost'}, outcomes
+    assert sorted(start for outcome, start in outcomes if outcome == 'won') == starts
+    assert Appointment.objects.count() == len(starts)
+    assert SlotOccupancy.objects.count() == len(starts) * 6
+
+
+def datetime_on(t):
+    from datetime import datetime
+    return datetime.combine(DAY, t)
@@ -0,0 +1,71 @@
+import pytest
+from datetime import date, datetime, time, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from appointment.core.reassignment import NO_FREE_STAFF, NO_QUALIFIED_STAFF, plan_reassignment, reassign_day_off
+from appointment.models import Appointment, Client, DayOff, Service, SlotOccupancy, StaffMember, User, WorkingHours
+
+DAY = date(2031, 3, 4)
+NOW = datetime(2031, 3, 1, 8)
+
+
+@pytest.fixture
+def clinic(db):
+    service = Service.objects.create(name="Cleaning", duration=timedelta(minutes=30), price=30)
+    other_service = Service.objects.create(name="Surgery", duration=timedelta(minutes=30), price=300)
+    staffs = []
+    for i in range(4):
+        staff = StaffMember.objects.create(user=User.objects.create(username=f"dentist{i}"), slot_duration=15)
+        for offset in range(2):
+            WorkingHours.objects.create(staff_member=staff, day_of_week=(DAY + timedelta(days=offset)).weekday(),
+                                        start_time=time(9), end_time=time(17))
+        staffs.append(staff)
+    for staff in staffs[:3]:
+        staff.services_offered.add(service)
+    staffs[0].services_offered.add(other_service)
+    client = Client.objects.create(first_name="Jane", last_name="Doe", phone_number="+34123456782",
+                                   email="jane@example.com")
+    return service, other_service, staffs, client
+
+
+def _book(client, service, staff, day, hour, minute=0):
+    start = datetime.combine(day, time(hour, minute))
+    return Appointment.objects.create(client=client, service=service, staff_member=staff, date=day,
+                                      start_time=start.time(), end_time=(start + service.duration).time())
+
+
+def test_plan_spreads_appointments_over_free_qualified_staff(clinic):
+    service, other_service, staffs, client = clinic
+    absent, first, second, unqualified = staffs
+    moved = [_book(client, service, absent, DAY, hour) for hour in (9, 10, 11)]
+    surgery = _book(client, other_service, absent, DAY, 12)
+    _book(client, service, first, DAY, 10)
+    _book(client, service, second, DAY, 10)
+    _book(client, service, absent, DAY - timedelta(days=1), 10)  # outside the day off
+
+    with CaptureQueriesContext(connection) as ctx:
+        plan = plan_reassignment(absent, DAY, DAY + timedelta(days=1), now=NOW)
+    assert len(ctx.captured_queries) <= 7
+
+    assert [(appt.id, staff.id) for appt, staff in plan.assignments] == [
+        (moved[0].id, first.id), (moved[2].id, second.id)]
+    assert [(appt.id, reason) for appt, reason in plan.unassigned] == [
+        (moved[1].id, NO_FREE_STAFF), (surgery.id, NO_QUALIFIED_STAFF)]
+    assert unqualified.id not in {staff.id for _, staff in plan.assignments}
+
+
+def test_candidates_on_day_off_are_skipped_and_apply_writes_ledger(clinic):
+    service, _, staffs, client = clinic
+    absent, first, second, _ = staffs
+    DayOff.objects.create(staff_member=first, start_date=DAY, end_date=DAY)
+    appointments = [_book(client, service, absent, DAY, 9, minute) for minute in (0, 30)]
+
+    plan = reassign_day_off(absent, DAY, DAY, apply=True, now=NOW)
+
+    assert plan.applied and not plan.unassigned
+    for appt in appointments:
+        appt.refresh_from_db()
+        assert appt.staff_member_id == second.id
+    assert set(SlotOccupancy.objects.values_list('staff_member_id', flat=True)) == {second.id}
@@ -0,0 +1,59 @@
+import pytest
+from datetime import date, time, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from appointment.core.availability import DAY_OFF, OVERLAPS_APPOINTMENT
+from appointment.core.recurrence import book_series, expand_occurrences
+from appointment.models import Appointment, Client, DayOff, Service, SlotOccupancy, StaffMember, User, WorkingHours
+
+START = date(2031, 3, 4)  # a Tuesday
+
+
+@pytest.fixture
+def clinic(db):
+    service = Service.objects.create(name="Physio", duration=timedelta(minutes=45), price=40)
+    staff = StaffMember.objects.create(user=User.objects.create(username="physio"), slot_duration=15)
+    WorkingHours.objects.create(staff_member=staff, day_of_week=START.weekday(), start_time=time(9),
+                                end_time=time(17))
+    client = Client.objects.create(first_name="Jane", last_name="Doe", phone_number="+34123456783",
+                                   email="jane@example.com")
+    return service, staff, client
+
+
+def test_expand_occurrences_is_bounded():
+    assert len(expand_occurrences("FREQ=WEEKLY;COUNT=20", START, time(10))) == 20
+    assert expand_occurrences("RRULE:FREQ=DAILY", START, time(10), until=START + timedelta(days=2)) == [
+        START, START + timedelta(days=1), START + timedelta(days=2)]
+    assert len(expand_occurrences("FREQ=DAILY", START, time(10))) == 104
+    with pytest.raises(ValueError):
+        expand_occurrences("FREQ=SOMETIMES", START, time(10))
+
+
+def test_weekly_series_books_free_weeks_and_reports_conflicts(clinic):
+    service, staff, client = clinic
+    day_off = START + timedelta(weeks=5)
+    taken = START + timedelta(weeks=12)
+    DayOff.objects.create(staff_member=staff, start_date=day_off, end_date=day_off)
+    Appointment.objects.create(client=client, service=service, staff_member=staff, date=taken,
+                               start_time=time(10, 30), end_time=time(11))
+
+    with CaptureQueriesContext(connection) as ctx:
+        series, created, plan = book_series(client, service, staff, "FREQ=WEEKLY;COUNT=20", START, time(10))
+
+    assert len(created) == 18
+    assert plan.conflicts == [(day_off, DAY_OFF), (taken, OVERLAPS_APPOINTMENT)]
+    assert Appointment.objects.filter(series=series).count() == 18
+    assert SlotOccupancy.objects.filter(appointment__series=series).count() == 18 * 9
+    # Planning and writing do not grow with the number of occurrences.
+    assert len(ctx.captured_queries) <= 12
+
+
+def test_dry_run_writes_nothing(clinic):
+    service, staff, client = clinic
+    series, created, plan = book_series(client, service, staff, "FREQ=WEEKLY;COUNT=4", START, time(16, 30),
+                                        dry_run=True)
+    assert series is None and created == []
+    assert len(plan.conflicts) == 4
+    assert not Appointment.objects.exists()
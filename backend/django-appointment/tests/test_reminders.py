@@ -0,0 +1,147 @@
+import json
+import pytest
+from datetime import date, datetime, time, timedelta
+
+from django.core import mail
+from django.utils import timezone
+
+from appointment.chatbot_api.views.appointments import appointment as api_appointment
+from appointment.core.db_helpers import update_appointment_reminder
+from appointment.core.email_outbox import send_pending_emails
+from appointment.core.occupancy import SlotUnavailableError, slot_bins
+from appointment.core import reminders
+from appointment.core.reminders import ReminderScheduler, claim_due_reminders, send_reminder_emails, set_reminder
+from appointment.models import Appointment, Client, Service, SlotOccupancy, StaffMember, Task, User, WorkingHours
+
+DAY = date(2031, 3, 4)
+
+
+def at(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+@pytest.fixture
+def clinic(db):
+    service = Service.objects.create(name="Massage", duration=timedelta(minutes=30), price=40)
+    staff = StaffMember.objects.create(user=User.objects.create(username='therapist', first_name='Ana'))
+    client = Client.objects.create(first_name="Jane", last_name="Doe", phone_number="+34123456791",
+                                   email="jane@example.com")
+    return service, staff, client
+
+
+def _book(clinic, day, hour, want_reminder=True):
+    service, staff, client = clinic
+    return Appointment.objects.create(client=client, service=service, staff_member=staff, date=day,
+                                      start_time=time(hour), end_time=time(hour, 30), want_reminder=want_reminder)
+
+
+def test_due_time_follows_the_appointment(clinic):
+    appt = _book(clinic, DAY, 10)
+    assert appt.reminder_at == at(DAY, 10) - timedelta(days=1)
+    assert _book(clinic, DAY, 11, want_reminder=False).reminder_at is None
+
+    # Rescheduling is a column update.
+    appt.date, appt.start_time = DAY + timedelta(days=2), time(9)
+    appt.save(update_fields=['date', 'start_time'])
+    assert Appointment.objects.get(pk=appt.pk).reminder_at == at(DAY + timedelta(days=1), 9)
+    set_reminder(appt, False)
+    assert Appointment.objects.get(pk=appt.pk).reminder_at is None
+
+
+def test_scheduler_claims_due_reminders_in_batches(clinic, django_assert_max_num_queries):
+    due = [_book(clinic, DAY, hour) for hour in (9, 10, 11)]
+    for offset in range(1, 200):
+        _book(clinic, DAY + timedelta(days=offset // 10 + 2), 8 + offset % 10)
+    started = _book(clinic, DAY - timedelta(days=1), 9)
+    now = at(DAY, 8) - timedelta(hours=20)
+
+    scheduler = ReminderScheduler(batch_size=2)
+    # One range query, the claim updates and the task insert (plus savepoints), whatever the number of upcoming
+    # appointments. The appointment that already started comes first and is dropped.
+    with django_assert_max_num_queries(8):
+        assert scheduler.tick(now) == 1
+    assert scheduler.tick(now) == 2
+    assert scheduler.tick(now) == 0
+
+    tasks = list(Task.objects.order_by('id'))
+    assert [task.name for task in tasks] == ['appointment.core.reminders.send_reminder_emails'] * 2
+    assert [task.args for task in tasks] == [[[due[0].id]], [[due[1].id, due[2].id]]]
+    assert not Appointment.objects.filter(pk__in=[a.pk for a in due], reminder_at__isnull=False).exists()
+    assert Appointment.objects.get(pk=started.pk).reminder_at is None
+    assert Appointment.objects.get(pk=started.pk).reminder_sent_at is None
+
+    # A reminded appointment moved later is reminded again; moved earlier, it is not.
+    later, earlier = Appointment.objects.get(pk=due[0].pk), Appointment.objects.get(pk=due[1].pk)
+    later.date = DAY + timedelta(days=30)
+    later.save()
+    earlier.start_time, earlier.end_time = time(8), time(8, 30)
+    earlier.save()
+    assert later.reminder_at == at(DAY + timedelta(days=29), 9) and earlier.reminder_at is None
+
+
+
+def test_scheduler_does_not_spin_on_rows_locked_by_another_one(clinic, monkeypatch):
+    _book(clinic, DAY, 10)
+    now = at(DAY, 10) - timedelta(hours=2)
+    monkeypatch.setattr(timezone, 'now', lambda: now)
+    # Another scheduler holds the due rows: every pass skips them.
+    monkeypatch.setattr(reminders, '_process_due_reminders', lambda limit, now=None: ([], 0))
+    scheduler = ReminderScheduler(poll_interval=0.5)
+    waits = []
+
+    def wait(seconds):
+        waits.append(seconds)
+        if len(waits) == 3:
+            scheduler.stop()
+    monkeypatch.setattr(scheduler._stopped, 'wait', wait)
+    assert scheduler.run() == 0
+    assert waits == [0.5] * 3
+
+def test_stale_due_times_are_rescheduled(clinic):
+    appt = _book(clinic, DAY, 10)
+    Appointment.objects.filter(pk=appt.pk).update(date=DAY + timedelta(days=5))
+    assert claim_due_reminders(now=at(DAY, 9)) == []
+    assert Appointment.objects.get(pk=appt.pk).reminder_at == at(DAY + timedelta(days=4), 10)
+
+
+def test_reminder_emails_go_through_the_outbox_once(clinic):
+    appointments = [_book(clinic, DAY, hour) for hour in (9, 10)]
+    assert send_reminder_emails([a.id for a in appointments]) == 2
+    # A retried task does not queue them again.
+    assert send_reminder_emails([a.id for a in appointments]) == 0
+
+    assert send_pending_emails() == 2
+    assert [m.to for m in mail.outbox] == [["jane@example.com"]] * 2
+    assert "09:00" in mail.outbox[0].alternatives[0][0] and "Ana" in mail.outbox[0].body
+
+
+def test_moving_an_appointment_moves_its_end_slots_and_reminder(clinic):
+    service, staff, client = clinic
+    appt = _book(clinic, DAY, 10)
+    update_appointment_reminder(appt, DAY + timedelta(days=1), time(15))
+    appt.refresh_from_db()
+    assert (appt.start_time, appt.end_time) == (time(15), time(15, 30))
+    assert appt.reminder_at == at(DAY + timedelta(days=1), 15) - timedelta(days=1)
+    assert set(SlotOccupancy.objects.filter(appointment=appt).values_list('date', 'bin')) == \
+        {(DAY + timedelta(days=1), b) for b in slot_bins(time(15), time(15, 30))}
+
+    # The slot it left is bookable again, the one it took is not.
+    _book(clinic, DAY, 10)
+    with pytest.raises(SlotUnavailableError):
+        Appointment.objects.create(client=client, service=service, staff_member=staff, date=DAY + timedelta(days=1),
+                                   start_time=time(14, 45), end_time=time(15, 15))
+    with pytest.raises(ValueError):
+        update_appointment_reminder(appt, DAY, time(23, 45))
+
+
+def test_chatbot_bookings_parse_the_reminder_flag(clinic, rf):
+    service, staff, client = clinic
+    staff.services_offered.add(service)
+    WorkingHours.objects.create(staff_member=staff, day_of_week=DAY.weekday(), start_time=time(9), end_time=time(18))
+    for hour, flag in [(9, "false"), (10, "0"), (11, False), (12, "true"), (13, 1), (14, True)]:
+        response = api_appointment(rf.post("/v1/chatbot/appointment/", json.dumps({
+            "client_phone": str(client.phone_number), "service_name": service.name, "date": str(DAY),
+            "start_time": f"{hour}:00", "want_reminder": flag,
+        }), content_type="application/json"))
+        assert response.status_code == 200
+    assert [a.want_reminder for a in Appointment.objects.order_by('start_time')] == [False] * 3 + [True] * 3
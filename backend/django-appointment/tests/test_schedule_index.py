@@ -0,0 +1,83 @@
+import pytest
+from datetime import date, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+
+from appointment.core import schedule_index
+from appointment.core.api_helpers import get_available_slots_for_service
+from appointment.core.availability import to_dt
+from appointment.core.db_helpers import (
+    check_day_off_for_staff, day_off_exists_for_date_range, get_working_hours_for_staff_and_day, is_working_day
+)
+from appointment.models import DayOff, Service, StaffMember, User, WorkingHours
+
+
+@pytest.fixture
+def staff(transactional_db):
+    staff = StaffMember.objects.create(user=User.objects.create(username="index"))
+    WorkingHours.objects.create(staff_member=staff, day_of_week=1, start_time=time(9), end_time=time(17))
+    DayOff.objects.create(staff_member=staff, start_date=date(2031, 3, 3), end_date=date(2031, 3, 7))
+    DayOff.objects.create(staff_member=staff, start_date=date(2031, 3, 6), end_date=date(2031, 3, 10))
+    return staff
+
+
+def test_lookups_are_served_from_memory(staff, django_assert_num_queries):
+    get_working_hours_for_staff_and_day(staff, 1)
+    with django_assert_num_queries(0):
+        assert check_day_off_for_staff(staff, date(2031, 3, 9))
+        assert not check_day_off_for_staff(staff, date(2031, 3, 11))
+        assert day_off_exists_for_date_range(staff, date(2031, 2, 1), date(2031, 3, 3))
+        assert not day_off_exists_for_date_range(staff, date(2031, 3, 11), date(2031, 4, 1))
+        assert is_working_day(staff, 1) and not is_working_day(staff, 2)
+        assert get_working_hours_for_staff_and_day(staff, 1)['end_time'] == time(17)
+
+    first, second = DayOff.objects.order_by('id')
+    assert day_off_exists_for_date_range(staff, date(2031, 3, 8), date(2031, 3, 8), days_off_id=first.id)
+    assert not day_off_exists_for_date_range(staff, date(2031, 3, 8), date(2031, 3, 8), days_off_id=second.id)
+
+
+def test_index_follows_signals_and_other_processes(staff, monkeypatch):
+    assert not check_day_off_for_staff(staff, date(2031, 4, 1))
+    DayOff.objects.create(staff_member=staff, start_date=date(2031, 4, 1), end_date=date(2031, 4, 1))
+    assert check_day_off_for_staff(staff, date(2031, 4, 1))
+
+    # Simulate another worker: the row changes and the shared version is bumped, the local index is untouched.
+    WorkingHours.objects.filter(staff_member=staff).update(end_time=time(12))
+    cache.incr('schedule_index:version')
+    assert get_working_hours_for_staff_and_day(staff, 1)['end_time'] == time(17)
+
+    monkeypatch.setattr(schedule_index, 'APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL', 0)
+    assert get_working_hours_for_staff_and_day(staff, 1)['end_time'] == time(12)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_hours_set_through_the_view_are_available(client):
+    day = date(2031, 3, 4)
+    service = Service.objects.create(name="Massage", duration=timedelta(minutes=30), price=40)
+    staff = StaffMember.objects.create(user=User.objects.create(username="new_timetable"), slot_duration=30)
+    assert get_available_slots_for_service(staff, day, service) == []
+    assert schedule_index.get_schedule_index().hours_for(staff.id, day.weekday()) is None
+
+    client.force_login(staff.user)
+    response = client.post(f"/v1/api/working_hours/staff/{staff.id}/", content_type="application/json",
+                           data=[{"day_of_week": day.weekday(), "start_time": "09:00", "end_time": "10:00"}])
+    assert response.status_code == 201
+    assert schedule_index.get_schedule_index().hours_for(staff.id, day.weekday()) is not None
+    assert get_available_slots_for_service(staff, day, service) == [to_dt(day, time(9)), to_dt(day, time(9, 30))]
+
+
+def test_index_built_in_a_transaction_is_kept_until_it_ends(staff, monkeypatch, django_assert_num_queries):
+    monkeypatch.setattr(schedule_index, 'APPOINTMENT_SCHEDULE_INDEX_CHECK_INTERVAL', 0)
+    with transaction.atomic():
+        DayOff.objects.create(staff_member=staff, start_date=date(2031, 4, 1), end_date=date(2031, 4, 1))
+        assert check_day_off_for_staff(staff, date(2031, 4, 1))
+        with django_assert_num_queries(0):
+            for _ in range(3):
+                assert check_day_off_for_staff(staff, date(2031, 4, 1))
+        transaction.set_rollback(True)
+
+    # The rolled back day off is seen neither by the next transaction nor by the process.
+    with transaction.atomic():
+        assert not check_day_off_for_staff(staff, date(2031, 4, 1))
+    assert not check_day_off_for_staff(staff, date(2031, 4, 1))
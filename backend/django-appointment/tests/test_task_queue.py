@@ -0,0 +1,123 @@
+import os
+import time
+import pytest
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from appointment.core import task_queue
+from appointment.core.task_queue import Worker, claim_tasks, enqueue, retry_delay, task_stats
+from appointment.models import Task
+
+CALLS = []
+
+
+def record(value, scale=1):
+    CALLS.append(value * scale)
+
+
+def flaky(key):
+    if key not in CALLS:
+        CALLS.append(key)
+        raise RuntimeError(f"first attempt of {key} fails")
+
+
+def broken():
+    raise ValueError("always fails")
+
+
+def slow(value):
+    time.sleep(1)
+    CALLS.append(value)
+
+
+def write_pid(path):
+    with open(path, 'a') as f:
+        f.write(f"{os.getpid()}\n")
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    CALLS.clear()
+    yield
+    CALLS.clear()
+
+
+@pytest.mark.django_db
+def test_due_tasks_run_once_in_order_and_are_not_claimed_twice():
+    later = enqueue(record, 99, delay=timedelta(hours=1))
+    tasks = [enqueue('tests.test_task_queue.record', i, scale=10) for i in range(5)]
+
+    claimed = claim_tasks('first', limit=2)
+    assert [task.pk for task in claimed] == [tasks[0].pk, tasks[1].pk]
+    assert [task.pk for task in claim_tasks('second', limit=10)] == [task.pk for task in tasks[2:]]
+    assert claim_tasks('third', limit=10) == []
+    Task.objects.filter(status='running').update(status='pending', locked_by='', attempts=0)
+
+    assert Worker(concurrency=3, batch_size=2, poll_interval=0.01).run(once=True) == 5
+    assert sorted(CALLS) == [0, 10, 20, 30, 40]
+    assert list(Task.objects.filter(pk__in=[t.pk for t in tasks]).values_list('status', flat=True)) == ['done'] * 5
+    assert Task.objects.get(pk=later.pk).status == 'pending'
+
+
+@pytest.mark.django_db
+def test_failed_attempts_are_retried_with_backoff_then_fail():
+    retried = enqueue(flaky, 'a')
+    failing = enqueue(broken, max_attempts=2)
+    worker = Worker(concurrency=2, poll_interval=0.01)
+
+    before = timezone.now()
+    assert worker.run(once=True) == 2
+    retried.refresh_from_db()
+    failing.refresh_from_db()
+    assert retried.status == failing.status == 'pending'
+    assert retried.attempts == 1 and 'first attempt of a fails' in retried.last_error
+    assert retried.run_at >= before + retry_delay(1)
+    assert retry_delay(2) == 2 * retry_delay(1)
+
+    # Nothing is due until the backoff has passed.
+    assert worker.run(once=True) == 0
+    Task.objects.update(run_at=timezone.now())
+    assert worker.run(once=True) == 2
+    retried.refresh_from_db()
+    failing.refresh_from_db()
+    assert (retried.status, retried.attempts, retried.last_error) == ('done', 2, '')
+    assert (failing.status, failing.attempts) == ('failed', 2) and 'always fails' in failing.last_error
+
+    stats = {row['name']: row for row in task_stats()}
+    assert stats['tests.test_task_queue.flaky']['done'] == 1
+    assert stats['tests.test_task_queue.flaky']['retried'] == 1
+    assert stats['tests.test_task_queue.broken']['failed'] == 1
+
+
+@pytest.mark.django_db
+def test_stale_running_tasks_are_recovered():
+    yesterday = timezone.now() - timedelta(days=1)
+    task = enqueue(record, 1, run_at=yesterday)
+    assert claim_tasks('lost', limit=1, now=yesterday) == [task]
+    assert Worker(poll_interval=0.01).run(once=True) == 1
+    task.refresh_from_db()
+    assert task.status == 'done' and task.attempts == 2 and 'presumed lost' not in task.last_error
+    assert CALLS == [1]
+
+
+@pytest.mark.django_db
+def test_tasks_outliving_the_timeout_are_renewed_not_requeued(monkeypatch):
+    monkeypatch.setattr(task_queue, 'APPOINTMENT_TASK_TIMEOUT', 0.3)
+    task = enqueue(slow, 1)
+    assert Worker(poll_interval=0.02).run(once=True) == 1
+    task.refresh_from_db()
+    assert task.status == 'done' and task.attempts == 1
+    assert CALLS == [1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_command_runs_tasks_in_processes(tmp_path):
+    path = tmp_path / 'pids'
+    for _ in range(3):
+        enqueue(write_pid, str(path))
+    call_command('run_tasks', '--processes', '--concurrency=2', '--poll-interval=0.01', '--once', skip_checks=True)
+    pids = path.read_text().split()
+    assert len(pids) == 3 and str(os.getpid()) not in pids
+    assert Task.objects.filter(status='done').count() == 3
@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { Calendar, dayjsLocalizer, Views, View } from "react-big-calendar";
 import dayjs from "dayjs";
 import "react-big-calendar/lib/css/react-big-calendar.css";
@@ -12,7 +12,7 @@ import {
   AlertDialogCancel,
   AlertDialogAction,
 } from "@/components/ui/alert-dialog";
-import { useAppointments } from "@/hooks/useAppointment";
+import { useAppointments, AppointmentRange } from "@/hooks/useAppointment";
 import { useAuth } from "@/hooks/useAuth";
 
 
@@ -29,10 +29,34 @@ interface Appointment {
 interface StaffCalendarProps {
   appointments: Appointment[];
   initialView?: View;
+  onRangeChange?: (range: AppointmentRange) => void;
+  hasMore?: boolean;
+  loading?: boolean;
+  onLoadMore?: () => void;
 }
 
 const localizer = dayjsLocalizer(dayjs);
 
+// Same length as the agenda view of react-big-calendar
+const AGENDA_LENGTH_DAYS = 30;
+
+// Dates shown by a calendar view, so that only their appointments are fetched
+export function getVisibleRange(date: Date, view: View): AppointmentRange {
+  const day = dayjs(date);
+  let start = day.startOf("day");
+  let end = day.startOf("day");
+  if (view === Views.MONTH) {
+    start = day.startOf("month").startOf("week");
+    end = day.endOf("month").endOf("week");
+  } else if (view === Views.WEEK) {
+    start = day.startOf("week");
+    end = day.endOf("week");
+  } else if (view === Views.AGENDA) {
+    end = day.add(AGENDA_LENGTH_DAYS, "day");
+  }
+  return { start: start.format("YYYY-MM-DD"), end: end.format("YYYY-MM-DD") };
+}
+
 // Función para generar un color consistente a partir del nombre del staff
 function getColorFromString(str: string) {
   let hash = 0;
@@ -46,15 +70,29 @@ function getColorFromString(str: string) {
 export function StaffCalendar({
   appointments: initialAppointments,
   initialView = Views.MONTH,
+  onRangeChange,
+  hasMore = false,
+  loading = false,
+  onLoadMore,
 }: StaffCalendarProps) {
   const [appointments, setAppointments] = useState<Appointment[]>(initialAppointments);
   const [selectedEvent, setSelectedEvent] = useState<any>(null);
   const [view, setView] = useState<View>(initialView);
+  const [date, setDate] = useState<Date>(new Date());
   const [appointmentDelete, setAppointmentDelete] = useState<any>(null);
 
   const { deleteAppointment } = useAppointments();
   const { csrfToken,user } = useAuth();
 
+  // The parent fetches the appointments of the visible range, page by page
+  useEffect(() => {
+    setAppointments(initialAppointments);
+  }, [initialAppointments]);
+
+  useEffect(() => {
+    onRangeChange?.(getVisibleRange(date, view));
+  }, [date, view, onRangeChange]);
+
   // Convertimos citas a eventos del calendario
   const events = appointments
     .map((appt) => {
@@ -104,10 +142,25 @@ export function StaffCalendar({
         defaultView={initialView}
         view={view}
         onView={(v) => setView(v)}
+        date={date}
+        onNavigate={(d) => setDate(d)}
+        length={AGENDA_LENGTH_DAYS}
         views={[Views.MONTH, Views.WEEK, Views.DAY, Views.AGENDA]}
         onSelectEvent={(event) => setSelectedEvent(event)}
       />
 
+      {hasMore && (
+        <div className="absolute bottom-2 right-4">
+          <button
+            className="bg-gray-700 text-white px-3 py-1 rounded-md text-sm hover:bg-gray-800 transition disabled:opacity-50"
+            onClick={() => onLoadMore?.()}
+            disabled={loading}
+          >
+            {loading ? "Loading..." : "Load more appointments"}
+          </button>
+        </div>
+      )}
+
       {/* Modal de evento */}
       {selectedEvent && (
         <div className="fixed inset-0 bg-black bg-opacity-40 flex justify-center items-center z-50 animate-fadeIn">
@@ -5,7 +5,7 @@ import "react-form-wizard-component/dist/style.css";
 import { useClients } from "@/hooks/useClients";
 import { useServices } from "@/hooks/useServices";
 import { useStaffsByService } from "@/hooks/useStaffsByService";
-import { useAvailability } from "@/hooks/useAvailability";
+import { useAvailability, useMonthAvailability } from "@/hooks/useAvailability";
 import { useAppointments } from "@/hooks/useAppointment";
 import { useAuth } from "@/hooks/useAuth";
 
@@ -37,6 +37,7 @@ export default function AppointmentWizard({ onComplete }: AppointmentWizardProps
   const [staffId, setStaffId] = useState<number | null>(null);
   const [selectedDate, setSelectedDate] = useState<Date | null>(null);
   const [selectedTime, setSelectedTime] = useState<string | null>(null);
+  const [visibleMonth, setVisibleMonth] = useState<Date>(new Date());
   const [wizardKey, setWizardKey] = useState(0);
 
   const dayString = selectedDate ? formatDateLocal(selectedDate) : "";
@@ -50,6 +51,11 @@ export default function AppointmentWizard({ onComplete }: AppointmentWizardProps
     serviceId ?? null,
     dayString
   );
+  const { availableDays, loading: loadingMonth } = useMonthAvailability(
+    staffId ?? null,
+    serviceId ?? null,
+    formatDateLocal(visibleMonth).slice(0, 7)
+  );
   const { createAppointment } = useAppointments();
 
   const { toasts, toast: showToast, dismiss: dismissToast } = useToast();
@@ -177,6 +183,9 @@ export default function AppointmentWizard({ onComplete }: AppointmentWizardProps
                 setSelectedDate(new Date(date.getFullYear(), date.getMonth(), date.getDate()));
                 setSelectedTime(null);
               }}
+              month={visibleMonth}
+              onMonthChange={setVisibleMonth}
+              disabled={(date) => !loadingMonth && !availableDays.has(formatDateLocal(date))}
               className="rounded-md border shadow-md p-2"
             />
             <div>
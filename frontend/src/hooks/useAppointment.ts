@@ -1,31 +1,73 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 
-export function useAppointments() {
+// Inclusive date range, as YYYY-MM-DD
+export interface AppointmentRange {
+  start: string;
+  end: string;
+}
+
+// Pass the visible range to load its appointments; without a range nothing is fetched
+export function useAppointments(range?: AppointmentRange | null) {
   const [appointments, setAppointments] = useState([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
   const baseUrl = "http://localhost:8001/v1/api/appointments/";
-
-  // GET all appointments
-  const fetchAppointments = useCallback(async () => {
-    console.log("Called fetchAppointments");
-    try {
-      setLoading(true);
-      const res = await fetch(baseUrl, {
+  const start = range?.start;
+  const end = range?.end;
+  // Responses for a range the user already navigated away from are dropped
+  const rangeKey = useRef("");
+
+  const fetchPage = useCallback(
+    async (cursor: string | null) => {
+      const params = new URLSearchParams({ start_date: start!, end_date: end! });
+      if (cursor) params.set("cursor", cursor);
+      const res = await fetch(`${baseUrl}?${params}`, {
         method: "GET",
         credentials: "include",
       });
       if (!res.ok) throw new Error("Error fetching appointments");
-      const data = await res.json();
-      console.log("data recibida:", data);
+      return res.json();
+    },
+    [baseUrl, start, end]
+  );
+
+  // GET the first page of the range
+  const fetchAppointments = useCallback(async () => {
+    if (!start || !end) return;
+    const key = `${start}/${end}`;
+    rangeKey.current = key;
+    try {
+      setLoading(true);
+      setError(null);
+      const data = await fetchPage(null);
+      if (rangeKey.current !== key) return;
       setAppointments(data.appointments);
+      setNextCursor(data.next_cursor);
+    } catch (err: any) {
+      setError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  }, [fetchPage, start, end]);
+
+  // GET the following page, when the user asks for more (scroll, "load more")
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loading) return;
+    try {
+      setLoading(true);
+      const key = rangeKey.current;
+      const data = await fetchPage(nextCursor);
+      if (rangeKey.current !== key) return;
+      setAppointments((prev) => prev.concat(data.appointments));
+      setNextCursor(data.next_cursor);
     } catch (err: any) {
       setError(err.message);
     } finally {
       setLoading(false);
     }
-  }, [baseUrl]);
+  }, [fetchPage, nextCursor, loading]);
 
   useEffect(() => {
     fetchAppointments();
@@ -129,6 +171,8 @@ export function useAppointments() {
     appointments,
     loading,
     error,
+    hasMore: nextCursor !== null,
+    loadMore,
     fetchAppointments,
     createAppointment,
     updateAppointment,
@@ -39,3 +39,52 @@ export function useAvailability(
 
   return { slots, loading, error };
 }
+
+export function useMonthAvailability(
+  staffId: number | null,
+  serviceId: number | null,
+  month: string
+) {
+  const [availableDays, setAvailableDays] = useState<Set<string>>(new Set());
+  const [loading, setLoading] = useState(false);
+  const [error, setError] = useState<string | null>(null);
+
+  useEffect(() => {
+    if (!serviceId || !month) return;
+
+    setLoading(true);
+    setError(null);
+
+    const query = staffId ? `?staff_id=${staffId}` : "";
+    fetch(
+      `http://localhost:8001/v1/api/availability/month/${serviceId}/${month}/${query}`,
+      {
+        method: "GET",
+        headers: {
+          "Accept": "application/json",
+        },
+        credentials: "include",
+      }
+    )
+      .then(async (res) => {
+        if (!res.ok) {
+          const text = await res.text();
+          throw new Error(`HTTP ${res.status}: ${text}`);
+        }
+        return res.json();
+      })
+      .then((data) =>
+        setAvailableDays(
+          new Set(
+            (data.days || [])
+              .filter((d: { available: boolean }) => d.available)
+              .map((d: { date: string }) => d.date)
+          )
+        )
+      )
+      .catch((err) => setError(err.message))
+      .finally(() => setLoading(false));
+  }, [staffId, serviceId, month]);
+
+  return { availableDays, loading, error };
+}
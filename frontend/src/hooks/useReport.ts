@@ -1,11 +1,27 @@
 import { useState } from "react";
 
+const POLL_INTERVAL_MS = 1500;
+// PDFs are rendered by the backend task worker (manage.py run_tasks); give up if none picks the rendering up.
+const POLL_TIMEOUT_MS = 2 * 60 * 1000;
+
+interface HistoryPdfStatus {
+  client_id: number;
+  status: "pending" | "ready" | "failed";
+  status_url: string;
+  download_url: string;
+  error?: string;
+}
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
 export function useReport() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
 
   /**
    * exportMedicalHistory
+   * El backend responde 202 mientras el PDF se genera: se consulta status_url hasta que está listo
+   * y entonces se descarga desde download_url.
    * @param patientId ID del paciente/cliente
    */
   const exportMedicalHistory = async (patientId: number) => {
@@ -13,12 +29,32 @@ export function useReport() {
     setError(null);
 
     try {
-      const res = await fetch(`http://localhost:8001/v1/api/export-history/${patientId}/`, {
+      let res = await fetch(`http://localhost:8001/v1/api/export-history/${patientId}/`, {
         method: "GET",
         credentials: "include", // 🔹 envía cookies de sesión
       });
 
-      if (!res.ok) {
+      if (res.status === 202) {
+        let status: HistoryPdfStatus = await res.json();
+        const deadline = Date.now() + POLL_TIMEOUT_MS;
+        while (status.status === "pending") {
+          if (Date.now() > deadline) {
+            throw new Error("The PDF is taking too long to be generated, try again later");
+          }
+          await sleep(POLL_INTERVAL_MS);
+          const statusRes = await fetch(status.status_url, { credentials: "include" });
+          if (!statusRes.ok) {
+            throw new Error(`Error fetching PDF status: ${statusRes.statusText}`);
+          }
+          status = await statusRes.json();
+        }
+        if (status.status === "failed") {
+          throw new Error(`The PDF could not be generated${status.error ? `: ${status.error}` : ""}`);
+        }
+        res = await fetch(status.download_url, { credentials: "include" });
+      }
+
+      if (res.status !== 200) {
         throw new Error(`Error fetching PDF: ${res.statusText}`);
       }
 
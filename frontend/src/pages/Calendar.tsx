@@ -1,10 +1,10 @@
-import { useAppointments } from "@/hooks/useAppointment";
-import { StaffCalendar } from "@/components/StaffCalendar";
+import { useState } from "react";
+import { useAppointments, AppointmentRange } from "@/hooks/useAppointment";
+import { StaffCalendar, getVisibleRange } from "@/components/StaffCalendar";
 import { Views } from "react-big-calendar";
 import { useLocation } from "react-router-dom";
 
 export default function CalendarPage() {
-  const { appointments, loading, error } = useAppointments();
   const location = useLocation();
 
   // Leer query param "view" (ej: /calendar?view=day)
@@ -25,13 +25,24 @@ export default function CalendarPage() {
     }
   })();
 
-  if (loading) return <div>Cargando citas...</div>;
+  // Only the appointments of the visible dates are requested, one page at a time
+  const [range, setRange] = useState<AppointmentRange>(() => getVisibleRange(new Date(), initialView));
+  const { appointments, loading, error, hasMore, loadMore } = useAppointments(range);
+
   if (error) return <div>Error: {error}</div>;
 
   return (
     <div className="p-6 bg-gray-50 min-h-screen">
       <h1 className="text-2xl font-bold mb-4">Appointments</h1>
-      <StaffCalendar appointments={appointments} initialView={initialView} />
+      {loading && appointments.length === 0 && <div>Cargando citas...</div>}
+      <StaffCalendar
+        appointments={appointments}
+        initialView={initialView}
+        onRangeChange={setRange}
+        hasMore={hasMore}
+        loading={loading}
+        onLoadMore={loadMore}
+      />
     </div>
   );
 }
@@ -71,7 +71,7 @@ const formatGender = (gender?: "M" | "F" | "O") => {
 
 /* ------------------ COMPONENT ------------------ */
 export default function Customers() {
-  const { exportMedicalHistory } = useReport();
+  const { exportMedicalHistory, loading: reportLoading, error: reportError } = useReport();
   const { csrfToken, isAuthenticated, user } = useAuth();
   const { clients, createClient, updateClient, getClientById,deleteClient, error, loading } = useClients(csrfToken);
 
@@ -169,6 +169,8 @@ export default function Customers() {
         <CardHeader>
           <CardTitle>Client List</CardTitle>
           <CardDescription>{filteredClients.length} client{filteredClients.length !== 1 ? "s" : ""}</CardDescription>
+          {reportLoading && <p className="text-sm text-muted-foreground">Generating medical history PDF...</p>}
+          {reportError && <p className="text-sm text-red-500">Error exporting medical history: {reportError}</p>}
         </CardHeader>
         <CardContent>
           {filteredClients.length === 0 ? (
@@ -201,7 +203,7 @@ export default function Customers() {
                             </Button>
                           </DropdownMenuTrigger>
                           <DropdownMenuContent align="end">
-                            <DropdownMenuItem onClick={() => exportMedicalHistory(client.id!)}>
+                            <DropdownMenuItem disabled={reportLoading} onClick={() => exportMedicalHistory(client.id!)}>
                               <FileText className="mr-2 h-4 w-4 text-primary" /> Export Medical History
                             </DropdownMenuItem>
                             <DropdownMenuItem onClick={() => openViewClient(client.id!)}>